@@ -3,18 +3,26 @@
 import os
 import sys
 import json
-import sqlite3
+import queue
+import asyncio
+import argparse
+from array import array
 import requests
+import http.client
 import urllib.request
 import urllib.parse
-import getpass
-import xml.etree.ElementTree as ET
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 import dotenv
-from contextlib import closing
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
-from utils import team_name_mapping_sl
+from betfair_session import DEFAULT_CACHE_PATH, SessionManager
+from betfair_transport import RecordingTransport, ReplayTransport
+from fixture_resolver import FixtureResolver
+from db import connect
+from migrations import ODDS_MIGRATIONS, migrate
+from request_scheduler import RequestScheduler, RetryableError, parse_retry_after
 
 # Add parent directory to path for virtual environment
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -22,25 +30,167 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # Load environment variables
 dotenv.load_dotenv()
 
+# Betfair caps each listMarketBook request at 200 "data weight" points, where
+# every requested market costs the weight of its price projection. See
+# https://docs.developer.betfair.com/display/1smk3cen4v3lu3yomq5qye0ni/Market+Data+Request+Limits
+MAX_DATA_WEIGHT = 200
+MIN_MARKET_BOOK_WEIGHT = 2
+PRICE_PROJECTION_WEIGHTS = {
+    "SP_AVAILABLE": 3,
+    "SP_TRADED": 7,
+    "EX_BEST_OFFERS": 5,
+    "EX_ALL_OFFERS": 17,
+    "EX_TRADED": 17,
+}
+
+# Best prices only, and the full ladders plus traded volume for depth capture
+# (EX_ALL_OFFERS also fills in the best prices, so it replaces EX_BEST_OFFERS)
+BEST_OFFERS_PRICE_DATA = ["EX_BEST_OFFERS"]
+DEPTH_PRICE_DATA = ["EX_ALL_OFFERS", "EX_TRADED"]
+
+# listMarketCatalogue allows up to 1000 results, but MARKET_DESCRIPTION
+# weighs 1 point per market, so 200 markets is the most one call can return.
+CATALOGUE_MAX_RESULTS = 200
+MATCH_ODDS_MARKET_PROJECTION = [
+    "COMPETITION",
+    "EVENT",
+    "EVENT_TYPE",
+    "MARKET_DESCRIPTION",
+    "RUNNER_DESCRIPTION",
+]
+
+# Request budget in data weight points: a sustained five full-weight
+# listMarketBook calls per second, with bursts of up to ten
+BETFAIR_WEIGHT_PER_SECOND = 5 * MAX_DATA_WEIGHT
+BETFAIR_WEIGHT_BURST = 10 * MAX_DATA_WEIGHT
+
+# X-Application sent when a transport is supplied and BETFAIR_API_KEY is unset
+PLACEHOLDER_APP_KEY = "eplpal-offline"
+
+
+class ConnectionPool:
+    """Thread-safe pool of keep-alive HTTP(S) connections to a single host"""
+
+    def __init__(self, url: str, maxsize: int = 10, timeout: int = 30):
+        parsed = urllib.parse.urlsplit(url)
+        self.scheme = parsed.scheme
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.path = parsed.path or "/"
+        self.timeout = timeout
+        self.maxsize = maxsize
+        self._idle = queue.LifoQueue(maxsize)
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(
+                self.host, self.port, timeout=self.timeout
+            )
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _get(self) -> http.client.HTTPConnection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._new_connection()
+
+    def _put(self, conn: http.client.HTTPConnection):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def post(
+        self, body: bytes, headers: Dict[str, str]
+    ) -> tuple[int, bytes, http.client.HTTPMessage]:
+        """POST to the pool's URL, returning the status code, body and headers"""
+        for attempt in range(2):
+            conn = self._get()
+            try:
+                conn.request("POST", self.path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (
+                http.client.RemoteDisconnected,
+                ConnectionResetError,
+                BrokenPipeError,
+            ):
+                # The server closed an idle keep-alive connection; retry once on
+                # a fresh one
+                conn.close()
+                if attempt:
+                    raise
+                continue
+            except Exception:
+                conn.close()
+                raise
+
+            if response.will_close:
+                conn.close()
+            else:
+                self._put(conn)
+            return response.status, data, response.headers
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
 
 class BetfairClient:
     """Betfair API client for retrieving match odds data"""
 
-    def __init__(self, timeout: int = 30):
-        self.base_url = "https://api.betfair.com/exchange/betting/json-rpc/v1"
+    def __init__(
+        self,
+        timeout: int = 30,
+        base_url: str = None,
+        session_token: str = None,
+        pool_size: int = 10,
+        scheduler: RequestScheduler = None,
+        session_cache_path: str = DEFAULT_CACHE_PATH,
+        transport=None,
+    ):
+        self.base_url = (
+            base_url or "https://api.betfair.com/exchange/betting/json-rpc/v1"
+        )
         self.timeout = timeout
-        self.api_key = os.getenv("BETFAIR_API_KEY")
-        self.session_token = self.authenticate()
-
+        self.scheduler = scheduler or RequestScheduler(
+            "Betfair", rate=BETFAIR_WEIGHT_PER_SECOND, capacity=BETFAIR_WEIGHT_BURST
+        )
+        # A supplied transport (replay, or a local stub) doesn't check the app key
+        self.api_key = os.getenv("BETFAIR_API_KEY") or (
+            PLACEHOLDER_APP_KEY if transport else None
+        )
         if not self.api_key:
             raise ValueError("Missing BETFAIR_API_KEY in environment")
 
+        # A token given explicitly is used as-is rather than cached for other processes
+        self.sessions = SessionManager(
+            self.authenticate,
+            self.api_key,
+            cache_path=None if session_token else session_cache_path,
+            session_token=session_token,
+            timeout=timeout,
+        )
+        self.session_token = self.sessions.token()
+        # Anything with ConnectionPool's post()/close(), e.g. betfair_transport's
+        self.pool = transport or ConnectionPool(
+            self.base_url, maxsize=pool_size, timeout=timeout
+        )
+
         self.headers = {
             "Content-Type": "application/json",
             "X-Application": self.api_key,
             "X-Authentication": self.session_token,
         }
 
+    def refresh_session(self):
+        """Log in again and use the new session token for subsequent requests"""
+        self.session_token = self.sessions.invalidate(self.session_token)
+        self.headers["X-Authentication"] = self.session_token
+
     def authenticate(self) -> str:
         """Authenticate with Betfair and get a session token"""
         login_url = "https://identitysso.betfair.com/api/login"
@@ -80,41 +230,71 @@ class BetfairClient:
     def _make_request(
         self, method: str, params: Dict[str, Any] = None
     ) -> Dict[str, Any]:
-        """Make a JSON-RPC request to the Betfair API"""
+        """Make a JSON-RPC request to the Betfair API
+
+        Requests are paced by the client's scheduler, which retries throttling
+        and transient network errors with backoff. If the session token has
+        expired, the client logs in again once and repeats the request.
+        """
         if params is None:
             params = {"filter": {}}
 
         json_rpc_data = {"jsonrpc": "2.0", "method": method, "params": params, "id": 1}
 
         json_data = json.dumps(json_rpc_data).encode("utf-8")
+        weight = request_weight(method, params)
 
-        request = urllib.request.Request(
-            url=self.base_url, data=json_data, headers=self.headers, method="POST"
-        )
-
+        # Extends the session with keepAlive when it has been idle a while
+        self.session_token = self.sessions.token()
+        self.headers["X-Authentication"] = self.session_token
+        try:
+            return self.scheduler.call(
+                self._post, json_data, self.headers, weight=weight
+            )
+        except Exception as e:
+            if "INVALID_SESSION_INFORMATION" not in str(
+                e
+            ) and "Invalid session" not in str(e):
+                raise
+        print("Session expired, logging in again...")
+        self.refresh_session()
+        return self.scheduler.call(self._post, json_data, self.headers, weight=weight)
+
+    def _post(self, json_data: bytes, headers: Dict[str, str]) -> Dict[str, Any]:
+        """Send one JSON-RPC request, raising RetryableError for transient failures"""
         try:
-            with urllib.request.urlopen(request, timeout=self.timeout) as response:
-                response_data = response.read().decode("utf-8")
-                json_response = json.loads(response_data)
+            status, body, response_headers = self.pool.post(json_data, headers)
+        except (http.client.HTTPException, OSError) as e:
+            raise RetryableError(f"Network error: {e}")
 
-                if "error" in json_response:
-                    raise Exception(f"API Error: {json_response['error']}")
+        response_data = body.decode("utf-8")
 
-                return json_response.get("result", [])
+        if status == 429 or status >= 500:
+            raise RetryableError(
+                f"HTTP {status}: {response_data}",
+                retry_after=parse_retry_after(response_headers.get("Retry-After")),
+            )
 
-        except urllib.error.HTTPError as e:
-            error_body = e.read().decode("utf-8")
-            print(f"Request failed with {e.code}: {error_body}")
-            if "INVALID_SESSION_INFORMATION" in error_body:
+        if status >= 400:
+            print(f"Request failed with {status}: {response_data}")
+            if "INVALID_SESSION_INFORMATION" in response_data:
                 raise Exception(
                     "Invalid session token. Please check your BETFAIR_SESSION_TOKEN in .env file."
                 )
-            raise Exception(f"HTTP {e.code}: {error_body}")
-        except urllib.error.URLError as e:
-            raise Exception(f"Network error: {e.reason}")
+            raise Exception(f"HTTP {status}: {response_data}")
+
+        try:
+            json_response = json.loads(response_data)
         except json.JSONDecodeError:
             raise Exception(f"Invalid JSON response: {response_data}")
 
+        if "error" in json_response:
+            if "TOO_MANY_REQUESTS" in str(json_response["error"]):
+                raise RetryableError(f"API Error: {json_response['error']}")
+            raise Exception(f"API Error: {json_response['error']}")
+
+        return json_response.get("result", [])
+
     def get_premier_league_id(self) -> str:
         """Get the competition ID for English Premier League"""
         params = {"filter": {"eventTypeIds": [1]}}  # Soccer
@@ -145,49 +325,167 @@ class BetfairClient:
 
     def get_match_odds(self, event_id: str) -> Optional[Dict[str, Any]]:
         """Get match odds for a specific event"""
-        # First get the market catalogue
-        market_params = {
-            "filter": {"eventIds": [event_id], "marketTypeCodes": ["MATCH_ODDS"]},
-            "maxResults": 1,
-            "marketProjection": [
-                "COMPETITION",
-                "EVENT",
-                "EVENT_TYPE",
-                "MARKET_DESCRIPTION",
-                "RUNNER_DESCRIPTION",
-            ],
-        }
+        return self.get_match_odds_bulk([event_id]).get(event_id)
+
+    def get_match_odds_catalogue(self, event_ids: List[str]) -> List[Dict[str, Any]]:
+        """Get the MATCH_ODDS market catalogue for many events at once"""
+        markets = []
+        for chunk in chunk_event_ids(event_ids):
+            markets.extend(
+                self._make_request(
+                    "SportsAPING/v1.0/listMarketCatalogue", catalogue_params(chunk)
+                )
+            )
 
-        markets = self._make_request(
-            "SportsAPING/v1.0/listMarketCatalogue", market_params
-        )
+        return markets
 
-        if not markets:
-            return None
+    def get_market_books(
+        self, market_ids: List[str], price_data: List[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Get market books, as many markets per request as the weight limit allows"""
+        if price_data is None:
+            price_data = BEST_OFFERS_PRICE_DATA
 
-        market_id = markets[0]["marketId"]
-        market_info = markets[0]
+        books = []
+        for chunk in chunk_market_ids(market_ids, price_data):
+            odds_params = {
+                "marketIds": chunk,
+                "priceProjection": {"priceData": price_data},
+            }
+            books.extend(
+                self._make_request("SportsAPING/v1.0/listMarketBook", odds_params)
+            )
 
-        # Get the actual odds
-        odds_params = {
-            "marketIds": [market_id],
-            "priceProjection": {"priceData": ["EX_BEST_OFFERS"]},
-        }
+        return books
 
-        market_book = self._make_request("SportsAPING/v1.0/listMarketBook", odds_params)
+    def get_match_odds_bulk(
+        self, event_ids: List[str], price_data: List[str] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """Get match odds for many events, keyed by event ID
 
-        if not market_book:
-            return None
+        Uses one listMarketCatalogue call for the events and as few
+        listMarketBook calls as the Betfair weight limits allow, instead of
+        two round trips per event.
+        """
+        if not event_ids:
+            return {}
+
+        markets = self.get_match_odds_catalogue(event_ids)
+        if not markets:
+            return {}
+
+        market_books = self.get_market_books(
+            [m["marketId"] for m in markets], price_data
+        )
+        books_by_market = {book["marketId"]: book for book in market_books}
 
         # Combine market info with odds data
-        return {"market_info": market_info, "market_book": market_book[0]}
+        match_odds = {}
+        for market_info in markets:
+            market_book = books_by_market.get(market_info["marketId"])
+            if market_book:
+                match_odds[market_info["event"]["id"]] = {
+                    "market_info": market_info,
+                    "market_book": market_book,
+                }
+
+        return match_odds
+
+
+def market_book_weight(price_data: List[str]) -> int:
+    """Betfair data weight of requesting one market with the given price projection"""
+    return max(
+        sum(PRICE_PROJECTION_WEIGHTS.get(p, 0) for p in price_data),
+        MIN_MARKET_BOOK_WEIGHT,
+    )
+
+
+def request_weight(method: str, params: Dict[str, Any]) -> int:
+    """Tokens a request takes from the client's scheduler, in data weight points"""
+    if method.endswith("listMarketBook"):
+        price_data = params.get("priceProjection", {}).get("priceData", [])
+        return len(params.get("marketIds", [])) * market_book_weight(price_data)
+    if method.endswith("listMarketCatalogue"):
+        return (
+            len(params.get("filter", {}).get("eventIds", [])) or MIN_MARKET_BOOK_WEIGHT
+        )
+    return MIN_MARKET_BOOK_WEIGHT
+
+
+def chunked(ids: List[str], size: int) -> List[List[str]]:
+    """Split ids into consecutive batches of at most size"""
+    return [ids[i : i + size] for i in range(0, len(ids), size)]
+
+
+def chunk_market_ids(
+    market_ids: List[str], price_data: List[str], per_request: int = None
+) -> List[List[str]]:
+    """Split market IDs into listMarketBook batches that stay within MAX_DATA_WEIGHT
+
+    per_request overrides the batch size the weight limit allows.
+    """
+    if not per_request:
+        per_request = max(MAX_DATA_WEIGHT // market_book_weight(price_data), 1)
+    return chunked(market_ids, per_request)
+
+
+def chunk_event_ids(event_ids: List[str]) -> List[List[str]]:
+    """Split event IDs into listMarketCatalogue batches of CATALOGUE_MAX_RESULTS"""
+    return chunked(event_ids, CATALOGUE_MAX_RESULTS)
+
+
+def catalogue_params(event_ids: List[str]) -> Dict[str, Any]:
+    """listMarketCatalogue parameters for the MATCH_ODDS markets of these events"""
+    return {
+        "filter": {"eventIds": event_ids, "marketTypeCodes": ["MATCH_ODDS"]},
+        "maxResults": CATALOGUE_MAX_RESULTS,
+        "marketProjection": MATCH_ODDS_MARKET_PROJECTION,
+    }
 
 
 class OddsDatabase:
-    """SQLite database for storing match odds"""
+    """SQLite database for storing match odds
+
+    Holds one connection for its lifetime. Use it as a context manager and
+    wrap each collection session in session(), which commits every write for
+    that request_time as a single transaction:
 
-    def __init__(self, db_path: str):
+        with OddsDatabase(db_path) as db:
+            with db.session():
+                db.insert_match(...)
+                db.insert_odds_many(...)
+
+    Writes made outside a session are rolled back when the database closes.
+
+    With store_changes_only, a runner's odds row is only written when its quote
+    differs from the last one stored. Every market seen in a sweep still gets
+    an odds_coverage row, so unchanged prices can be told apart from gaps.
+
+    With capture_depth, each runner's full back/lay ladders and traded volume
+    are also stored in odds_depth as packed float32 blobs (see pack_levels),
+    one row per snapshot. Market books must then be requested with
+    DEPTH_PRICE_DATA.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        fixtures_db_path: str = "/Users/rdmgray/Projects/EPLpal/data/premier_league_2025_26.db",
+        resolver: FixtureResolver = None,
+        store_changes_only: bool = False,
+        capture_depth: bool = False,
+    ):
         self.db_path = db_path
+        self.fixtures_db_path = fixtures_db_path
+        self.resolver = resolver or FixtureResolver(fixtures_db_path)
+        self.store_changes_only = store_changes_only
+        self.capture_depth = capture_depth
+        self.conn = None
+        # (match_id, selection_id) -> last stored quote, loaded on first use
+        self.last_quotes = None
+        # (match_id, selection_id) -> ladders stored by this process, for
+        # changes-only mode
+        self.last_depth = {}
 
         # Check if database exists
         if not os.path.exists(db_path):
@@ -195,6 +493,54 @@ class OddsDatabase:
                 f"Database not found at {db_path}. Please run init_dbs.py first."
             )
 
+    @property
+    def price_data(self) -> List[str]:
+        """listMarketBook price projection providing everything this database stores"""
+        return DEPTH_PRICE_DATA if self.capture_depth else BEST_OFFERS_PRICE_DATA
+
+    def open(self) -> "OddsDatabase":
+        if self.conn is None:
+            self.conn = connect(self.db_path)
+            migrate(self.conn, ODDS_MIGRATIONS, verbose=False)
+        return self
+
+    def _load_last_quotes(self):
+        rows = self.conn.execute(
+            """
+            SELECT match_id, selection_id, runner_name, runner_type, best_back_price,
+                best_back_size, best_lay_price, best_lay_size, last_price_traded,
+                total_matched, status
+            FROM latest_odds
+        """
+        ).fetchall()
+        self.last_quotes = {(row[0], row[1]): row[2:11] for row in rows}
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def __enter__(self) -> "OddsDatabase":
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @contextmanager
+    def session(self):
+        """Commit everything written inside the block atomically, or nothing on error"""
+        self.open()
+        # Pick up fixtures added or changed since the last session
+        self.resolver.refresh()
+        try:
+            with self.conn:
+                yield self
+        except Exception:
+            # The cached quotes may include rows that were just rolled back
+            self.last_quotes = None
+            self.last_depth = {}
+            raise
+
     def insert_match(
         self,
         event_id: str,
@@ -202,46 +548,39 @@ class OddsDatabase:
         home_team: str,
         away_team: str,
         match_date: str,
-    ) -> int:
-        """Get match ID and insert a match record if it doesn't exist."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Get match id from fixtures table
-        query_home_team = team_name_mapping_sl[home_team]
-        query_away_team = team_name_mapping_sl[away_team]
-
-        with closing(
-            sqlite3.connect(
-                "/Users/rdmgray/Projects/EPLpal/data/premier_league_2025_26.db"
-            )
-        ) as fixtures_db_conn:
-            with closing(fixtures_db_conn.cursor()) as fixtures_cursor:
-                fixtures_cursor.execute(
-                    """
-                            select match_id from fixtures
-                            where home_team = ?
-                            and away_team = ?
-                """,
-                    (query_home_team, query_away_team),
-                )
-                match_id = fixtures_cursor.fetchone()
-            fixtures_db_conn.commit()
-
-        cursor.execute("SELECT id FROM matches WHERE event_id = ?", (event_id,))
-        existing_match = cursor.fetchone()
-        if not existing_match:
-            cursor.execute(
-                """
-                INSERT INTO matches (id, event_id, market_id, home_team, away_team, match_date)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """,
-                (match_id[0], event_id, market_id, home_team, away_team, match_date),
+    ) -> Optional[int]:
+        """Get match ID and insert a match record if it doesn't exist.
+
+        Returns None if the teams can't be matched to a fixture.
+        """
+        self.open()
+
+        # Get match id from the fixtures index
+        lookup = self.resolver.resolve(home_team, away_team)
+        if not lookup.found:
+            print(f"No fixture for {home_team} v {away_team} ({lookup.reason})")
+            return None
+
+        self.conn.execute(
+            """
+            INSERT INTO matches (
+                id, event_id, market_id, home_team, away_team, match_date
             )
-            conn.commit()
+            SELECT ?, ?, ?, ?, ?, ?
+            WHERE NOT EXISTS (SELECT 1 FROM matches WHERE event_id = ?)
+        """,
+            (
+                lookup.match_id,
+                event_id,
+                market_id,
+                home_team,
+                away_team,
+                match_date,
+                event_id,
+            ),
+        )
 
-        conn.close()
-        return match_id[0]
+        return lookup.match_id
 
     def insert_odds(
         self,
@@ -252,55 +591,173 @@ class OddsDatabase:
         request_time: str,
     ):
         """Insert odds data for a runner"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Extract best back and lay prices
-        best_back_price = None
-        best_back_size = None
-        best_lay_price = None
-        best_lay_size = None
-
-        if "ex" in runner_data:
-            if (
-                "availableToBack" in runner_data["ex"]
-                and runner_data["ex"]["availableToBack"]
-            ):
-                best_back_price = runner_data["ex"]["availableToBack"][0]["price"]
-                best_back_size = runner_data["ex"]["availableToBack"][0]["size"]
+        self.insert_odds_many(
+            match_id, [(runner_data, runner_name, runner_type)], request_time
+        )
 
-            if (
-                "availableToLay" in runner_data["ex"]
-                and runner_data["ex"]["availableToLay"]
-            ):
-                best_lay_price = runner_data["ex"]["availableToLay"][0]["price"]
-                best_lay_size = runner_data["ex"]["availableToLay"][0]["size"]
+    def insert_odds_many(
+        self,
+        match_id: int,
+        runners: List[tuple[Dict[str, Any], str, str]],
+        request_time: str,
+    ):
+        """Insert odds for several (runner_data, runner_name, runner_type) at once"""
+        self.open()
+        rows = [
+            odds_row(match_id, runner_data, runner_name, runner_type, request_time)
+            for runner_data, runner_name, runner_type in runners
+        ]
+
+        self.conn.execute(
+            """
+            INSERT OR IGNORE INTO odds_coverage (match_id, request_time)
+            VALUES (?, ?)
+            """,
+            (match_id, request_time),
+        )
 
-        cursor.execute(
+        if self.store_changes_only:
+            if self.last_quotes is None:
+                self._load_last_quotes()
+            changed = []
+            for row in rows:
+                quote = row[2:11]
+                if self.last_quotes.get((row[0], row[1])) != quote:
+                    self.last_quotes[(row[0], row[1])] = quote
+                    changed.append(row)
+            rows = changed
+
+        self.conn.executemany(
             """
             INSERT INTO odds (
                 match_id, selection_id, runner_name, runner_type, best_back_price, best_back_size,
                 best_lay_price, best_lay_size, last_price_traded, total_matched, status, request_time
             ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """,
-            (
-                match_id,
-                runner_data["selectionId"],
-                runner_name,
-                runner_type,
-                best_back_price,
-                best_back_size,
-                best_lay_price,
-                best_lay_size,
-                runner_data.get("lastPriceTraded"),
-                runner_data.get("totalMatched"),
-                runner_data["status"],
-                request_time,
-            ),
+            rows,
+        )
+
+        # Keep the current quote per runner alongside the history
+        self.conn.executemany(
+            """
+            INSERT INTO latest_odds (
+                match_id, selection_id, runner_name, runner_type, best_back_price, best_back_size,
+                best_lay_price, best_lay_size, last_price_traded, total_matched, status, request_time
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (match_id, selection_id) DO UPDATE SET
+                runner_name = excluded.runner_name,
+                runner_type = excluded.runner_type,
+                best_back_price = excluded.best_back_price,
+                best_back_size = excluded.best_back_size,
+                best_lay_price = excluded.best_lay_price,
+                best_lay_size = excluded.best_lay_size,
+                last_price_traded = excluded.last_price_traded,
+                total_matched = excluded.total_matched,
+                status = excluded.status,
+                request_time = excluded.request_time
+            WHERE excluded.request_time >= latest_odds.request_time
+        """,
+            rows,
         )
 
-        conn.commit()
-        conn.close()
+        if self.capture_depth:
+            self.insert_depth_many(match_id, runners, request_time)
+
+    def insert_depth_many(
+        self,
+        match_id: int,
+        runners: List[tuple[Dict[str, Any], str, str]],
+        request_time: str,
+    ):
+        """Store the packed ladders of several runners for one snapshot"""
+        rows = []
+        for runner_data, _, _ in runners:
+            row = depth_row(match_id, runner_data, request_time)
+            if self.store_changes_only:
+                key = (row[0], row[1])
+                if self.last_depth.get(key) == row[3:]:
+                    continue
+                self.last_depth[key] = row[3:]
+            rows.append(row)
+
+        self.conn.executemany(
+            """
+            INSERT OR REPLACE INTO odds_depth (
+                match_id, selection_id, request_time,
+                available_to_back, available_to_lay, traded_volume
+            ) VALUES (?, ?, ?, ?, ?, ?)
+        """,
+            rows,
+        )
+
+
+def pack_levels(levels: List[Dict[str, float]]) -> bytes:
+    """Pack [{"price", "size"}, ...] as little-endian float32 price/size pairs"""
+    packed = array("f")
+    for level in levels:
+        packed.append(level["price"])
+        packed.append(level["size"])
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def depth_row(match_id: int, runner_data: Dict[str, Any], request_time: str) -> tuple:
+    """Flatten a market book runner's ladders into an odds_depth table row"""
+    ex = runner_data.get("ex", {})
+    return (
+        match_id,
+        runner_data["selectionId"],
+        request_time,
+        pack_levels(ex.get("availableToBack", [])),
+        pack_levels(ex.get("availableToLay", [])),
+        pack_levels(ex.get("tradedVolume", [])),
+    )
+
+
+def odds_row(
+    match_id: int,
+    runner_data: Dict[str, Any],
+    runner_name: str,
+    runner_type: str,
+    request_time: str,
+) -> tuple:
+    """Flatten a market book runner into an odds table row"""
+    # Extract best back and lay prices
+    best_back_price = None
+    best_back_size = None
+    best_lay_price = None
+    best_lay_size = None
+
+    if "ex" in runner_data:
+        if (
+            "availableToBack" in runner_data["ex"]
+            and runner_data["ex"]["availableToBack"]
+        ):
+            best_back_price = runner_data["ex"]["availableToBack"][0]["price"]
+            best_back_size = runner_data["ex"]["availableToBack"][0]["size"]
+
+        if (
+            "availableToLay" in runner_data["ex"]
+            and runner_data["ex"]["availableToLay"]
+        ):
+            best_lay_price = runner_data["ex"]["availableToLay"][0]["price"]
+            best_lay_size = runner_data["ex"]["availableToLay"][0]["size"]
+
+    return (
+        match_id,
+        runner_data["selectionId"],
+        runner_name,
+        runner_type,
+        best_back_price,
+        best_back_size,
+        best_lay_price,
+        best_lay_size,
+        runner_data.get("lastPriceTraded"),
+        runner_data.get("totalMatched"),
+        runner_data["status"],
+        request_time,
+    )
 
 
 def parse_match_name(match_name: str) -> tuple[str, str]:
@@ -312,13 +769,192 @@ def parse_match_name(match_name: str) -> tuple[str, str]:
         return match_name, ""
 
 
-def main():
-    """Main function to collect and store Premier League odds"""
+def is_finished(market_book: Dict[str, Any]) -> bool:
+    """Whether a market has gone in-play or closed, so is no longer collected"""
+    return bool(market_book.get("inplay")) or market_book.get("status") == "CLOSED"
+
+
+def is_paused(market_book: Dict[str, Any]) -> bool:
+    """Whether a pre-play market is temporarily not trading (e.g. SUSPENDED)
+
+    Its prices are stale, so it is not stored, but it is still collected
+    once it reopens.
+    """
+    return not is_finished(market_book) and market_book.get("status") != "OPEN"
+
+
+def store_match_odds(
+    db: OddsDatabase,
+    match: Dict[str, Any],
+    odds_data: Dict[str, Any],
+    request_time: str,
+):
+    """Store the match record and runner odds for one event"""
+    event_id = match["event"]["id"]
+    match_name = match["event"]["name"]
+    match_date = match["event"]["openDate"]
+
+    # Parse match name
+    home_team, away_team = parse_match_name(match_name)
+
+    # Insert match into database
+    market_id = odds_data["market_info"]["marketId"]
+    match_id = db.insert_match(event_id, market_id, home_team, away_team, match_date)
+    if match_id is None:
+        return
+
+    # Insert odds for each runner
+    market_book = odds_data["market_book"]
+    runners_info = odds_data["market_info"]["runners"]
+
+    # Create a mapping of selection IDs to runner names
+    runner_names = {
+        runner["selectionId"]: runner["runnerName"] for runner in runners_info
+    }
+
+    runners = []
+    for runner in market_book["runners"]:
+        selection_id = runner["selectionId"]
+        runner_name = runner_names.get(selection_id, f"Unknown_{selection_id}")
+        if runner_name == home_team:
+            runner_type = "Home win"
+        elif runner_name == away_team:
+            runner_type = "Away win"
+        else:
+            runner_type = "Draw"
+        runners.append((runner, runner_name, runner_type))
+    db.insert_odds_many(match_id, runners, request_time)
+
+
+def collect_odds(
+    client: BetfairClient,
+    db: OddsDatabase,
+    matches: List[Dict[str, Any]],
+    request_time: str,
+):
+    """Fetch and store odds for every match, one batched request at a time"""
+    # Fetch odds for every match in a handful of batched requests
+    print("Fetching match odds...")
+    all_match_odds = client.get_match_odds_bulk(
+        [match["event"]["id"] for match in matches], db.price_data
+    )
+
+    # Process each match
+    for match in matches:
+        print(f"\nProcessing: {match['event']['name']} ({match['event']['openDate']})")
+
+        odds_data = all_match_odds.get(match["event"]["id"])
+
+        if not odds_data:
+            print(f"No odds available for {match['event']['name']}")
+            continue
+
+        store_match_odds(db, match, odds_data, request_time)
+
+
+async def collect_odds_async(
+    client: BetfairClient,
+    db: OddsDatabase,
+    matches: List[Dict[str, Any]],
+    request_time: str,
+    max_concurrency: int = 8,
+    markets_per_request: int = None,
+):
+    """Fetch odds with concurrent requests and store each batch as it arrives
+
+    Requests run on max_concurrency worker threads sharing the client's
+    keep-alive connection pool. Database writes stay on the event loop
+    thread, so the sweep takes as long as its slowest request rather than
+    the sum of all of them.
+    """
+    # max_workers is what caps in-flight requests; the default executor can
+    # have fewer threads than max_concurrency on small machines
+    executor = ThreadPoolExecutor(max_workers=max_concurrency)
+    try:
+        return await _collect_odds_async(
+            client, db, matches, request_time, executor, markets_per_request
+        )
+    finally:
+        executor.shutdown(wait=False)
+
+
+async def _collect_odds_async(
+    client: BetfairClient,
+    db: OddsDatabase,
+    matches: List[Dict[str, Any]],
+    request_time: str,
+    executor: ThreadPoolExecutor,
+    markets_per_request: int = None,
+):
+    loop = asyncio.get_running_loop()
+
+    async def call(method: str, params: Dict[str, Any]):
+        return await loop.run_in_executor(
+            executor, client._make_request, method, params
+        )
+
+    matches_by_event = {match["event"]["id"]: match for match in matches}
+
+    print("Fetching match odds catalogue...")
+    catalogue_chunks = await asyncio.gather(
+        *[
+            call("SportsAPING/v1.0/listMarketCatalogue", catalogue_params(chunk))
+            for chunk in chunk_event_ids(list(matches_by_event))
+        ]
+    )
+    markets = {
+        market["marketId"]: market for chunk in catalogue_chunks for market in chunk
+    }
+
+    price_data = db.price_data
+    market_ids = list(markets)
+    chunks = chunk_market_ids(market_ids, price_data, markets_per_request)
+
+    print(f"Fetching {len(market_ids)} market books in {len(chunks)} requests...")
+    book_requests = [
+        call(
+            "SportsAPING/v1.0/listMarketBook",
+            {"marketIds": chunk, "priceProjection": {"priceData": price_data}},
+        )
+        for chunk in chunks
+    ]
+
+    stored = 0
+    for next_books in asyncio.as_completed(book_requests):
+        for market_book in await next_books:
+            market_info = markets[market_book["marketId"]]
+            match = matches_by_event[market_info["event"]["id"]]
+            print(f"Storing: {match['event']['name']} ({match['event']['openDate']})")
+            store_match_odds(
+                db,
+                match,
+                {"market_info": market_info, "market_book": market_book},
+                request_time,
+            )
+            stored += 1
+
+    return stored
+
+
+def main(args: argparse.Namespace = None, client: BetfairClient = None):
+    """Main function to collect and store Premier League odds
+
+    client overrides the one built from args, e.g. to keep one replay
+    transport across several sweeps.
+    """
+    if args is None:
+        args = parse_args([])
+
     # Initialize database
-    db_path = "/Users/rdmgray/Projects/EPLpal/data/premier_league_odds.db"
+    db_path = args.db_path
 
     try:
-        db = OddsDatabase(db_path)
+        db = OddsDatabase(
+            db_path,
+            fixtures_db_path=args.fixtures_db_path,
+            store_changes_only=args.changes_only,
+            capture_depth=args.depth,
+        )
         print(f"✅ Connected to database: {db_path}")
     except FileNotFoundError as e:
         print(f"❌ {e}")
@@ -327,7 +963,7 @@ def main():
 
     # Initialize Betfair client
     try:
-        client = BetfairClient()
+        client = client or make_client(args)
         print("✅ Betfair client initialized")
     except ValueError as e:
         print(f"❌ Error: {e}")
@@ -351,9 +987,6 @@ def main():
             return
 
     try:
-        # Get Premier League competition ID
-        print("Getting Premier League competition ID...")
-        competition_id = client.get_premier_league_id()
         print(f"Premier League ID: {competition_id}")
 
         # Get upcoming matches
@@ -365,56 +998,127 @@ def main():
         request_time = datetime.now().isoformat()
         print(f"Collection session started at: {request_time}")
 
-        # Process each match
-        for match in matches:
-            event_id = match["event"]["id"]
-            match_name = match["event"]["name"]
-            match_date = match["event"]["openDate"]
-
-            print(f"\nProcessing: {match_name} ({match_date})")
-
-            # Get odds for this match
-            odds_data = client.get_match_odds(event_id)
-
-            if not odds_data:
-                print(f"No odds available for {match_name}")
-                continue
-
-            # Parse match name
-            home_team, away_team = parse_match_name(match_name)
-
-            # Insert match into database
-            market_id = odds_data["market_info"]["marketId"]
-            match_id = db.insert_match(
-                event_id, market_id, home_team, away_team, match_date
-            )
-
-            # Insert odds for each runner
-            market_book = odds_data["market_book"]
-            runners_info = odds_data["market_info"]["runners"]
-
-            # Create a mapping of selection IDs to runner names
-            runner_names = {
-                runner["selectionId"]: runner["runnerName"] for runner in runners_info
-            }
-
-            for runner in market_book["runners"]:
-                selection_id = runner["selectionId"]
-                runner_name = runner_names.get(selection_id, f"Unknown_{selection_id}")
-                if runner_name == home_team:
-                    runner_type = "Home win"
-                elif runner_name == away_team:
-                    runner_type = "Away win"
-                else:
-                    runner_type = "Draw"
-                db.insert_odds(match_id, runner, runner_name, runner_type, request_time)
+        # Commit the whole session at once so a failed sweep leaves no partial data
+        with db, db.session():
+            if args.use_async:
+                asyncio.run(
+                    collect_odds_async(
+                        client,
+                        db,
+                        matches,
+                        request_time,
+                        max_concurrency=args.concurrency,
+                        markets_per_request=args.markets_per_request,
+                    )
+                )
+            else:
+                collect_odds(client, db, matches, request_time)
 
         print(f"\nOdds collection complete! Data saved to {db_path}")
 
     except Exception as e:
         print(f"Error occurred: {e}")
         return
+    finally:
+        client.pool.close()
+
+
+def make_client(args: argparse.Namespace) -> BetfairClient:
+    """Build a BetfairClient from the command line, recording or replaying if asked"""
+    if args.replay:
+        # Replayed responses need no login
+        return BetfairClient(
+            session_token=args.session_token or "replay",
+            transport=ReplayTransport(args.replay, speed=args.replay_speed),
+        )
+
+    client = BetfairClient(
+        timeout=args.timeout,
+        base_url=args.api_url,
+        session_token=args.session_token,
+        pool_size=args.concurrency,
+    )
+    if args.record:
+        client.pool = RecordingTransport(client.pool, args.record)
+    return client
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Betfair Premier League odds collector"
+    )
+    parser.add_argument(
+        "--db-path",
+        default="/Users/rdmgray/Projects/EPLpal/data/premier_league_odds.db",
+        help="Path to the odds database",
+    )
+    parser.add_argument(
+        "--fixtures-db-path",
+        default="/Users/rdmgray/Projects/EPLpal/data/premier_league_2025_26.db",
+        help="Path to the fixtures database used to resolve match IDs",
+    )
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="Fetch market books concurrently and store them as they arrive",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Maximum in-flight requests (and pooled connections) in async mode",
+    )
+    parser.add_argument(
+        "--markets-per-request",
+        type=int,
+        default=None,
+        help="Markets per listMarketBook call in async mode (default: weight limit)",
+    )
+    parser.add_argument(
+        "--changes-only",
+        action="store_true",
+        help="Only store a runner's odds when they differ from the last stored quote",
+    )
+    parser.add_argument(
+        "--depth",
+        action="store_true",
+        help="Also store each runner's full ladders and traded volume in odds_depth",
+    )
+    parser.add_argument(
+        "--api-url",
+        default=None,
+        help="Betfair JSON-RPC endpoint, e.g. a local betfair_stub_server.py",
+    )
+    parser.add_argument(
+        "--session-token",
+        default=None,
+        help="Use this session token instead of logging in",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=30,
+        help="Seconds to wait for a Betfair response before retrying",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="PATH",
+        help="Append every JSON-RPC request and response to PATH",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="PATH",
+        help="Answer JSON-RPC requests from a --record file instead of Betfair",
+    )
+    parser.add_argument(
+        "--replay-speed",
+        type=float,
+        default=0.0,
+        help="Replay at this multiple of the recorded response times (0: no delay)",
+    )
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
-    main()
+    main(parse_args())
@@ -0,0 +1,172 @@
+"""
+Betfair session token lifecycle
+
+SessionManager hands out a session token for BetfairClient. The token is
+cached in a local file so cron runs and parallel processes share one
+session instead of each doing a certificate login. It is extended with
+keepAlive before it can expire, and replaced by a fresh login when the API
+rejects it. Logins are serialised across processes with a file lock, so a
+burst of processes that find the token expired produce only one login.
+"""
+
+import os
+import json
+import time
+import fcntl
+import threading
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+import requests
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".betfair_session.json"
+)
+KEEP_ALIVE_URL = "https://identitysso.betfair.com/api/keepAlive"
+
+# Betfair sessions expire 12 hours after their last use or keepAlive; extend
+# the session once it has gone this long without one
+SESSION_LIFETIME_SECONDS = 12 * 3600
+KEEP_ALIVE_SECONDS = 3600
+# Wait this long before retrying a keepAlive that failed to reach Betfair
+KEEP_ALIVE_RETRY_SECONDS = 300
+
+
+class SessionManager:
+    """Cached, kept-alive Betfair session token
+
+    login is called (with no arguments) to get a new token. With
+    cache_path=None the token is only held in memory, e.g. for a token passed
+    on the command line. A session_token passed in is used as is: it is not
+    kept alive, and is only replaced by a login if the API rejects it.
+    """
+
+    def __init__(
+        self,
+        login: Callable[[], str],
+        api_key: Optional[str],
+        cache_path: Optional[str] = DEFAULT_CACHE_PATH,
+        session_token: Optional[str] = None,
+        timeout: float = 30,
+    ):
+        self.login = login
+        self.api_key = api_key
+        self.cache_path = cache_path
+        self.timeout = timeout
+        self.session_token = session_token
+        self.refreshed_at = time.time() if session_token else 0.0
+        # The caller owns a token it passed in, so leave its lifetime to them
+        self.keep_alive_enabled = session_token is None
+        # time.time() before which keepAlive is not retried after a failure
+        self.retry_at = 0.0
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def _file_lock(self):
+        if self.cache_path is None:
+            yield
+            return
+        with open(f"{self.cache_path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self) -> bool:
+        """Adopt the cached token if it is still live; returns whether it was"""
+        if self.cache_path is None:
+            return False
+        try:
+            with open(self.cache_path) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if time.time() - cached["refreshed_at"] >= SESSION_LIFETIME_SECONDS:
+            return False
+        self.session_token = cached["session_token"]
+        self.refreshed_at = cached["refreshed_at"]
+        return True
+
+    def _save(self):
+        if self.cache_path is None:
+            return
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        # The token grants account access, so keep the file private
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(
+                {
+                    "session_token": self.session_token,
+                    "refreshed_at": self.refreshed_at,
+                },
+                f,
+            )
+        os.replace(tmp_path, self.cache_path)
+
+    def _login(self):
+        print("Logging in to Betfair...")
+        self.session_token = self.login()
+        self.refreshed_at = time.time()
+        self._save()
+
+    def keep_alive(self) -> bool:
+        """Extend the current session; returns False if Betfair has expired it"""
+        try:
+            response = requests.post(
+                KEEP_ALIVE_URL,
+                headers={
+                    "Accept": "application/json",
+                    "X-Application": self.api_key or "",
+                    "X-Authentication": self.session_token,
+                },
+                timeout=self.timeout,
+            )
+            result = response.json()
+        except (requests.RequestException, ValueError) as e:
+            # Keep using the token; if it really has expired the next call re-logs in
+            print(f"keepAlive failed, retrying in {KEEP_ALIVE_RETRY_SECONDS}s: {e}")
+            self.retry_at = time.time() + KEEP_ALIVE_RETRY_SECONDS
+            return True
+
+        if result.get("status") != "SUCCESS":
+            return False
+        self.session_token = result.get("token") or self.session_token
+        self.refreshed_at = time.time()
+        self._save()
+        return True
+
+    def token(self) -> str:
+        """A live session token, logging in or extending the session as needed"""
+        with self.lock:
+            if self.session_token is None:
+                with self._file_lock():
+                    if not self._load():
+                        self._login()
+            elif (
+                self.keep_alive_enabled
+                and time.time() - self.refreshed_at >= KEEP_ALIVE_SECONDS
+                and time.time() >= self.retry_at
+            ):
+                with self._file_lock():
+                    # Another process may have extended or replaced it already
+                    if not self._load() or (
+                        time.time() - self.refreshed_at >= KEEP_ALIVE_SECONDS
+                    ):
+                        if not self.keep_alive():
+                            self._login()
+            return self.session_token
+
+    def invalidate(self, rejected_token: str) -> str:
+        """Replace a token the API rejected; returns the token to retry with
+
+        If another thread or process has already logged in since the
+        rejected token was handed out, its token is reused instead of
+        logging in again.
+        """
+        with self.lock:
+            with self._file_lock():
+                if self.session_token == rejected_token:
+                    if not self._load() or self.session_token == rejected_token:
+                        self._login()
+            return self.session_token
@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+"""
+Betfair Exchange Stream API odds collector
+
+An alternative to polling listMarketBook: subscribes to the Premier League
+MATCH_ODDS markets over the Exchange Stream protocol (CRLF-delimited JSON
+over TLS), applies each market change message (mcm) to an in-memory order
+book per runner, and every --flush-interval seconds stores the markets that
+changed through OddsDatabase in one transaction. Market discovery and
+runner names still come from the JSON-RPC API via BetfairClient.
+
+Usage:
+    python betfair_stream.py --changes-only
+    python betfair_stream.py --flush-interval 1 --record-stream stream.jsonl
+
+Offline, against betfair_stream_replay.py and betfair_stub_server.py:
+    BETFAIR_API_KEY=stub python betfair_stream.py --stream-host 127.0.0.1 \
+        --stream-port 8790 --no-tls \
+        --api-url http://127.0.0.1:8765/x --session-token stub \
+        --db-path /tmp/stub/premier_league_odds.db \
+        --fixtures-db-path /tmp/stub/premier_league_2025_26.db
+"""
+
+import ssl
+import json
+import time
+import socket
+import argparse
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from betfair_odds_collector import (
+    BetfairClient,
+    OddsDatabase,
+    is_finished,
+    is_paused,
+    make_client,
+    parse_args as parse_collector_args,
+    store_match_odds,
+)
+
+STREAM_HOST = "stream-api.betfair.com"
+STREAM_PORT = 443
+
+# Best three levels each side, last traded price, traded volume and the
+# market definition (status, in-play flag, runner status)
+MARKET_DATA_FIELDS = ["EX_BEST_OFFERS", "EX_TRADED_VOL", "EX_LTP", "EX_MARKET_DEF"]
+LADDER_LEVELS = 3
+HEARTBEAT_MS = 5000
+
+# Delay before reconnecting after the stream drops
+RECONNECT_DELAY_SECONDS = 5
+
+
+class RunnerBook:
+    """One runner's order book, built from rc (runner change) messages
+
+    batb/batl are level-indexed ([level, price, size], best first); atb/atl
+    are price-indexed ([price, size]) full-depth ladders. A size of 0 removes
+    the level or price.
+    """
+
+    def __init__(self, selection_id: int):
+        self.selection_id = selection_id
+        self.status = "ACTIVE"
+        self.best_back: Dict[int, List[float]] = {}
+        self.best_lay: Dict[int, List[float]] = {}
+        self.back: Dict[float, float] = {}
+        self.lay: Dict[float, float] = {}
+        self.last_price_traded: Optional[float] = None
+        self.total_matched = 0.0
+
+    def apply(self, rc: Dict[str, Any], image: bool = False):
+        if image:
+            self.best_back, self.best_lay, self.back, self.lay = {}, {}, {}, {}
+        for key, levels in (("batb", self.best_back), ("batl", self.best_lay)):
+            for level, price, size in rc.get(key, []):
+                if size == 0:
+                    levels.pop(level, None)
+                else:
+                    levels[level] = [price, size]
+        for key, ladder in (("atb", self.back), ("atl", self.lay)):
+            for price, size in rc.get(key, []):
+                if size == 0:
+                    ladder.pop(price, None)
+                else:
+                    ladder[price] = size
+        if "ltp" in rc:
+            self.last_price_traded = rc["ltp"]
+        if "tv" in rc:
+            self.total_matched = rc["tv"]
+
+    def _levels(
+        self, best: Dict[int, List[float]], full: Dict[float, float], back: bool
+    ):
+        if best:
+            return [{"price": p, "size": s} for _, (p, s) in sorted(best.items())]
+        return [{"price": p, "size": full[p]} for p in sorted(full, reverse=back)]
+
+    def runner_data(self) -> Dict[str, Any]:
+        """The runner in listMarketBook form, as OddsDatabase expects it"""
+        return {
+            "selectionId": self.selection_id,
+            "status": self.status,
+            "lastPriceTraded": self.last_price_traded,
+            "totalMatched": self.total_matched,
+            "ex": {
+                "availableToBack": self._levels(self.best_back, self.back, back=True),
+                "availableToLay": self._levels(self.best_lay, self.lay, back=False),
+                "tradedVolume": [],
+            },
+        }
+
+
+class MarketBook:
+    """A market's definition and runner books, built from mc (market change) messages"""
+
+    def __init__(self, market_id: str):
+        self.market_id = market_id
+        self.status = "OPEN"
+        self.inplay = False
+        self.runners: Dict[int, RunnerBook] = {}
+
+    def apply(self, mc: Dict[str, Any]):
+        image = mc.get("img", False)
+        if image:
+            self.runners = {}
+
+        definition = mc.get("marketDefinition")
+        if definition:
+            self.status = definition.get("status", self.status)
+            self.inplay = definition.get("inPlay", self.inplay)
+            for runner in definition.get("runners", []):
+                book = self.runners.setdefault(runner["id"], RunnerBook(runner["id"]))
+                book.status = runner.get("status", book.status)
+
+        for rc in mc.get("rc", []):
+            book = self.runners.setdefault(rc["id"], RunnerBook(rc["id"]))
+            book.apply(rc, image)
+
+    def market_book(self) -> Dict[str, Any]:
+        """The market in listMarketBook form"""
+        return {
+            "marketId": self.market_id,
+            "status": self.status,
+            "inplay": self.inplay,
+            "runners": [book.runner_data() for book in self.runners.values()],
+        }
+
+
+class MarketCache:
+    """Order books for every subscribed market"""
+
+    def __init__(self):
+        self.markets: Dict[str, MarketBook] = {}
+
+    def apply(self, mcm: Dict[str, Any]) -> Set[str]:
+        """Apply one mcm message; returns the ids of the markets it changed"""
+        changed = set()
+        for mc in mcm.get("mc", []):
+            market = self.markets.setdefault(mc["id"], MarketBook(mc["id"]))
+            market.apply(mc)
+            changed.add(mc["id"])
+        return changed
+
+
+class StreamConnection:
+    """A connection to the Exchange Stream API"""
+
+    def __init__(
+        self,
+        host: str = STREAM_HOST,
+        port: int = STREAM_PORT,
+        use_tls: bool = True,
+        timeout: float = 3 * HEARTBEAT_MS / 1000,
+    ):
+        self.host = host
+        self.port = port
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.sock = None
+        self.reader = None
+        self.next_id = 1
+
+    def connect(self) -> Dict[str, Any]:
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        if self.use_tls:
+            sock = ssl.create_default_context().wrap_socket(
+                sock, server_hostname=self.host
+            )
+        self.sock = sock
+        self.reader = sock.makefile("rb")
+        # The server opens with {"op": "connection", "connectionId": ...}
+        return self.read()
+
+    def close(self):
+        if self.sock is not None:
+            self.reader.close()
+            self.sock.close()
+            self.sock = None
+
+    def send(self, message: Dict[str, Any]) -> int:
+        message = dict(message, id=self.next_id)
+        self.next_id += 1
+        self.sock.sendall(json.dumps(message).encode("utf-8") + b"\r\n")
+        return message["id"]
+
+    def read(self) -> Dict[str, Any]:
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Stream closed by server")
+        return json.loads(line)
+
+    def _expect_success(self, request_id: int):
+        while True:
+            message = self.read()
+            if message.get("op") == "status" and message.get("id") == request_id:
+                if message.get("statusCode") != "SUCCESS":
+                    raise Exception(
+                        f"Stream error: {message.get('errorCode')} "
+                        f"{message.get('errorMessage')}"
+                    )
+                return
+
+    def authenticate(self, app_key: str, session_token: str):
+        request_id = self.send(
+            {"op": "authentication", "appKey": app_key, "session": session_token}
+        )
+        self._expect_success(request_id)
+
+    def subscribe(
+        self,
+        market_ids: List[str],
+        initial_clk: Optional[str] = None,
+        clk: Optional[str] = None,
+    ):
+        """Subscribe to market_ids; pass the last clocks to resume after a reconnect"""
+        message = {
+            "op": "marketSubscription",
+            "marketFilter": {"marketIds": market_ids},
+            "marketDataFilter": {
+                "fields": MARKET_DATA_FIELDS,
+                "ladderLevels": LADDER_LEVELS,
+            },
+            "heartbeatMs": HEARTBEAT_MS,
+        }
+        if initial_clk and clk:
+            message["initialClk"] = initial_clk
+            message["clk"] = clk
+        self.send(message)
+
+    def messages(self) -> Iterator[Dict[str, Any]]:
+        while True:
+            yield self.read()
+
+
+class StreamCollector:
+    """Feeds stream updates into OddsDatabase in batches
+
+    markets maps market_id to the (match, market_info) pair from the JSON-RPC
+    catalogue, which provides the event and runner names store_match_odds
+    needs. Markets that go in-play or close are dropped, and suspended ones
+    are not stored until they reopen. Their last trading prices are stored
+    before the market definition change is applied.
+    """
+
+    def __init__(
+        self,
+        client: BetfairClient,
+        db: OddsDatabase,
+        connection: StreamConnection,
+        markets: Dict[str, tuple],
+        flush_interval: float = 5.0,
+        record_path: Optional[str] = None,
+    ):
+        self.client = client
+        self.db = db
+        self.connection = connection
+        self.markets = markets
+        self.flush_interval = flush_interval
+        self.record_path = record_path
+        self.cache = MarketCache()
+        self.changed: Set[str] = set()
+        self.initial_clk = None
+        self.clk = None
+        self.messages = 0
+        self.stored = 0
+
+    def start(self):
+        self.connection.connect()
+        self.connection.authenticate(self.client.api_key, self.client.sessions.token())
+        self.connection.subscribe(list(self.markets), self.initial_clk, self.clk)
+
+    def handle(self, message: Dict[str, Any]) -> bool:
+        """Apply one stream message; returns True if a market went in-play or closed"""
+        op = message.get("op")
+        if op == "status" and message.get("statusCode") == "FAILURE":
+            raise Exception(
+                f"Stream error: {message.get('errorCode')} "
+                f"{message.get('errorMessage')}"
+            )
+        if op != "mcm":
+            return False
+
+        self.initial_clk = message.get("initialClk", self.initial_clk)
+        self.clk = message.get("clk", self.clk)
+        if message.get("ct") == "HEARTBEAT":
+            return False
+        self.messages += 1
+        if self.stops_trading(message):
+            self.flush()
+        changed = self.cache.apply(message) & set(self.markets)
+        self.changed |= changed
+        return any(
+            is_finished(self.cache.markets[market_id].market_book())
+            for market_id in changed
+        )
+
+    def stops_trading(self, message: Dict[str, Any]) -> bool:
+        """Whether message stops pre-play trading in a market with unstored changes"""
+        for mc in message.get("mc", []):
+            definition = mc.get("marketDefinition")
+            if (
+                definition
+                and mc["id"] in self.changed
+                and (
+                    definition.get("inPlay")
+                    or definition.get("status", "OPEN") != "OPEN"
+                )
+            ):
+                return True
+        return False
+
+    def flush(self) -> int:
+        """Store every market changed since the last flush in one transaction"""
+        if not self.changed:
+            return 0
+        request_time = datetime.now().isoformat()
+        books = {
+            market_id: self.cache.markets[market_id].market_book()
+            for market_id in self.changed
+        }
+        # In-play, closed and suspended books are not pre-play trading prices
+        trading = [
+            market_id
+            for market_id, book in books.items()
+            if not is_finished(book) and not is_paused(book)
+        ]
+        with self.db.session():
+            for market_id in trading:
+                match, market_info = self.markets[market_id]
+                store_match_odds(
+                    self.db,
+                    match,
+                    {"market_info": market_info, "market_book": books[market_id]},
+                    request_time,
+                )
+
+        for market_id, book in books.items():
+            if is_finished(book):
+                match, _ = self.markets.pop(market_id)
+                print(
+                    f"Stopped streaming {match['event']['name']} "
+                    f"({'in-play' if book['inplay'] else book['status']})"
+                )
+
+        flushed = len(trading)
+        self.stored += flushed
+        self.changed = set()
+        return flushed
+
+    def run(self, max_messages: Optional[int] = None):
+        """Consume the stream until every market has closed (or max_messages)"""
+        recording = open(self.record_path, "a") if self.record_path else None
+        last_flush = time.monotonic()
+        try:
+            while self.markets and (
+                max_messages is None or self.messages < max_messages
+            ):
+                try:
+                    if self.connection.sock is None:
+                        self.start()
+                    message = self.connection.read()
+                except (OSError, ConnectionError) as e:
+                    print(
+                        f"Stream disconnected ({e}), "
+                        f"reconnecting in {RECONNECT_DELAY_SECONDS}s"
+                    )
+                    self.connection.close()
+                    time.sleep(RECONNECT_DELAY_SECONDS)
+                    continue
+
+                if recording is not None and message.get("op") == "mcm":
+                    recording.write(json.dumps(message) + "\n")
+                # Stop following a market as soon as it goes in-play or closes
+                market_ended = self.handle(message)
+
+                if market_ended or time.monotonic() - last_flush >= self.flush_interval:
+                    flushed = self.flush()
+                    if flushed:
+                        print(
+                            f"{datetime.now().isoformat()}: "
+                            f"stored {flushed} changed markets, "
+                            f"{len(self.markets)} streaming"
+                        )
+                    last_flush = time.monotonic()
+                    # Extends the session with keepAlive before it can expire
+                    self.client.sessions.token()
+        finally:
+            self.flush()
+            self.connection.close()
+            if recording is not None:
+                recording.close()
+
+
+def discover_markets(client: BetfairClient) -> Dict[str, tuple]:
+    """market_id -> (match, market_info) for every upcoming Premier League match"""
+    competition_id = client.get_premier_league_id()
+    matches = {m["event"]["id"]: m for m in client.get_upcoming_matches(competition_id)}
+    return {
+        market_info["marketId"]: (matches[market_info["event"]["id"]], market_info)
+        for market_info in client.get_match_odds_catalogue(list(matches))
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Betfair Exchange Stream odds collector"
+    )
+    parser.add_argument("--stream-host", default=STREAM_HOST)
+    parser.add_argument("--stream-port", type=int, default=STREAM_PORT)
+    parser.add_argument(
+        "--no-tls",
+        dest="use_tls",
+        action="store_false",
+        help="Connect without TLS, e.g. to betfair_stream_replay.py",
+    )
+    parser.add_argument(
+        "--flush-interval",
+        type=float,
+        default=5.0,
+        help="Seconds between database writes of the markets that changed",
+    )
+    parser.add_argument(
+        "--record-stream",
+        metavar="PATH",
+        help="Append every market change message to PATH for betfair_stream_replay.py",
+    )
+    args, remaining = parser.parse_known_args(argv)
+    # Database, API URL and session options are shared with betfair_odds_collector.py
+    args.__dict__.update(vars(parse_collector_args(remaining)))
+    if args.depth:
+        # The subscription carries best offers only, not the full ladders
+        parser.error(
+            "--depth needs listMarketBook price projections; "
+            "use betfair_odds_collector.py or odds_poller.py"
+        )
+    return args
+
+
+def main(args: argparse.Namespace):
+    try:
+        db = OddsDatabase(
+            args.db_path,
+            fixtures_db_path=args.fixtures_db_path,
+            store_changes_only=args.changes_only,
+        )
+    except FileNotFoundError as e:
+        print(f"❌ {e}")
+        print("Run: python init_dbs.py")
+        return
+
+    client = make_client(args)
+    try:
+        markets = discover_markets(client)
+    finally:
+        client.pool.close()
+    print(f"Streaming {len(markets)} MATCH_ODDS markets, press Ctrl+C to stop")
+
+    collector = StreamCollector(
+        client,
+        db,
+        StreamConnection(args.stream_host, args.stream_port, args.use_tls),
+        markets,
+        flush_interval=args.flush_interval,
+        record_path=args.record_stream,
+    )
+    try:
+        with db:
+            collector.run()
+    except KeyboardInterrupt:
+        print("Stopping stream collector")
+    print(
+        f"Applied {collector.messages} market changes, "
+        f"stored {collector.stored} market snapshots"
+    )
+
+
+if __name__ == "__main__":
+    main(parse_args())
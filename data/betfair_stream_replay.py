@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Local replay server for the Betfair Exchange Stream API
+
+Plays recorded market change messages (one mcm JSON object per line, as
+written by betfair_stream.py --record-stream) to betfair_stream.py over plain TCP,
+so the stream collector can be run offline. Recordings can also be
+generated from betfair_stub_server.py's fixtures, ending with every market
+going in-play.
+
+Usage:
+    python betfair_stream_replay.py --generate /tmp/stub/stream.jsonl --updates 5000
+    python betfair_stream_replay.py --recording /tmp/stub/stream.jsonl \
+        --port 8790 --speed 10
+"""
+
+import json
+import time
+import random
+import argparse
+import socketserver
+from typing import Any, Dict, List
+
+from betfair_stub_server import stub_matches
+
+HEARTBEAT_SECONDS = 5
+
+
+def generate_recording(
+    path: str, num_matches: int = 10, updates: int = 1000, seed: int = 0
+) -> int:
+    """Write a synthetic recording for the stub matches; returns the message count"""
+    rng = random.Random(seed)
+    matches = stub_matches(num_matches)
+    pt = 1757764800000  # 2025-09-13 12:00 UTC, in ms
+    messages = []
+
+    def ladder(price: float, side: int) -> List[List[float]]:
+        return [
+            [
+                level,
+                round(price + side * 0.02 * level, 2),
+                round(rng.uniform(10, 5000), 2),
+            ]
+            for level in range(3)
+        ]
+
+    def definition(inplay: bool, m: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "status": "OPEN",
+            "inPlay": inplay,
+            "marketType": "MATCH_ODDS",
+            "eventId": m["event_id"],
+            "runners": [{"id": sid, "status": "ACTIVE"} for sid in m["selection_ids"]],
+        }
+
+    prices = {}
+    image = []
+    for m in matches:
+        runners = []
+        for sid in m["selection_ids"]:
+            prices[sid] = round(rng.uniform(1.5, 8.0), 2)
+            runners.append(
+                {
+                    "id": sid,
+                    "batb": ladder(prices[sid], -1),
+                    "batl": ladder(prices[sid] + 0.02, 1),
+                    "ltp": prices[sid],
+                    "tv": round(rng.uniform(1e3, 1e5), 2),
+                }
+            )
+        image.append(
+            {
+                "id": m["market_id"],
+                "img": True,
+                "marketDefinition": definition(False, m),
+                "rc": runners,
+            }
+        )
+    messages.append({"op": "mcm", "ct": "SUB_IMAGE", "pt": pt, "mc": image})
+
+    for _ in range(updates):
+        pt += rng.randrange(50, 500)
+        m = rng.choice(matches)
+        sid = rng.choice(m["selection_ids"])
+        prices[sid] = max(round(prices[sid] + rng.choice([-0.02, 0.02]), 2), 1.01)
+        back_size, lay_size = round(rng.uniform(10, 5000), 2), round(
+            rng.uniform(10, 5000), 2
+        )
+        messages.append(
+            {
+                "op": "mcm",
+                "pt": pt,
+                "mc": [
+                    {
+                        "id": m["market_id"],
+                        "rc": [
+                            {
+                                "id": sid,
+                                "batb": [[0, prices[sid], back_size]],
+                                "batl": [[0, round(prices[sid] + 0.02, 2), lay_size]],
+                                "ltp": prices[sid],
+                                "tv": round(rng.uniform(1e5, 1e6), 2),
+                            }
+                        ],
+                    }
+                ],
+            }
+        )
+
+    pt += 1000
+    messages.append(
+        {
+            "op": "mcm",
+            "pt": pt,
+            "mc": [
+                {"id": m["market_id"], "marketDefinition": definition(True, m)}
+                for m in matches
+            ],
+        }
+    )
+
+    with open(path, "w") as f:
+        for clk, message in enumerate(messages, start=1):
+            message["clk"] = str(clk)
+            f.write(json.dumps(message) + "\n")
+    return len(messages)
+
+
+def load_recording(path: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def make_handler(messages: List[Dict[str, Any]], speed: float):
+    class ReplayHandler(socketserver.StreamRequestHandler):
+        # Small writes would otherwise wait on the client's delayed ACKs
+        disable_nagle_algorithm = True
+
+        def send(self, message: Dict[str, Any]):
+            self.wfile.write(json.dumps(message).encode("utf-8") + b"\r\n")
+            self.wfile.flush()
+
+        def play(
+            self, subscription_id: int, market_ids: List[str], resume_clk: str = None
+        ):
+            start = 0
+            if resume_clk is not None:
+                # Resume after the last message the client saw
+                for i, message in enumerate(messages):
+                    if message.get("clk") == resume_clk:
+                        start = i + 1
+                        break
+
+            wanted = set(market_ids)
+            previous_pt = None
+            for message in messages[start:]:
+                if speed and previous_pt is not None and "pt" in message:
+                    time.sleep(max(message["pt"] - previous_pt, 0) / 1000 / speed)
+                previous_pt = message.get("pt", previous_pt)
+                mc = [
+                    m for m in message.get("mc", []) if not wanted or m["id"] in wanted
+                ]
+                if mc:
+                    self.send(dict(message, id=subscription_id, mc=mc))
+
+            while True:
+                time.sleep(HEARTBEAT_SECONDS)
+                self.send({"op": "mcm", "id": subscription_id, "ct": "HEARTBEAT"})
+
+        def handle(self):
+            self.send({"op": "connection", "connectionId": "replay"})
+            try:
+                for line in self.rfile:
+                    request = json.loads(line)
+                    status = {
+                        "op": "status",
+                        "id": request.get("id"),
+                        "statusCode": "SUCCESS",
+                    }
+                    if request.get("op") == "authentication":
+                        self.send(dict(status, connectionClosed=False))
+                    elif request.get("op") == "marketSubscription":
+                        self.send(dict(status, connectionClosed=False))
+                        self.play(
+                            request["id"],
+                            request.get("marketFilter", {}).get("marketIds", []),
+                            request.get("clk"),
+                        )
+                    elif request.get("op") == "heartbeat":
+                        self.send(status)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    return ReplayHandler
+
+
+def serve(
+    recording: str, host: str = "127.0.0.1", port: int = 8790, speed: float = 0.0
+) -> socketserver.ThreadingTCPServer:
+    """Create (but do not start) a replay server; speed 0 plays as fast as possible"""
+    server = socketserver.ThreadingTCPServer(
+        (host, port), make_handler(load_recording(recording), speed)
+    )
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Local Betfair Exchange Stream replay server"
+    )
+    parser.add_argument(
+        "--recording", help="Recorded mcm messages, one JSON object per line"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="Playback speed relative to the recorded timestamps; 0 for no delays",
+    )
+    parser.add_argument(
+        "--generate",
+        metavar="PATH",
+        help="Write a synthetic recording of the stub's matches to PATH and exit",
+    )
+    parser.add_argument("--matches", type=int, default=10)
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.generate:
+        count = generate_recording(args.generate, args.matches, args.updates, args.seed)
+        print(f"Wrote {count} messages to {args.generate}")
+    elif args.recording:
+        server = serve(args.recording, args.host, args.port, args.speed)
+        print(f"Replaying {args.recording} on {args.host}:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+    else:
+        parser.error("one of --recording or --generate is required")
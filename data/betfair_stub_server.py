@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Local stub of the Betfair Exchange JSON-RPC API
+
+Serves canned Premier League competitions, events, MATCH_ODDS catalogues and
+market books so the odds collector can be run and timed offline. Connections
+are HTTP/1.1 keep-alive, like the real API.
+
+Usage:
+    python betfair_stub_server.py --init-dbs /tmp/stub     # Matching odds, fixtures DBs
+    python betfair_stub_server.py --port 8765 --latency 0.2
+    python betfair_stub_server.py --error-rate 0.2 --timeout-rate 0.05   # Inject faults
+
+    BETFAIR_API_KEY=stub python betfair_odds_collector.py --async \
+        --api-url http://127.0.0.1:8765/exchange/betting/json-rpc/v1 \
+        --session-token stub \
+        --db-path /tmp/stub/premier_league_odds.db \
+        --fixtures-db-path /tmp/stub/premier_league_2025_26.db
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Any
+
+from utils import team_name_mapping_sl
+
+COMPETITION_ID = "10932509"
+COMPETITION_NAME = "English Premier League"
+
+
+def stub_matches(num_matches: int = 10) -> List[Dict[str, Any]]:
+    """Build one round of fixtures between the Betfair team names"""
+    teams = sorted(team_name_mapping_sl)
+    start = datetime(2025, 9, 13, 14, 0)
+    matches = []
+    for i in range(min(num_matches, len(teams) // 2)):
+        home_team, away_team = teams[2 * i], teams[2 * i + 1]
+        matches.append(
+            {
+                "event_id": str(34000000 + i),
+                "market_id": f"1.{245000000 + i}",
+                "match_id": 537000 + i,
+                "home_team": home_team,
+                "away_team": away_team,
+                "open_date": (start + timedelta(hours=i)).strftime(
+                    "%Y-%m-%dT%H:%M:%S.000Z"
+                ),
+                "selection_ids": [1000 + 3 * i, 1001 + 3 * i, 58805],
+            }
+        )
+    return matches
+
+
+class StubBetfair:
+    """In-memory state behind the stub JSON-RPC endpoint"""
+
+    def __init__(
+        self,
+        num_matches: int = 10,
+        latency: float = 0.0,
+        seed: int = 0,
+        error_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        stall: float = 60.0,
+    ):
+        self.matches = stub_matches(num_matches)
+        self.latency = latency
+        self.random = random.Random(seed)
+        # Fault injection: the fraction of requests answered with a 429, and
+        # the fraction held for stall seconds so the client times out
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.stall = stall
+        self.faults = random.Random(seed + 1)
+        self.by_event = {m["event_id"]: m for m in self.matches}
+        self.by_market = {m["market_id"]: m for m in self.matches}
+
+    def list_competitions(self, params):
+        return [
+            {
+                "competition": {"id": COMPETITION_ID, "name": COMPETITION_NAME},
+                "marketCount": len(self.matches),
+                "competitionRegion": "GBR",
+            }
+        ]
+
+    def list_events(self, params):
+        return [
+            {
+                "event": {
+                    "id": m["event_id"],
+                    "name": f"{m['home_team']} v {m['away_team']}",
+                    "countryCode": "GB",
+                    "timezone": "GMT",
+                    "openDate": m["open_date"],
+                },
+                "marketCount": 1,
+            }
+            for m in self.matches
+        ]
+
+    def list_market_catalogue(self, params):
+        event_ids = params.get("filter", {}).get("eventIds", list(self.by_event))
+        markets = []
+        for event_id in event_ids[: params.get("maxResults", 1000)]:
+            m = self.by_event.get(event_id)
+            if m is None:
+                continue
+            names = [m["home_team"], m["away_team"], "The Draw"]
+            markets.append(
+                {
+                    "marketId": m["market_id"],
+                    "marketName": "Match Odds",
+                    "totalMatched": 0.0,
+                    "event": {
+                        "id": m["event_id"],
+                        "name": f"{m['home_team']} v {m['away_team']}",
+                        "openDate": m["open_date"],
+                    },
+                    "competition": {"id": COMPETITION_ID, "name": COMPETITION_NAME},
+                    "eventType": {"id": "1", "name": "Soccer"},
+                    "runners": [
+                        {"selectionId": sid, "runnerName": name, "sortPriority": i + 1}
+                        for i, (sid, name) in enumerate(zip(m["selection_ids"], names))
+                    ],
+                }
+            )
+        return markets
+
+    def _ladder(
+        self, price: float, side: int, levels: int = 3
+    ) -> List[Dict[str, float]]:
+        return [
+            {
+                "price": round(price + side * 0.02 * level, 2),
+                "size": round(self.random.uniform(10, 5000), 2),
+            }
+            for level in range(levels)
+        ]
+
+    def list_market_book(self, params):
+        price_data = params.get("priceProjection", {}).get("priceData", [])
+        # EX_ALL_OFFERS returns the whole ladder rather than the best three levels
+        levels = 10 if "EX_ALL_OFFERS" in price_data else 3
+        books = []
+        for market_id in params.get("marketIds", []):
+            m = self.by_market.get(market_id)
+            if m is None:
+                continue
+            runners = []
+            for sid in m["selection_ids"]:
+                back = round(self.random.uniform(1.5, 8.0), 2)
+                runners.append(
+                    {
+                        "selectionId": sid,
+                        "handicap": 0.0,
+                        "status": "ACTIVE",
+                        "lastPriceTraded": back,
+                        "totalMatched": round(self.random.uniform(1e3, 1e6), 2),
+                        "ex": {
+                            "availableToBack": self._ladder(back, -1, levels),
+                            "availableToLay": self._ladder(back + 0.02, 1, levels),
+                            "tradedVolume": (
+                                self._ladder(back, 1, 5)
+                                if "EX_TRADED" in price_data
+                                else []
+                            ),
+                        },
+                    }
+                )
+            books.append(
+                {
+                    "marketId": market_id,
+                    "isMarketDataDelayed": False,
+                    "status": "OPEN",
+                    "inplay": False,
+                    "totalMatched": sum(r["totalMatched"] for r in runners),
+                    "runners": runners,
+                }
+            )
+        return books
+
+    def dispatch(self, method: str, params: Dict[str, Any]):
+        handlers = {
+            "SportsAPING/v1.0/listCompetitions": self.list_competitions,
+            "SportsAPING/v1.0/listEvents": self.list_events,
+            "SportsAPING/v1.0/listMarketCatalogue": self.list_market_catalogue,
+            "SportsAPING/v1.0/listMarketBook": self.list_market_book,
+        }
+        if method not in handlers:
+            raise KeyError(method)
+        return handlers[method](params)
+
+
+def make_handler(stub: StubBetfair):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, payload: Any, headers: Dict[str, str] = None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length))
+
+            if stub.latency:
+                time.sleep(stub.latency)
+
+            fault = stub.faults.random()
+            if fault < stub.error_rate:
+                self._send_json(
+                    429,
+                    {"faultcode": "Client", "faultstring": "TOO_MANY_REQUESTS"},
+                    {"Retry-After": "1"},
+                )
+                return
+            if fault < stub.error_rate + stub.timeout_rate:
+                # Never answer; the client gives up after its own timeout
+                time.sleep(stub.stall)
+                self.close_connection = True
+                return
+
+            if not self.headers.get("X-Authentication"):
+                self._send_json(
+                    400,
+                    {
+                        "faultcode": "Client",
+                        "faultstring": "INVALID_SESSION_INFORMATION",
+                    },
+                )
+                return
+
+            try:
+                result = stub.dispatch(request["method"], request.get("params", {}))
+            except KeyError:
+                self._send_json(
+                    200,
+                    {
+                        "jsonrpc": "2.0",
+                        "error": {"code": -32601, "message": "DSC-0021"},
+                        "id": request.get("id"),
+                    },
+                )
+                return
+
+            self._send_json(
+                200, {"jsonrpc": "2.0", "result": result, "id": request.get("id")}
+            )
+
+    return StubHandler
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    num_matches: int = 10,
+    latency: float = 0.0,
+    seed: int = 0,
+    error_rate: float = 0.0,
+    timeout_rate: float = 0.0,
+    stall: float = 60.0,
+) -> ThreadingHTTPServer:
+    """Create (but do not start) a stub server; call serve_forever() on the result"""
+    stub = StubBetfair(
+        num_matches=num_matches,
+        latency=latency,
+        seed=seed,
+        error_rate=error_rate,
+        timeout_rate=timeout_rate,
+        stall=stall,
+    )
+    server = ThreadingHTTPServer((host, port), make_handler(stub))
+    server.daemon_threads = True
+    return server
+
+
+def init_stub_databases(directory: str, num_matches: int = 10):
+    """Create an empty odds DB and a fixtures DB matching the stub's events"""
+    from init_dbs import init_odds_database
+
+    sys.path.insert(
+        0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts")
+    )
+    from premier_league_fixtures import PremierLeagueFixtures
+
+    os.makedirs(directory, exist_ok=True)
+    init_odds_database(os.path.join(directory, "premier_league_odds.db"))
+
+    fixtures_db = PremierLeagueFixtures(
+        os.path.join(directory, "premier_league_2025_26.db")
+    )
+    fixtures_db.create_database()
+    fixtures_db.insert_fixtures(
+        [
+            {
+                "id": m["match_id"],
+                "matchday": 4,
+                "utcDate": m["open_date"].replace(".000", ""),
+                "status": "TIMED",
+                "homeTeam": {"name": team_name_mapping_sl[m["home_team"]]},
+                "awayTeam": {"name": team_name_mapping_sl[m["away_team"]]},
+                "score": {"fullTime": {"home": None, "away": None}},
+            }
+            for m in stub_matches(num_matches)
+        ]
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Betfair JSON-RPC stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--matches", type=int, default=10, help="Number of events")
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds to delay every response"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Price generator seed")
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of requests answered with a 429",
+    )
+    parser.add_argument(
+        "--timeout-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of requests held for --stall seconds so the client times out",
+    )
+    parser.add_argument(
+        "--stall",
+        type=float,
+        default=60.0,
+        help="Seconds a timed-out request is held for",
+    )
+    parser.add_argument(
+        "--init-dbs",
+        metavar="DIR",
+        help="Create odds and fixtures databases matching the stub events, then exit",
+    )
+    args = parser.parse_args()
+
+    if args.init_dbs:
+        init_stub_databases(args.init_dbs, args.matches)
+    else:
+        server = serve(
+            args.host,
+            args.port,
+            args.matches,
+            args.latency,
+            args.seed,
+            args.error_rate,
+            args.timeout_rate,
+            args.stall,
+        )
+        print(
+            f"Stub Betfair API on "
+            f"http://{args.host}:{args.port}/exchange/betting/json-rpc/v1"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
@@ -0,0 +1,101 @@
+"""
+Record and replay transports for BetfairClient
+
+BetfairClient sends every JSON-RPC call through a transport with the same
+post(body, headers) -> (status, body, headers) interface as ConnectionPool.
+RecordingTransport wraps a real pool and appends each request/response pair
+to a JSON lines file. ReplayTransport answers from such a file without any
+network or login, so collector runs can be benchmarked deterministically:
+
+    client = BetfairClient(session_token="replay", transport=ReplayTransport(path))
+"""
+
+import json
+import time
+import threading
+from collections import defaultdict
+from typing import Dict, List
+
+
+def request_key(body: bytes) -> str:
+    """Identify a JSON-RPC request by its method and params (not its id)"""
+    request = json.loads(body)
+    return json.dumps([request["method"], request.get("params")], sort_keys=True)
+
+
+class RecordingTransport:
+    """Passes requests to another transport and records every exchange"""
+
+    def __init__(self, transport, path: str):
+        self.transport = transport
+        self.file = open(path, "a")
+        self.lock = threading.Lock()
+
+    def post(self, body: bytes, headers: Dict[str, str]) -> tuple:
+        start = time.perf_counter()
+        status, data, response_headers = self.transport.post(body, headers)
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.file.write(
+                json.dumps(
+                    {
+                        "request": json.loads(body),
+                        "status": status,
+                        "response": data.decode("utf-8"),
+                        "elapsed": round(elapsed, 6),
+                    }
+                )
+                + "\n"
+            )
+            self.file.flush()
+        return status, data, response_headers
+
+    def close(self):
+        self.transport.close()
+        self.file.close()
+
+
+class ReplayTransport:
+    """Answers requests from a RecordingTransport file
+
+    Responses to identical requests are replayed in recorded order and then
+    cycle, so a recording of a few sweeps can drive any number of them.
+    speed scales the recorded response times (2 replays twice as fast); 0
+    replays as fast as possible.
+    """
+
+    def __init__(self, path: str, speed: float = 0.0):
+        self.speed = speed
+        self.responses: Dict[str, List[tuple]] = defaultdict(list)
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                exchange = json.loads(line)
+                key = request_key(json.dumps(exchange["request"]).encode("utf-8"))
+                self.responses[key].append(
+                    (
+                        exchange["status"],
+                        exchange["response"].encode("utf-8"),
+                        exchange.get("elapsed", 0.0),
+                    )
+                )
+        self.next_index: Dict[str, int] = defaultdict(int)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def post(self, body: bytes, headers: Dict[str, str]) -> tuple:
+        key = request_key(body)
+        with self.lock:
+            recorded = self.responses.get(key)
+            if not recorded:
+                raise KeyError(f"No recorded response for {key}")
+            status, data, elapsed = recorded[self.next_index[key] % len(recorded)]
+            self.next_index[key] += 1
+            self.requests += 1
+        if self.speed:
+            time.sleep(elapsed / self.speed)
+        return status, data, {}
+
+    def close(self):
+        pass
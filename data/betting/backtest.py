@@ -0,0 +1,384 @@
+"""
+Backtest betting strategies over the stored odds history
+
+load_snapshots() reads every odds row and odds_coverage session into one
+dense set of NumPy arrays, one row per runner per collection session. Runners
+whose odds were not re-stored in a session (changes-only collection) carry
+their previous odds forward. A strategy is a function of those arrays that
+returns the BACK and LAY stake to place on every row:
+
+    def strategy(snapshots: Snapshots, **params) -> Stakes
+
+run_backtest() prices the stakes at the snapshot's best back or lay price
+and settles them against the fixtures results by the same rules as
+SETTLE_BETS_SQL, all in memory with no writes to the bets database.
+bets_frame() turns the result into bets-table style rows. sweep.py runs
+grids of strategy parameters in parallel.
+
+Usage:
+    python backtest.py --strategy back_favourite
+    python backtest.py --strategy price_move --param threshold=0.05 --param stake=5
+"""
+
+import os
+import sys
+import time
+import argparse
+from contextlib import closing
+from typing import Callable, Dict, NamedTuple
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import connect
+from betting.book import runner_outcomes
+
+# runner_type is stored as an index into RUNNER_TYPES
+RUNNER_TYPES = ["Home win", "Away win", "Draw"]
+HOME_WIN, AWAY_WIN, DRAW = range(len(RUNNER_TYPES))
+
+# Same stake range as BookmakerSimulator.place_bet
+MAX_BET_AMOUNT = 1000.0
+
+ODDS_HISTORY_QUERY = """
+    SELECT match_id, selection_id, runner_type, request_time, best_back_price,
+        best_back_size, best_lay_price, best_lay_size, last_price_traded, total_matched
+    FROM odds
+"""
+
+PRICE_COLUMNS = [
+    "best_back_price",
+    "best_back_size",
+    "best_lay_price",
+    "best_lay_size",
+    "last_price_traded",
+    "total_matched",
+]
+
+
+class Snapshots(NamedTuple):
+    """One row per runner per collection session, ordered by match, time, selection"""
+
+    match_id: np.ndarray  # int64
+    selection_id: np.ndarray  # int64
+    runner_type: np.ndarray  # int8 index into RUNNER_TYPES
+    request_time: np.ndarray  # datetime64[ns]
+    runner: np.ndarray  # int64, dense id per (match_id, selection_id)
+    snapshot: np.ndarray  # int64, dense id per (match_id, request_time)
+    last_snapshot: np.ndarray  # bool, the match's final collection session
+    best_back_price: np.ndarray  # float64, NaN before a runner's first odds
+    best_back_size: np.ndarray
+    best_lay_price: np.ndarray
+    best_lay_size: np.ndarray
+    last_price_traded: np.ndarray
+    total_matched: np.ndarray
+
+
+class Results(NamedTuple):
+    """Per Snapshots row: whether the match has finished and the runner won it"""
+
+    settled: np.ndarray
+    won: np.ndarray
+
+
+class Stakes(NamedTuple):
+    """BACK and LAY stake per Snapshots row; 0 places no bet"""
+
+    back: np.ndarray
+    lay: np.ndarray
+
+
+def build_snapshots(odds: pd.DataFrame, coverage: pd.DataFrame) -> Snapshots:
+    """Forward-fill stored odds over every session in odds_coverage"""
+    odds = odds.copy()
+    coverage = coverage.copy()
+    odds["request_time"] = pd.to_datetime(odds["request_time"], format="ISO8601")
+    coverage["request_time"] = pd.to_datetime(
+        coverage["request_time"], format="ISO8601"
+    )
+
+    runners = odds.drop_duplicates(["match_id", "selection_id"])[
+        ["match_id", "selection_id", "runner_type"]
+    ]
+    grid = coverage.merge(runners, on="match_id").sort_values("request_time")
+    dense = pd.merge_asof(
+        grid,
+        odds.drop(columns="runner_type").sort_values("request_time"),
+        on="request_time",
+        by=["match_id", "selection_id"],
+    )
+    dense = dense.sort_values(
+        ["match_id", "request_time", "selection_id"], ignore_index=True
+    )
+
+    snapshot = dense.groupby(["match_id", "request_time"], sort=False).ngroup()
+    last_time = dense.groupby("match_id")["request_time"].transform("max")
+
+    return Snapshots(
+        match_id=dense["match_id"].to_numpy(np.int64),
+        selection_id=dense["selection_id"].to_numpy(np.int64),
+        runner_type=pd.Categorical(
+            dense["runner_type"], categories=RUNNER_TYPES
+        ).codes.astype(np.int8),
+        request_time=dense["request_time"].to_numpy("datetime64[ns]"),
+        runner=dense.groupby(["match_id", "selection_id"]).ngroup().to_numpy(np.int64),
+        snapshot=snapshot.to_numpy(np.int64),
+        last_snapshot=(dense["request_time"] == last_time).to_numpy(),
+        **{column: dense[column].to_numpy(np.float64) for column in PRICE_COLUMNS},
+    )
+
+
+def load_snapshots(odds_db_path: str) -> Snapshots:
+    with closing(connect(odds_db_path, readonly=True)) as odds_db_conn:
+        odds = pd.read_sql_query(ODDS_HISTORY_QUERY, odds_db_conn)
+        coverage = pd.read_sql_query(
+            "SELECT match_id, request_time FROM odds_coverage", odds_db_conn
+        )
+    return build_snapshots(odds, coverage)
+
+
+def load_results(fixtures_db_path: str, snapshots: Snapshots) -> Results:
+    """Settle each snapshot row against the finished fixtures"""
+    with closing(connect(fixtures_db_path, readonly=True)) as fixtures_db_conn:
+        finished = pd.read_sql_query(
+            """
+            SELECT match_id, home_score, away_score FROM fixtures
+            WHERE status = 'FINISHED'
+            """,
+            fixtures_db_conn,
+        )
+    outcomes = pd.Series(
+        pd.Categorical(runner_outcomes(finished), categories=RUNNER_TYPES).codes,
+        index=finished["match_id"].to_numpy(np.int64),
+    )
+    outcome = pd.Series(snapshots.match_id).map(outcomes).to_numpy()
+
+    settled = ~np.isnan(outcome)
+    return Results(settled=settled, won=settled & (outcome == snapshots.runner_type))
+
+
+def settle(
+    is_back: np.ndarray,
+    bet_won: np.ndarray,
+    bet_amount: np.ndarray,
+    selection_odds: np.ndarray,
+) -> np.ndarray:
+    """returned_amount of each bet, as SETTLE_BETS_SQL computes it
+
+    Winning backs return bet_amount * selection_odds and losing backs 0, so
+    a back's profit is returned_amount - bet_amount. Lays return their
+    profit directly: bet_amount when won, -bet_amount * (selection_odds - 1)
+    when lost.
+    """
+    return np.where(
+        is_back,
+        np.where(bet_won, bet_amount * selection_odds, 0.0),
+        np.where(bet_won, bet_amount, -bet_amount * (selection_odds - 1)),
+    )
+
+
+class Bets(NamedTuple):
+    """Simulated bets as arrays; rows indexes the Snapshots row each was placed at
+
+    bet_won, returned_amount and profit are only meaningful where settled.
+    """
+
+    rows: np.ndarray
+    is_back: np.ndarray
+    bet_amount: np.ndarray
+    selection_odds: np.ndarray
+    settled: np.ndarray
+    bet_won: np.ndarray
+    returned_amount: np.ndarray
+    profit: np.ndarray
+
+
+def run_backtest(
+    snapshots: Snapshots, results: Results, strategy: Callable[..., Stakes], **params
+) -> Bets:
+    """Place and settle every stake the strategy returns
+
+    Stakes outside place_bet's range, or on a side with no price, are
+    dropped. Bets on matches that have not finished are left unsettled.
+    """
+    stakes = strategy(snapshots, **params)
+
+    sides = []
+    for is_back, stake, price in (
+        (True, stakes.back, snapshots.best_back_price),
+        (False, stakes.lay, snapshots.best_lay_price),
+    ):
+        rows = np.flatnonzero((stake > 0) & (stake < MAX_BET_AMOUNT) & ~np.isnan(price))
+        sides.append((rows, np.full(len(rows), is_back), stake[rows], price[rows]))
+    rows, is_back, bet_amount, selection_odds = (
+        np.concatenate(arrays) for arrays in zip(*sides)
+    )
+
+    bet_won = results.won[rows] == is_back
+    returned_amount = settle(is_back, bet_won, bet_amount, selection_odds)
+    return Bets(
+        rows=rows,
+        is_back=is_back,
+        bet_amount=bet_amount,
+        selection_odds=selection_odds,
+        settled=results.settled[rows],
+        bet_won=bet_won,
+        returned_amount=returned_amount,
+        profit=returned_amount - np.where(is_back, bet_amount, 0.0),
+    )
+
+
+def bets_frame(snapshots: Snapshots, bets: Bets) -> pd.DataFrame:
+    """Bets as bets-table style rows; unsettled bets are PLACED with no result"""
+    settled = bets.settled
+    return pd.DataFrame(
+        {
+            "match_id": snapshots.match_id[bets.rows],
+            "selection_id": snapshots.selection_id[bets.rows],
+            "runner_type": np.array(RUNNER_TYPES)[snapshots.runner_type[bets.rows]],
+            "request_time": snapshots.request_time[bets.rows],
+            "back_or_lay": np.where(bets.is_back, "BACK", "LAY"),
+            "bet_amount": bets.bet_amount,
+            "selection_odds": bets.selection_odds,
+            "status": np.where(settled, "SETTLED", "PLACED"),
+            "bet_won": pd.array(np.where(settled, bets.bet_won, None), dtype="boolean"),
+            "returned_amount": np.where(settled, bets.returned_amount, np.nan),
+            "profit": np.where(settled, bets.profit, np.nan),
+        }
+    ).sort_values(["match_id", "request_time", "selection_id"], ignore_index=True)
+
+
+def summarize(bets: Bets) -> Dict[str, float]:
+    """Totals over the settled bets; roi is profit per unit of bet_amount"""
+    settled = bets.settled
+    staked = float(bets.bet_amount[settled].sum())
+    profit = float(bets.profit[settled].sum())
+    return {
+        "bets": len(bets.rows),
+        "settled": int(settled.sum()),
+        "staked": staked,
+        "profit": profit,
+        "roi": profit / staked if staked else 0.0,
+        "hit_rate": float(bets.bet_won[settled].mean()) if settled.any() else 0.0,
+    }
+
+
+def back_favourite(
+    snapshots: Snapshots, stake: float = 10.0, at_close: bool = True
+) -> Stakes:
+    """Back the shortest-priced runner of each match's last snapshot (or every one)"""
+    price = np.where(
+        np.isnan(snapshots.best_back_price), np.inf, snapshots.best_back_price
+    )
+    order = np.lexsort((price, snapshots.snapshot))
+    _, first = np.unique(snapshots.snapshot[order], return_index=True)
+    favourites = order[first]
+    favourites = favourites[np.isfinite(price[favourites])]
+    if at_close:
+        favourites = favourites[snapshots.last_snapshot[favourites]]
+
+    back = np.zeros(len(price))
+    back[favourites] = stake
+    return Stakes(back=back, lay=np.zeros(len(price)))
+
+
+def price_move(
+    snapshots: Snapshots,
+    threshold: float = 0.1,
+    stake: float = 10.0,
+    side: str = "both",
+) -> Stakes:
+    """Back runners whose back price drifted by more than threshold since the
+    previous snapshot, and lay those that shortened by more than it
+
+    side limits the bets to "back" or "lay".
+    """
+    previous = (
+        pd.Series(snapshots.best_back_price)
+        .groupby(snapshots.runner)
+        .shift()
+        .to_numpy()
+    )
+    change = snapshots.best_back_price / previous - 1
+    return Stakes(
+        back=np.where((change > threshold) & (side != "lay"), stake, 0.0),
+        lay=np.where((change < -threshold) & (side != "back"), stake, 0.0),
+    )
+
+
+STRATEGIES = {
+    "back_favourite": back_favourite,
+    "price_move": price_move,
+}
+
+
+def parse_value(value: str):
+    """A command line parameter value as a bool (true/false), a float, or the string"""
+    if value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def parse_params(pairs) -> Dict[str, object]:
+    """--param key=value pairs as strategy keyword arguments"""
+    params = {}
+    for pair in pairs:
+        key, _, value = pair.partition("=")
+        params[key] = parse_value(value)
+    return params
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Backtest a strategy over the odds history"
+    )
+    parser.add_argument(
+        "--strategy", choices=sorted(STRATEGIES), default="back_favourite"
+    )
+    parser.add_argument(
+        "--param",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Strategy parameter, e.g. stake=5 or at_close=false (repeatable)",
+    )
+    parser.add_argument(
+        "--odds-db-path",
+        default="/Users/rdmgray/Projects/EPLpal/data/premier_league_odds.db",
+    )
+    parser.add_argument(
+        "--fixtures-db-path",
+        default="/Users/rdmgray/Projects/EPLpal/data/premier_league_2025_26.db",
+    )
+    parser.add_argument("--output", help="Write every simulated bet to this CSV file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    snapshots = load_snapshots(args.odds_db_path)
+    results = load_results(args.fixtures_db_path, snapshots)
+    print(
+        f"Loaded {len(snapshots.match_id)} runner snapshots across "
+        f"{len(np.unique(snapshots.match_id))} matches in "
+        f"{time.perf_counter() - start:.2f}s"
+    )
+
+    start = time.perf_counter()
+    bets = run_backtest(
+        snapshots, results, STRATEGIES[args.strategy], **parse_params(args.param)
+    )
+    print(f"Ran {args.strategy} in {time.perf_counter() - start:.2f}s")
+
+    for key, value in summarize(bets).items():
+        print(
+            f"  {key}: {value:,.4g}"
+            if isinstance(value, float)
+            else f"  {key}: {value:,}"
+        )
+
+    if args.output:
+        bets_frame(snapshots, bets).to_csv(args.output, index=False)
+        print(f"Wrote {len(bets.rows)} bets to {args.output}")
@@ -1,39 +1,340 @@
+import os
+import sys
+import json
 import sqlite3
+import argparse
 from contextlib import closing
+from typing import Dict, Iterable, NamedTuple, Optional
+import numpy as np
 import pandas as pd
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import connect
+
+
+BET_REQUEST_COLUMNS = [
+    "bettor_id",
+    "match_id",
+    "selection_id",
+    "back_or_lay",
+    "bet_amount",
+]
+
+# Settlement applies one row per match from a temp table to every PLACED bet
+CREATE_SETTLEMENT_TABLE_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS settlement (
+        match_id INTEGER PRIMARY KEY,
+        winning_selection_id INTEGER NOT NULL,
+        runner_outcome TEXT NOT NULL
+    )
+"""
+
+# What settlement pays out on a bet in the settlement temp table (s), see settle_matches
+RETURNED_AMOUNT_SQL = """
+    CASE
+        WHEN bets.back_or_lay = 'BACK' AND bets.selection_id = s.winning_selection_id
+            THEN bets.bet_amount * bets.selection_odds
+        WHEN bets.back_or_lay = 'BACK' THEN 0
+        WHEN bets.selection_id <> s.winning_selection_id THEN bets.bet_amount
+        ELSE -bets.bet_amount * (bets.selection_odds - 1)
+    END
+"""
+
+SETTLE_BETS_SQL = f"""
+    UPDATE bets
+    SET status = 'SETTLED',
+        runner_outcome = s.runner_outcome,
+        bet_won = CASE
+            WHEN bets.back_or_lay = 'BACK'
+                THEN bets.selection_id = s.winning_selection_id
+            ELSE bets.selection_id <> s.winning_selection_id
+        END,
+        returned_amount = {RETURNED_AMOUNT_SQL}
+    FROM settlement s
+    WHERE bets.match_id = s.match_id
+    AND bets.back_or_lay IN ('BACK', 'LAY')
+    AND bets.status = 'PLACED'
+"""
+
+# Most a PLACED bet can lose: the stake of a BACK, the payout of a LAY
+LIABILITY_SQL = """
+    CASE WHEN bets.back_or_lay = 'BACK' THEN bets.bet_amount
+        ELSE bets.bet_amount * (bets.selection_odds - 1) END
+"""
+
+ADD_EXPOSURE_SQL = """
+    INSERT INTO bettor_exposure (bettor_id, match_id, selection_id, liability)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (bettor_id, match_id, selection_id)
+    DO UPDATE SET liability = liability + excluded.liability
+"""
+
+ADJUST_BALANCE_SQL = """
+    INSERT INTO bettor_balances (bettor_id, balance, exposure)
+    VALUES (?, ?, ?)
+    ON CONFLICT (bettor_id)
+    DO UPDATE SET
+        balance = balance + excluded.balance,
+        exposure = exposure + excluded.exposure
+"""
+
+# Run before SETTLE_BETS_SQL: credits each bettor the profit of the bets it is
+# about to settle and releases their liability. Settlement settles every
+# PLACED bet on a match, so the match's exposure rows can simply be dropped
+SETTLE_LEDGER_SQL = [
+    f"""
+    INSERT INTO bettor_balances (bettor_id, balance, exposure)
+    SELECT bets.bettor_id,
+        SUM(
+            {RETURNED_AMOUNT_SQL}
+            - CASE WHEN bets.back_or_lay = 'BACK' THEN bets.bet_amount ELSE 0 END
+        ),
+        -SUM({LIABILITY_SQL})
+    FROM bets
+    JOIN settlement s ON bets.match_id = s.match_id
+    WHERE bets.back_or_lay IN ('BACK', 'LAY')
+    AND bets.status = 'PLACED'
+    GROUP BY bets.bettor_id
+    ON CONFLICT (bettor_id)
+    DO UPDATE SET
+        balance = balance + excluded.balance,
+        exposure = exposure + excluded.exposure
+    """,
+    "DELETE FROM bettor_exposure WHERE match_id IN (SELECT match_id FROM settlement)",
+]
+
+
+def runner_outcomes(fixtures: pd.DataFrame) -> np.ndarray:
+    """The winning runner_type (Home win, Away win or Draw) of each fixture by score"""
+    return np.select(
+        [
+            fixtures["home_score"] > fixtures["away_score"],
+            fixtures["away_score"] > fixtures["home_score"],
+        ],
+        ["Home win", "Away win"],
+        default="Draw",
+    )
+
+
+def bet_liability(back_or_lay: str, bet_amount: float, selection_odds: float) -> float:
+    """Python version of LIABILITY_SQL for one bet"""
+    if back_or_lay == "BACK":
+        return bet_amount
+    return bet_amount * (selection_odds - 1)
+
+
+def valid_price(price) -> bool:
+    """Whether a quoted price can be bet at: present and above 1, the lowest odds"""
+    return price is not None and price > 1
+
+
+def add_to_ledger(bets_db_conn: sqlite3.Connection, bets: pd.DataFrame):
+    """Add each bet's liability (negative to release it) to the exposure ledger"""
+    if bets.empty:
+        return
+    exposures = bets.groupby(["bettor_id", "match_id", "selection_id"], as_index=False)[
+        "liability"
+    ].sum()
+    bets_db_conn.executemany(
+        ADD_EXPOSURE_SQL,
+        zip(
+            exposures["bettor_id"].tolist(),
+            exposures["match_id"].tolist(),
+            exposures["selection_id"].tolist(),
+            exposures["liability"].tolist(),
+        ),
+    )
+    totals = bets.groupby("bettor_id", as_index=False)["liability"].sum()
+    bets_db_conn.executemany(
+        ADJUST_BALANCE_SQL,
+        zip(
+            totals["bettor_id"].tolist(),
+            [0.0] * len(totals),
+            totals["liability"].tolist(),
+        ),
+    )
+
+
+class Ledger(NamedTuple):
+    balance: float  # realized profit of settled bets
+    exposure: float  # liability of PLACED bets
+
+
+class Quote(NamedTuple):
+    runner_name: str
+    runner_type: str
+    best_back_price: Optional[float]
+    best_lay_price: Optional[float]
+
+
+class QuoteStore:
+    """Latest odds indexed by (match_id, selection_id) for O(1) lookups
+
+    Odds are read from latest_odds one match at a time, the first time a
+    match is looked up, and kept until invalidate() is called for it.
+    """
+
+    def __init__(self, odds_db_path: str):
+        self.odds_db_path = odds_db_path
+        self.matches: Dict[int, Dict[int, Quote]] = {}
+
+    def load(self, match_ids: Iterable[int]):
+        """Read the quotes of any of these matches not already loaded"""
+        missing = {int(match_id) for match_id in match_ids} - self.matches.keys()
+        if not missing:
+            return
+        with closing(connect(self.odds_db_path)) as odds_db_conn:
+            rows = odds_db_conn.execute(
+                """
+                SELECT match_id, selection_id, runner_name, runner_type,
+                    best_back_price, best_lay_price
+                FROM latest_odds
+                WHERE match_id IN (SELECT value FROM json_each(?))
+                """,
+                (json.dumps(sorted(missing)),),
+            ).fetchall()
+        for match_id in missing:
+            self.matches[match_id] = {}
+        for match_id, selection_id, *quote in rows:
+            self.matches[match_id][selection_id] = Quote(*quote)
+
+    def invalidate(self, match_ids: Optional[Iterable[int]] = None):
+        """Forget the quotes of these matches (default all), e.g. after new odds"""
+        if match_ids is None:
+            self.matches.clear()
+            return
+        for match_id in match_ids:
+            self.matches.pop(int(match_id), None)
+
+    def get(self, match_id: int, selection_id: int) -> Optional[Quote]:
+        self.load([match_id])
+        return self.matches[int(match_id)].get(selection_id)
+
+    def __contains__(self, key) -> bool:
+        return self.get(*key) is not None
+
+    def frame(self, match_ids: Iterable[int]) -> pd.DataFrame:
+        """The quotes of these matches as match_id, selection_id and Quote columns"""
+        match_ids = {int(match_id) for match_id in match_ids}
+        self.load(match_ids)
+        return pd.DataFrame(
+            [
+                (match_id, selection_id, *quote)
+                for match_id in match_ids
+                for selection_id, quote in self.matches[match_id].items()
+            ],
+            columns=["match_id", "selection_id", *Quote._fields],
+        ).astype({"match_id": "int64", "selection_id": "int64"})
+
 
 class BookmakerSimulator:
+    """Places and settles simulated bets against the collected Betfair odds
 
-    def __init__(self):
-        self.odds_db_path = "/Users/rdmgray/Projects/EPLpal/data/premier_league_odds.db"
-        self.bets_db_path = "/Users/rdmgray/Projects/EPLpal/data/sim_bets.db"
-        self.fixtures_db_path = (
-            "/Users/rdmgray/Projects/EPLpal/data/premier_league_2025_26.db"
-        )
+    Nothing is read at construction. Quotes are loaded per match on first
+    use and fixtures are queried for just the matches being settled, so the
+    cost of a call depends on the matches it involves rather than the size
+    of the season. The odds and fixtures properties still load the full
+    tables, once, for callers that want everything. Call invalidate_odds()
+    when new odds have been collected, or refresh() to drop everything.
+    """
+
+    def __init__(
+        self,
+        odds_db_path: str = "/Users/rdmgray/Projects/EPLpal/data/premier_league_odds.db",
+        bets_db_path: str = "/Users/rdmgray/Projects/EPLpal/data/sim_bets.db",
+        fixtures_db_path: str = "/Users/rdmgray/Projects/EPLpal/data/premier_league_2025_26.db",
+        max_exposure: Optional[float] = None,
+    ):
+        self.odds_db_path = odds_db_path
+        self.bets_db_path = bets_db_path
+        self.fixtures_db_path = fixtures_db_path
+        # Most liability a bettor may have open across PLACED bets; None for no limit
+        self.max_exposure = max_exposure
+
+        self.quotes = QuoteStore(odds_db_path)
+        self.all_odds: Optional[pd.DataFrame] = None
+        self.all_fixtures: Optional[pd.DataFrame] = None
+
+    @property
+    def odds(self) -> pd.DataFrame:
+        """Every row of latest_odds, loaded on first use"""
+        if self.all_odds is None:
+            self.all_odds = self.get_latest_odds()
+        return self.all_odds
+
+    @property
+    def fixtures(self) -> pd.DataFrame:
+        """Every fixture, loaded on first use"""
+        if self.all_fixtures is None:
+            self.all_fixtures = self.get_all_fixtures()
+        return self.all_fixtures
 
-        self.odds = self.get_latest_odds()
-        self.fixtures = self.get_all_fixtures()
+    def invalidate_odds(self, match_ids: Optional[Iterable[int]] = None):
+        """Re-read the odds of these matches (default all) on next use"""
+        self.quotes.invalidate(match_ids)
+        self.all_odds = None
+
+    def refresh(self):
+        """Drop every cached odds and fixtures row"""
+        self.invalidate_odds()
+        self.all_fixtures = None
 
     def get_latest_odds(self):
-        with closing(sqlite3.connect(self.odds_db_path)) as odds_db_conn:
-            odds = pd.read_sql_query("SELECT * from odds", odds_db_conn)
-        # Get latest
-        odds = odds.loc[
-            odds.groupby(["match_id", "selection_id"])["request_time"].idxmax()
-        ]
+        # latest_odds holds the most recent odds row per (match_id, selection_id)
+        with closing(connect(self.odds_db_path)) as odds_db_conn:
+            odds = pd.read_sql_query("SELECT * from latest_odds", odds_db_conn)
         return odds
 
     def get_all_bets(self):
-        with closing(sqlite3.connect(self.bets_db_path)) as bets_db_conn:
+        with closing(connect(self.bets_db_path)) as bets_db_conn:
             bets = pd.read_sql_query("SELECT * from bets", bets_db_conn)
         return bets
 
+    def get_ledger(
+        self, bettor_id: int, bets_db_conn: sqlite3.Connection = None
+    ) -> Ledger:
+        """A bettor's balance and open exposure from the ledger"""
+        if bets_db_conn is None:
+            with closing(connect(self.bets_db_path, readonly=True)) as bets_db_conn:
+                return self.get_ledger(bettor_id, bets_db_conn)
+        row = bets_db_conn.execute(
+            "SELECT balance, exposure FROM bettor_balances WHERE bettor_id = ?",
+            (bettor_id,),
+        ).fetchone()
+        return Ledger(*row) if row else Ledger(0.0, 0.0)
+
+    def get_exposures(self, bettor_id: int) -> pd.DataFrame:
+        """Open liability per (match_id, selection_id) for one bettor"""
+        with closing(connect(self.bets_db_path, readonly=True)) as bets_db_conn:
+            return pd.read_sql_query(
+                """
+                SELECT match_id, selection_id, liability FROM bettor_exposure
+                WHERE bettor_id = ? AND liability > 0
+                ORDER BY match_id, selection_id
+                """,
+                bets_db_conn,
+                params=(bettor_id,),
+            )
+
     def get_all_fixtures(self):
-        with closing(sqlite3.connect(self.fixtures_db_path)) as fixtures_db_conn:
+        with closing(connect(self.fixtures_db_path)) as fixtures_db_conn:
             fixtures = pd.read_sql_query("SELECT * from fixtures", fixtures_db_conn)
         return fixtures
 
+    def get_fixtures(self, match_ids: Iterable[int]) -> pd.DataFrame:
+        """The fixtures rows of these matches, read fresh"""
+        with closing(connect(self.fixtures_db_path)) as fixtures_db_conn:
+            fixtures = pd.read_sql_query(
+                """
+                SELECT * FROM fixtures
+                WHERE match_id IN (SELECT value FROM json_each(?))
+                """,
+                fixtures_db_conn,
+                params=(json.dumps([int(match_id) for match_id in match_ids]),),
+            )
+        return fixtures
+
     def place_bet(
         self,
         bettor_id: int,
@@ -43,10 +344,11 @@ class BookmakerSimulator:
         bet_amount: float,
     ):
 
+        quote = self.quotes.get(match_id, selection_id)
+
         # Check the validity
         assert (
-            selection_id
-            in self.odds.loc[self.odds["match_id"] == match_id, "selection_id"].values
+            quote is not None
         ), f"Invalid selection_id {selection_id} for match_id {match_id}."
 
         assert (
@@ -55,42 +357,31 @@ class BookmakerSimulator:
 
         # Get selection odds
         if back_or_lay == "BACK":
-            selection_odds = self.odds.loc[
-                (
-                    (self.odds["selection_id"] == selection_id)
-                    & (self.odds["match_id"] == match_id)
-                ),
-                "best_back_price",
-            ].values[0]
+            selection_odds = quote.best_back_price
         elif back_or_lay == "LAY":
-            selection_odds = self.odds.loc[
-                (
-                    (self.odds["selection_id"] == selection_id)
-                    & (self.odds["match_id"] == match_id)
-                ),
-                "best_lay_price",
-            ].values[0]
+            selection_odds = quote.best_lay_price
         else:
             return f"Invalid value for back_or_lay, choose BACK or LAY."
 
-        runner_name = self.odds.loc[
-            (
-                (self.odds["selection_id"] == selection_id)
-                & (self.odds["match_id"] == match_id)
-            ),
-            "runner_name",
-        ].values[0]
-        runner_type = self.odds.loc[
-            (
-                (self.odds["selection_id"] == selection_id)
-                & (self.odds["match_id"] == match_id)
-            ),
-            "runner_type",
-        ].values[0]
-
-        # Insert new bet
-        with closing(sqlite3.connect(self.bets_db_path)) as bets_db_conn:
-            with closing(bets_db_conn.cursor()) as cursor:
+        assert valid_price(selection_odds), (
+            f"No valid {back_or_lay} price for selection_id {selection_id} "
+            f"in match_id {match_id}."
+        )
+
+        runner_name = quote.runner_name
+        runner_type = quote.runner_type
+        liability = bet_liability(back_or_lay, bet_amount, selection_odds)
+
+        # Insert new bet and update the ledger in one transaction
+        with closing(connect(self.bets_db_path)) as bets_db_conn:
+            with bets_db_conn, closing(bets_db_conn.cursor()) as cursor:
+                cursor.execute("BEGIN IMMEDIATE")
+                if self.max_exposure is not None:
+                    exposure = self.get_ledger(bettor_id, bets_db_conn).exposure
+                    assert exposure + liability <= self.max_exposure, (
+                        f"Exposure limit exceeded - bettor {bettor_id} would have "
+                        f"{exposure + liability:.2f} open, limit {self.max_exposure}."
+                    )
                 cursor.execute(
                     """
                             INSERT INTO bets (bettor_id, match_id, selection_id, runner_name, runner_type, back_or_lay, bet_amount, selection_odds, status)
@@ -109,151 +400,350 @@ class BookmakerSimulator:
                     ),
                 )
                 bet_id = cursor.lastrowid
-            bets_db_conn.commit()
+                cursor.execute(
+                    ADD_EXPOSURE_SQL, (bettor_id, match_id, selection_id, liability)
+                )
+                cursor.execute(ADJUST_BALANCE_SQL, (bettor_id, 0.0, liability))
 
         print(
             f"Bet placed: {back_or_lay} {bet_amount} on {runner_name}. Bet id {bet_id}."
         )
         return bet_id
 
-    def cancel_bet(self, bettor_id, bet_id):
+    def place_bets(self, bets) -> pd.DataFrame:
+        """Validate and place many bets at once
 
-        all_bets = self.get_all_bets()
+        bets is a DataFrame (or list of dicts) with bettor_id, match_id,
+        selection_id, back_or_lay and bet_amount columns. All bets are checked
+        against the latest odds in one pass, and the accepted ones are inserted
+        with a single executemany in one transaction, together with their
+        ledger updates. With max_exposure set, bets are accepted in order
+        until a bettor's limit is reached. Returns the input with a bet_id
+        column (None for rejected bets) and a rejection_reason column carrying
+        the same messages place_bet would raise or return.
+        """
+        bets = pd.DataFrame(bets, columns=BET_REQUEST_COLUMNS).reset_index(drop=True)
 
-        assert (
-            bet_id in all_bets.loc[all_bets["bettor_id"] == bettor_id, "id"].values
-        ), f"Invalid bet id {bet_id} for bettor {bettor_id}"
+        quotes = self.quotes.frame(bets["match_id"].unique())
+        priced = bets.merge(
+            quotes, on=["match_id", "selection_id"], how="left", indicator=True
+        )
 
-        # Update bet
-        with closing(sqlite3.connect(self.bets_db_path)) as bets_db_conn:
-            with closing(bets_db_conn.cursor()) as cursor:
-                cursor.execute(
-                    """
-                            UPDATE bets 
-                            SET status = "CANCELLED"
-                            where bettor_id = ?
-                            AND id = ?
+        is_back = priced["back_or_lay"] == "BACK"
+        priced["selection_odds"] = pd.to_numeric(
+            priced["best_back_price"].where(is_back, priced["best_lay_price"])
+        )
+
+        # Same checks, in the same order, as place_bet
+        invalid_selection = priced["_merge"] != "both"
+        invalid_amount = ~((priced["bet_amount"] > 0) & (priced["bet_amount"] < 1000.0))
+        invalid_side = ~priced["back_or_lay"].isin(["BACK", "LAY"])
+        invalid_price = ~(priced["selection_odds"] > 1)
+
+        reasons = pd.Series(None, index=priced.index, dtype=object)
+        reasons[invalid_price] = (
+            "No valid "
+            + priced.loc[invalid_price, "back_or_lay"].astype(str)
+            + " price for selection_id "
+            + priced.loc[invalid_price, "selection_id"].astype(str)
+            + " in match_id "
+            + priced.loc[invalid_price, "match_id"].astype(str)
+            + "."
+        )
+        reasons[invalid_side] = "Invalid value for back_or_lay, choose BACK or LAY."
+        reasons[invalid_amount] = "Invalid bet amount - valid range [0,1000]."
+        reasons[invalid_selection] = (
+            "Invalid selection_id "
+            + priced.loc[invalid_selection, "selection_id"].astype(str)
+            + " for match_id "
+            + priced.loc[invalid_selection, "match_id"].astype(str)
+            + "."
+        )
+
+        accepted = priced[reasons.isna()].copy()
+        # Vector version of bet_liability, each side computed from its own rows
+        accepted["liability"] = accepted["bet_amount"].astype(float)
+        lays = accepted["back_or_lay"] == "LAY"
+        accepted.loc[lays, "liability"] = accepted.loc[lays, "bet_amount"] * (
+            accepted.loc[lays, "selection_odds"] - 1
+        )
+
+        bet_ids = pd.Series(None, index=priced.index, dtype=object)
+        if not accepted.empty:
+            with closing(connect(self.bets_db_path)) as bets_db_conn:
+                with bets_db_conn:
+                    # Take the write lock before reading the ledger so the
+                    # exposure check can't race another writer
+                    bets_db_conn.execute("BEGIN IMMEDIATE")
+                    if self.max_exposure is not None:
+                        over_limit = self.exposure_limit_rejections(
+                            accepted, bets_db_conn
+                        )
+                        reasons[over_limit.index] = over_limit
+                        accepted = accepted.drop(over_limit.index)
+                    bets_db_conn.executemany(
+                        """
+                        INSERT INTO bets (
+                            bettor_id, match_id, selection_id, runner_name, runner_type,
+                            back_or_lay, bet_amount, selection_odds, status
+                        )
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        """,
+                        zip(
+                            accepted["bettor_id"].tolist(),
+                            accepted["match_id"].tolist(),
+                            accepted["selection_id"].tolist(),
+                            accepted["runner_name"].tolist(),
+                            accepted["runner_type"].tolist(),
+                            accepted["back_or_lay"].tolist(),
+                            accepted["bet_amount"].tolist(),
+                            accepted["selection_odds"].tolist(),
+                            ["PLACED"] * len(accepted),
+                        ),
+                    )
+                    # One uninterrupted write transaction, so SQLite gave the
+                    # rows consecutive AUTOINCREMENT ids ending at this one
+                    (last_id,) = bets_db_conn.execute(
+                        "SELECT last_insert_rowid()"
+                    ).fetchone()
+                    ids = range(last_id - len(accepted) + 1, last_id + 1)
+
+                    add_to_ledger(bets_db_conn, accepted)
+            bet_ids[accepted.index] = list(ids)
+
+        print(f"Bets placed: {len(accepted)}, rejected: {len(bets) - len(accepted)}.")
+
+        result = bets.copy()
+        result["bet_id"] = bet_ids.values
+        result["rejection_reason"] = reasons.values
+        return result
+
+    def exposure_limit_rejections(
+        self, bets: pd.DataFrame, bets_db_conn: sqlite3.Connection
+    ) -> pd.Series:
+        """Rejection reasons for the bets, taken in order, that would take their
+        bettor's exposure over max_exposure"""
+        bettor_ids = json.dumps(bets["bettor_id"].unique().tolist())
+        exposure = dict(
+            bets_db_conn.execute(
+                """
+                SELECT bettor_id, exposure FROM bettor_balances
+                WHERE bettor_id IN (SELECT value FROM json_each(?))
                 """,
-                    (bettor_id, bet_id),
+                (bettor_ids,),
+            )
+        )
+
+        reasons = {}
+        for bet in bets.itertuples():
+            total = exposure.get(bet.bettor_id, 0.0) + bet.liability
+            if total > self.max_exposure:
+                reasons[bet.Index] = (
+                    f"Exposure limit exceeded - bettor {bet.bettor_id} would have "
+                    f"{total:.2f} open, limit {self.max_exposure}."
+                )
+            else:
+                exposure[bet.bettor_id] = total
+        return pd.Series(reasons, dtype=object)
+
+    def cancel_bet(self, bettor_id, bet_id):
+        """Cancel one of a bettor's PLACED bets"""
+        with closing(connect(self.bets_db_path)) as bets_db_conn:
+            with bets_db_conn:
+                cancelled = self.cancel_where(
+                    bets_db_conn, "id = ? AND bettor_id = ?", (bet_id, bettor_id)
+                )
+            if not cancelled:
+                row = bets_db_conn.execute(
+                    "SELECT status FROM bets WHERE id = ? AND bettor_id = ?",
+                    (bet_id, bettor_id),
+                ).fetchone()
+                assert (
+                    row is not None
+                ), f"Invalid bet id {bet_id} for bettor {bettor_id}"
+                raise AssertionError(
+                    f"Bet {bet_id} is {row[0]}, only PLACED bets can be cancelled"
                 )
-            bets_db_conn.commit()
 
         print(f"Bet cancelled: {bet_id}.")
         return bet_id
 
+    def cancel_bets(self, bettor_id: int = None, match_id: int = None) -> int:
+        """Cancel every PLACED bet of a bettor, on a match, or both; returns how many"""
+        assert (
+            bettor_id is not None or match_id is not None
+        ), "Give a bettor_id and/or a match_id."
+
+        conditions, params = [], []
+        if bettor_id is not None:
+            conditions.append("bettor_id = ?")
+            params.append(bettor_id)
+        if match_id is not None:
+            conditions.append("match_id = ?")
+            params.append(match_id)
+
+        with closing(connect(self.bets_db_path)) as bets_db_conn:
+            with bets_db_conn:
+                cancelled = self.cancel_where(
+                    bets_db_conn, " AND ".join(conditions), params
+                )
+
+        print(f"Bets cancelled: {cancelled}.")
+        return cancelled
+
+    def cancel_where(
+        self, bets_db_conn: sqlite3.Connection, condition: str, params
+    ) -> int:
+        """Cancel the PLACED bets matching condition and release their liability
+
+        One UPDATE both checks and changes the bets, so it only reads the rows
+        it cancels (by primary key, bettor or the PLACED index).
+        """
+        bets_db_conn.execute("BEGIN IMMEDIATE")
+        cancelled = pd.DataFrame(
+            bets_db_conn.execute(
+                f"""
+                UPDATE bets
+                SET status = 'CANCELLED'
+                WHERE {condition} AND status = 'PLACED'
+                RETURNING bettor_id, match_id, selection_id, {LIABILITY_SQL}
+                """,
+                params,
+            ).fetchall(),
+            columns=["bettor_id", "match_id", "selection_id", "liability"],
+        )
+        cancelled["liability"] = -cancelled["liability"]
+        add_to_ledger(bets_db_conn, cancelled)
+        return len(cancelled)
+
     def resolve_bets(self, match_id, winning_selection_id):
 
+        quote = self.quotes.get(match_id, winning_selection_id)
+
         # Check the validity
         assert (
-            winning_selection_id
-            in self.odds.loc[self.odds["match_id"] == match_id, "selection_id"].values
+            quote is not None
         ), f"Invalid selection_id {winning_selection_id} for match_id {match_id}."
 
-        runner_outcome = self.odds.loc[
-            (self.odds["match_id"] == match_id)
-            & (self.odds["selection_id"] == winning_selection_id),
-            "runner_type",
-        ].values[0]
+        runner_outcome = quote.runner_type
         
         print(f"    Resolving bets for match {match_id}, winning outcome: {runner_outcome}")
-        
-        # Winning back bets
-        with closing(sqlite3.connect(self.bets_db_path)) as bets_db_conn:
-            with closing(bets_db_conn.cursor()) as cursor:
-                # Winning back bets
-                cursor.execute(
-                    """
-                            UPDATE bets 
-                            SET status = "SETTLED", runner_outcome = ?, bet_won = true, returned_amount = bet_amount * selection_odds
-                            where match_id = ?
-                            AND selection_id = ?
-                            AND back_or_lay = "BACK"
-                            AND status = "PLACED"
-                """,
-                    (runner_outcome, match_id, winning_selection_id),
-                )
-                print(f"      Updated {cursor.rowcount} winning back bets")
-                # Losing back bets
-                cursor.execute(
-                    """
-                            UPDATE bets 
-                            SET status = "SETTLED", runner_outcome = ?, bet_won = false, returned_amount = 0
-                            where match_id = ?
-                            AND selection_id <> ?
-                            AND back_or_lay = "BACK"
-                            AND status = "PLACED"
-                """,
-                    (runner_outcome, match_id, winning_selection_id),
-                )
-                print(f"      Updated {cursor.rowcount} losing back bets")
-                # Winning lay bets
-                cursor.execute(
-                    """
-                            UPDATE bets 
-                            SET status = "SETTLED", runner_outcome = ?, bet_won = true, returned_amount = bet_amount
-                            where match_id = ?
-                            AND selection_id <> ?
-                            AND back_or_lay = "LAY"
-                            AND status = "PLACED"
-                """,
-                    (runner_outcome, match_id, winning_selection_id),
-                )
-                print(f"      Updated {cursor.rowcount} winning lay bets")
-                # Losing lay bets
-                cursor.execute(
-                    """
-                            UPDATE bets 
-                            SET status = "SETTLED", runner_outcome = ?, bet_won = false, returned_amount = -bet_amount * (selection_odds - 1)
-                            where match_id = ?
-                            AND selection_id = ?
-                            AND back_or_lay = "LAY"
-                            AND status = "PLACED"
-                """,
-                    (runner_outcome, match_id, winning_selection_id),
+
+        self.settle_matches(
+            pd.DataFrame(
+                {
+                    "match_id": [match_id],
+                    "winning_selection_id": [winning_selection_id],
+                    "runner_outcome": [runner_outcome],
+                }
+            )
+        )
+
+    def settle_matches(self, settlements: pd.DataFrame) -> int:
+        """Settle every PLACED bet on the given matches in one transaction
+
+        settlements has match_id, winning_selection_id and runner_outcome
+        columns. Winning backs return bet_amount * selection_odds, losing backs
+        0, winning lays bet_amount and losing lays -bet_amount * (selection_odds - 1).
+        Each bettor's balance is credited with the profit and their exposure
+        on the matches released in the same transaction.
+        """
+        if settlements.empty:
+            return 0
+
+        with closing(connect(self.bets_db_path)) as bets_db_conn:
+            with bets_db_conn:
+                bets_db_conn.execute(CREATE_SETTLEMENT_TABLE_SQL)
+                bets_db_conn.executemany(
+                    "INSERT OR REPLACE INTO settlement VALUES (?, ?, ?)",
+                    zip(
+                        settlements["match_id"].tolist(),
+                        settlements["winning_selection_id"].tolist(),
+                        settlements["runner_outcome"].tolist(),
+                    ),
                 )
-                print(f"      Updated {cursor.rowcount} losing lay bets")
-            bets_db_conn.commit()
-
-    def resolve_all(self):
-        finished = self.fixtures[self.fixtures["status"] == "FINISHED"].copy()
-        print(f"Found {len(finished)} finished fixtures to process")
-
-        for i, fixture in finished.iterrows():
-            match_id = fixture["match_id"]
-            home_score = fixture["home_score"] 
-            away_score = fixture["away_score"]
-            
-            print(f"Processing match {match_id}: {fixture['home_team']} {home_score}-{away_score} {fixture['away_team']}")
-            
-            if home_score > away_score:
-                winning_outcome = "Home win"
-            elif away_score > home_score:
-                winning_outcome = "Away win"
-            else:
-                winning_outcome = "Draw"
-                
-            print(f"  Winning outcome: {winning_outcome}")
-
-            # Check if we have odds data for this match
-            match_odds = self.odds[self.odds["match_id"] == match_id]
-            if match_odds.empty:
-                print(f"  No odds data found for match {match_id}, skipping")
-                continue
-                
-            winning_odds = match_odds[match_odds["runner_type"] == winning_outcome]
-            if winning_odds.empty:
-                print(f"  No odds found for outcome '{winning_outcome}' in match {match_id}, skipping")
-                continue
-                
-            winning_selection_id = int(winning_odds["selection_id"].values[0])
-            print(f"  Winning selection_id: {winning_selection_id}")
-
-            self.resolve_bets(match_id, winning_selection_id)
-            print(f"  Resolved bets for match {match_id}")
-            
+                for statement in SETTLE_LEDGER_SQL:
+                    bets_db_conn.execute(statement)
+                cursor = bets_db_conn.execute(SETTLE_BETS_SQL)
+                settled = cursor.rowcount
+                bets_db_conn.execute("DROP TABLE settlement")
+
+        print(f"      Settled {settled} bets across {len(settlements)} matches")
+        return settled
+
+    def get_pending_settlements(self, match_ids=None) -> pd.DataFrame:
+        """Winning selections for finished fixtures that still have PLACED bets
+
+        match_ids limits the check to those matches, e.g. the finished list
+        of a fixtures update's change set.
+        """
+        query = "SELECT DISTINCT match_id FROM bets WHERE status = 'PLACED'"
+        params = ()
+        if match_ids is not None:
+            query += " AND match_id IN (SELECT value FROM json_each(?))"
+            params = (json.dumps([int(match_id) for match_id in match_ids]),)
+        with closing(connect(self.bets_db_path)) as bets_db_conn:
+            pending = pd.read_sql_query(query, bets_db_conn, params=params)
+
+        fixtures = self.get_fixtures(pending["match_id"])
+        finished = fixtures[fixtures["status"] == "FINISHED"].copy()
+        print(f"Found {len(finished)} finished fixtures with unsettled bets")
+
+        finished["runner_outcome"] = runner_outcomes(finished)
+
+        winners = finished.merge(
+            self.quotes.frame(finished["match_id"])[
+                ["match_id", "selection_id", "runner_type"]
+            ],
+            left_on=["match_id", "runner_outcome"],
+            right_on=["match_id", "runner_type"],
+            how="left",
+        )
+        for fixture in winners[winners["selection_id"].isna()].itertuples():
+            print(
+                f"  No odds found for outcome '{fixture.runner_outcome}' "
+                f"in match {fixture.match_id}, skipping"
+            )
+        winners = winners.dropna(subset=["selection_id"])
+
+        return pd.DataFrame(
+            {
+                "match_id": winners["match_id"].astype(int),
+                "winning_selection_id": winners["selection_id"].astype(int),
+                "runner_outcome": winners["runner_outcome"],
+            }
+        )
+
+    def resolve_all(self, match_ids=None):
+        settlements = self.get_pending_settlements(match_ids)
+
+        for settlement in settlements.itertuples():
+            print(
+                f"Processing match {settlement.match_id}: {settlement.runner_outcome}, "
+                f"winning selection_id {settlement.winning_selection_id}"
+            )
+
+        self.settle_matches(settlements)
         print("Finished processing all matches")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Settle bets on finished fixtures")
+    parser.add_argument(
+        "--changes-file",
+        help="Only settle the matches finished in this premier_league_fixtures.py "
+        "change set; settles every finished match if it is missing or empty",
+    )
+    args = parser.parse_args()
+
+    match_ids = None
+    if args.changes_file and os.path.exists(args.changes_file):
+        with open(args.changes_file) as f:
+            match_ids = json.load(f)["finished"] or None
+    if args.changes_file and match_ids is None:
+        # A failed fixtures update or a missed run leaves no usable change
+        # set, so fall back to a full pass rather than strand settlements
+        print("No finished matches in the change set, settling all finished matches")
+
     bs = BookmakerSimulator()
-    bs.resolve_all()
\ No newline at end of file
+    bs.resolve_all(match_ids)
@@ -0,0 +1,169 @@
+"""
+Run grids of backtest strategy parameters across processes
+
+The odds history is loaded and settled once, then every Snapshots and
+Results array is written to a temporary directory as .npy files. Each
+worker memory-maps those files read-only when it starts, so all processes
+share the same pages and a task only pickles its strategy function and
+parameters. Workers return one summarize() dict per parameter set.
+
+    results = run_sweep(snapshots, results, price_move, {
+        "threshold": [0.01, 0.02, 0.05],
+        "side": ["back", "lay"],
+    })
+
+Usage:
+    python sweep.py --strategy price_move --param threshold=0.01,0.02,0.05 \
+        --param side=back,lay,both --workers 4
+"""
+
+import os
+import sys
+import time
+import argparse
+import itertools
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from betting.backtest import (
+    STRATEGIES,
+    Results,
+    Snapshots,
+    Stakes,
+    load_results,
+    load_snapshots,
+    parse_value,
+    run_backtest,
+    summarize,
+)
+
+# Memory-mapped arrays, set in each worker by attach()
+worker_arrays: Optional[Tuple[Snapshots, Results]] = None
+
+
+def save_arrays(snapshots: Snapshots, results: Results, directory: str):
+    """Write every array to directory for map_arrays()"""
+    for prefix, arrays in (("snapshots", snapshots), ("results", results)):
+        for field, array in arrays._asdict().items():
+            np.save(os.path.join(directory, f"{prefix}.{field}.npy"), array)
+
+
+def map_arrays(directory: str) -> Tuple[Snapshots, Results]:
+    """Read-only memory maps of the arrays saved by save_arrays()"""
+
+    def load(cls, prefix):
+        return cls(
+            **{
+                field: np.load(
+                    os.path.join(directory, f"{prefix}.{field}.npy"), mmap_mode="r"
+                )
+                for field in cls._fields
+            }
+        )
+
+    return load(Snapshots, "snapshots"), load(Results, "results")
+
+
+def attach(directory: str):
+    global worker_arrays
+    worker_arrays = map_arrays(directory)
+
+
+def evaluate(
+    strategy: Callable[..., Stakes], params: Dict[str, object]
+) -> Dict[str, object]:
+    snapshots, results = worker_arrays
+    return dict(
+        params, **summarize(run_backtest(snapshots, results, strategy, **params))
+    )
+
+
+def parameter_grid(grid: Dict[str, list]) -> List[Dict[str, object]]:
+    """Every combination of the grid's values, as keyword argument dicts"""
+    return [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+
+
+def run_sweep(
+    snapshots: Snapshots,
+    results: Results,
+    strategy: Callable[..., Stakes],
+    grid: Dict[str, list],
+    workers: Optional[int] = None,
+) -> pd.DataFrame:
+    """One row of parameters and summarize() totals per parameter set, in grid order
+
+    strategy must be a module-level function so it can be sent to the
+    workers. workers defaults to the number of CPUs.
+    """
+    param_sets = parameter_grid(grid)
+    with tempfile.TemporaryDirectory() as tmp:
+        save_arrays(snapshots, results, tmp)
+        with ProcessPoolExecutor(workers, initializer=attach, initargs=(tmp,)) as pool:
+            rows = list(pool.map(evaluate, itertools.repeat(strategy), param_sets))
+    return pd.DataFrame(rows)
+
+
+def parse_grid(pairs) -> Dict[str, list]:
+    """--param key=value1,value2 pairs as a parameter grid"""
+    grid = {}
+    for pair in pairs:
+        key, _, values = pair.partition("=")
+        grid[key] = [parse_value(value) for value in values.split(",")]
+    return grid
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Backtest a grid of strategy parameters"
+    )
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES), default="price_move")
+    parser.add_argument(
+        "--param",
+        action="append",
+        default=[],
+        metavar="KEY=V1,V2",
+        help="Values to sweep for one strategy parameter (repeatable)",
+    )
+    parser.add_argument(
+        "--workers", type=int, help="Worker processes (default: CPU count)"
+    )
+    parser.add_argument(
+        "--odds-db-path",
+        default="/Users/rdmgray/Projects/EPLpal/data/premier_league_odds.db",
+    )
+    parser.add_argument(
+        "--fixtures-db-path",
+        default="/Users/rdmgray/Projects/EPLpal/data/premier_league_2025_26.db",
+    )
+    parser.add_argument(
+        "--output", help="Write the results of every parameter set to this CSV"
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    snapshots = load_snapshots(args.odds_db_path)
+    results = load_results(args.fixtures_db_path, snapshots)
+    print(
+        f"Loaded {len(snapshots.match_id)} runner snapshots in "
+        f"{time.perf_counter() - start:.2f}s"
+    )
+
+    grid = parse_grid(args.param)
+    start = time.perf_counter()
+    sweep = run_sweep(snapshots, results, STRATEGIES[args.strategy], grid, args.workers)
+    elapsed = time.perf_counter() - start
+    print(
+        f"Ran {len(sweep)} parameter sets in {elapsed:.2f}s "
+        f"({len(sweep) / elapsed:.1f}/s)\n"
+    )
+
+    print(sweep.sort_values("roi", ascending=False).to_string(index=False))
+
+    if args.output:
+        sweep.to_csv(args.output, index=False)
+        print(f"\nWrote {len(sweep)} parameter sets to {args.output}")
@@ -0,0 +1,67 @@
+"""
+Shared SQLite connection factory for the data layer
+
+The collector, settlement and the web server all use the same database files.
+Every Python connection should come from connect() so they all run in WAL
+mode, where readers never block the writer and vice versa, and wait on the
+rare remaining lock conflicts instead of failing with SQLITE_BUSY.
+"""
+
+import sqlite3
+
+# How long a connection waits for a lock before raising "database is locked"
+BUSY_TIMEOUT_SECONDS = 10.0
+
+# Checkpoint policy: writers fold the WAL back into the database every
+# WAL_AUTOCHECKPOINT_PAGES pages (PASSIVE, so never waiting on readers), and
+# the WAL file is truncated back to JOURNAL_SIZE_LIMIT after each checkpoint
+WAL_AUTOCHECKPOINT_PAGES = 1000
+JOURNAL_SIZE_LIMIT = 64 * 1024 * 1024
+
+# Per-connection settings, except journal_mode which is stored in the file
+PRAGMAS = [
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("mmap_size", 256 * 1024 * 1024),
+    ("cache_size", -64 * 1024),  # Negative means KiB, so 64 MiB
+    ("wal_autocheckpoint", WAL_AUTOCHECKPOINT_PAGES),
+    ("journal_size_limit", JOURNAL_SIZE_LIMIT),
+]
+
+# journal_mode can't be set through a read-only connection
+READONLY_PRAGMAS = [(name, value) for name, value in PRAGMAS if name != "journal_mode"]
+
+
+def apply_pragmas(conn: sqlite3.Connection, readonly: bool = False):
+    """Set the storage PRAGMAs every connection should use"""
+    for name, value in READONLY_PRAGMAS if readonly else PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
+
+
+def connect(db_path: str, readonly: bool = False, **kwargs) -> sqlite3.Connection:
+    """Open db_path with WAL, the busy timeout and the storage PRAGMAs applied"""
+    kwargs.setdefault("timeout", BUSY_TIMEOUT_SECONDS)
+    if readonly:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, **kwargs)
+    else:
+        conn = sqlite3.connect(db_path, **kwargs)
+    apply_pragmas(conn, readonly)
+    return conn
+
+
+def checkpoint(conn: sqlite3.Connection, mode: str = "PASSIVE") -> tuple:
+    """Run a WAL checkpoint; returns (busy, wal_pages, checkpointed_pages)
+
+    PASSIVE copies what it can without waiting. TRUNCATE waits for readers
+    (up to the busy timeout) and resets the WAL file, which suits idle points
+    such as the end of a polling cycle. If a long-running reader keeps a
+    blocking mode from finishing (busy is 1), a PASSIVE pass follows so the
+    frames the readers no longer need are still copied back, and its result
+    is returned with busy still 1.
+    """
+    result = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    if result[0] and mode.upper() != "PASSIVE":
+        result = (1,) + tuple(
+            conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()[1:]
+        )
+    return result
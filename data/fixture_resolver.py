@@ -0,0 +1,113 @@
+import sqlite3
+from contextlib import closing
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from db import connect
+from utils import team_name_mapping_sl
+
+
+class FixtureLookup(NamedTuple):
+    """Result of resolving a Betfair match to a fixtures match_id
+
+    match_id is None on a miss, and reason says why ("unknown_team" when a
+    Betfair team name has no fixtures mapping, "no_fixture" when the mapped
+    pair is not in the fixtures table).
+    """
+
+    match_id: Optional[int]
+    home_team: str
+    away_team: str
+    reason: Optional[str] = None
+
+    @property
+    def found(self) -> bool:
+        return self.match_id is not None
+
+
+class FixtureResolver:
+    """In-memory (home_team, away_team) -> match_id index over the fixtures table
+
+    The whole table is loaded once. refresh() checks the fixtures.updated_at
+    high-water mark and only reloads rows updated since the last load.
+    """
+
+    def __init__(self, fixtures_db_path: str):
+        self.fixtures_db_path = fixtures_db_path
+        self.index: Dict[Tuple[str, str], int] = {}
+        self.teams_by_match: Dict[int, Tuple[str, str]] = {}
+        self.high_water: Optional[str] = None
+        self.loaded = False
+
+    def _connect(self) -> sqlite3.Connection:
+        return connect(self.fixtures_db_path, readonly=True)
+
+    def _apply(self, rows):
+        for match_id, home_team, away_team, updated_at in rows:
+            old_key = self.teams_by_match.get(match_id)
+            if old_key is not None and self.index.get(old_key) == match_id:
+                del self.index[old_key]
+            self.index[(home_team, away_team)] = match_id
+            self.teams_by_match[match_id] = (home_team, away_team)
+            if updated_at is not None and (
+                self.high_water is None or updated_at > self.high_water
+            ):
+                self.high_water = updated_at
+
+    def load(self):
+        """Load the full fixtures table into the index"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT match_id, home_team, away_team, updated_at FROM fixtures"
+            ).fetchall()
+        self.index = {}
+        self.teams_by_match = {}
+        self.high_water = None
+        self._apply(rows)
+        self.loaded = True
+
+    def refresh(self) -> int:
+        """Reload fixtures updated since the last load; returns how many rows it read"""
+        if not self.loaded:
+            self.load()
+            return len(self.teams_by_match)
+
+        with closing(self._connect()) as conn:
+            (latest,) = conn.execute("SELECT MAX(updated_at) FROM fixtures").fetchone()
+            if latest is None or (
+                self.high_water is not None and latest <= self.high_water
+            ):
+                return 0
+            if self.high_water is None:
+                rows = conn.execute(
+                    "SELECT match_id, home_team, away_team, updated_at FROM fixtures"
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    """
+                    SELECT match_id, home_team, away_team, updated_at FROM fixtures
+                    WHERE updated_at > ?
+                    """,
+                    (self.high_water,),
+                ).fetchall()
+
+        self._apply(rows)
+        return len(rows)
+
+    def resolve(self, home_team: str, away_team: str) -> FixtureLookup:
+        """Resolve Betfair team names to a fixtures match_id"""
+        fixture_home_team = team_name_mapping_sl.get(home_team)
+        fixture_away_team = team_name_mapping_sl.get(away_team)
+        if fixture_home_team is None or fixture_away_team is None:
+            return FixtureLookup(None, home_team, away_team, "unknown_team")
+
+        if not self.loaded:
+            self.load()
+
+        key = (fixture_home_team, fixture_away_team)
+        match_id = self.index.get(key)
+        if match_id is None and self.refresh():
+            match_id = self.index.get(key)
+        if match_id is None:
+            return FixtureLookup(None, home_team, away_team, "no_fixture")
+
+        return FixtureLookup(match_id, home_team, away_team)
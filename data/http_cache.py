@@ -0,0 +1,202 @@
+"""
+On-disk HTTP response cache for REST APIs with tight rate limits
+
+CachedSession.get() answers from disk while an entry is younger than its
+endpoint's TTL. Once the TTL has passed it revalidates with If-None-Match /
+If-Modified-Since, so unchanged data costs a 304 rather than a full payload.
+Entries that expired and went unused for max_age are pruned whenever a new
+response is stored, so requests with moving parameters (such as a date
+window) don't pile up. All requests go through one requests.Session, which
+reuses connections, and through an optional RequestScheduler that paces them
+and retries 429s, 5xx responses and network errors. Cache hits never touch
+the scheduler.
+"""
+
+import os
+import json
+import time
+import hashlib
+from typing import Dict, Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from request_scheduler import RequestScheduler, RetryableError, parse_retry_after
+
+# Headers APIs use to say when a throttled request may be retried
+# (X-RequestCounter-Reset is football-data.org's)
+RETRY_AFTER_HEADERS = ["Retry-After", "X-RequestCounter-Reset"]
+
+# Keep expired entries this long for revalidation before pruning them
+MAX_AGE_SECONDS = 7 * 24 * 3600
+
+
+class CachedSession:
+    """requests.Session wrapper with a per-endpoint TTL cache of GET responses
+
+    ttls maps a URL path fragment (e.g. "/competitions/PL/teams") to a TTL in
+    seconds; the longest fragment found in a request's URL wins, and URLs
+    matching none use default_ttl. A TTL of 0 always revalidates. Entries
+    are pruned max_age after the longest TTL has passed since they were last
+    fetched or revalidated.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        ttls: Optional[Dict[str, float]] = None,
+        default_ttl: float = 0,
+        session: Optional[requests.Session] = None,
+        scheduler: Optional[RequestScheduler] = None,
+        max_age: float = MAX_AGE_SECONDS,
+    ):
+        self.cache_dir = cache_dir
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        # Counted from the longest TTL, so no entry is pruned before it expires
+        self.max_age = max_age + max([default_ttl, *self.ttls.values()])
+        self.session = session or requests.Session()
+        self.scheduler = scheduler
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def ttl_for(self, url: str) -> float:
+        matches = [fragment for fragment in self.ttls if fragment in url]
+        if not matches:
+            return self.default_ttl
+        return self.ttls[max(matches, key=len)]
+
+    def _path(self, url: str, params: Optional[Dict]) -> str:
+        key = json.dumps([url, sorted((params or {}).items())])
+        return os.path.join(
+            self.cache_dir, hashlib.sha256(key.encode()).hexdigest() + ".json"
+        )
+
+    def _load(self, path: str) -> Optional[Dict]:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, path: str, entry: Dict):
+        # Write then rename so a concurrent reader never sees a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def _fetch(self, url: str, **kwargs) -> requests.Response:
+        """One GET, raising RetryableError for throttling and transient failures"""
+        try:
+            response = self.session.get(url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise RetryableError(f"Request failed: {e}")
+        if response.status_code == 429 or response.status_code >= 500:
+            retry_after = None
+            for name in RETRY_AFTER_HEADERS:
+                retry_after = parse_retry_after(response.headers.get(name))
+                if retry_after is not None:
+                    break
+            raise RetryableError(
+                f"HTTP {response.status_code}", retry_after=retry_after
+            )
+        return response
+
+    def _response(self, url: str, entry: Dict) -> requests.Response:
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response._content = entry["body"].encode("utf-8")
+        response.encoding = "utf-8"
+        response.from_cache = True
+        return response
+
+    def get(
+        self,
+        url: str,
+        params: Optional[Dict] = None,
+        headers: Optional[Dict] = None,
+        ttl: Optional[float] = None,
+        **kwargs,
+    ) -> requests.Response:
+        """GET url, served from the cache or revalidated when possible
+
+        Cached and revalidated responses come back as 200 with
+        response.from_cache set. Errors are returned as-is and never cached,
+        except that with a scheduler, failures it gave up retrying raise
+        RetryableError (or CircuitOpenError).
+        """
+        ttl = self.ttl_for(url) if ttl is None else ttl
+        path = self._path(url, params)
+        entry = self._load(path)
+
+        if entry is not None and time.time() - entry["fetched_at"] < ttl:
+            return self._response(url, entry)
+
+        request_headers = dict(headers or {})
+        if entry is not None:
+            if entry["headers"].get("ETag"):
+                request_headers["If-None-Match"] = entry["headers"]["ETag"]
+            if entry["headers"].get("Last-Modified"):
+                request_headers["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+
+        if self.scheduler is None:
+            response = self.session.get(
+                url, params=params, headers=request_headers, **kwargs
+            )
+        else:
+            response = self.scheduler.call(
+                self._fetch, url, params=params, headers=request_headers, **kwargs
+            )
+
+        if response.status_code == 304 and entry is not None:
+            entry["fetched_at"] = time.time()
+            for name in ("ETag", "Last-Modified"):
+                if response.headers.get(name):
+                    entry["headers"][name] = response.headers[name]
+            self._save(path, entry)
+            return self._response(url, entry)
+
+        response.from_cache = False
+        if response.status_code == 200:
+            self.prune()
+            self._save(
+                path,
+                {
+                    "url": response.url,
+                    "fetched_at": time.time(),
+                    "headers": {
+                        name: response.headers[name]
+                        for name in ("ETag", "Last-Modified", "Content-Type")
+                        if name in response.headers
+                    },
+                    "body": response.text,
+                },
+            )
+        return response
+
+    def prune(self):
+        """Delete entries last fetched or revalidated before the retention cutoff
+
+        Every save rewrites the entry's file, so its mtime is when it was
+        last fetched or revalidated.
+        """
+        cutoff = time.time() - self.max_age
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                if name.endswith(".json") and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                # Already pruned by another process
+                pass
+
+    def clear(self):
+        """Delete every cached response"""
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".json"):
+                os.remove(os.path.join(self.cache_dir, name))
+
+    def close(self):
+        self.session.close()
@@ -1,117 +1,34 @@
 #!/usr/bin/env python3
 
 import os
-import sqlite3
-from datetime import datetime
+
+from migrations import BETS_MIGRATIONS, ODDS_MIGRATIONS, migrate_database
 
 
 def init_odds_database(db_path: str):
-    """Initialize the Betfair odds database with proper schema"""
+    """Initialize the Betfair odds database, or migrate an existing one in place"""
     print(f"Initializing database at: {db_path}")
 
-    # Remove existing database if it exists
     if os.path.exists(db_path):
-        print("Removing existing database...")
-        os.remove(db_path)
-
-    # Create new database
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    print("Creating matches table...")
-    # Create matches table
-    cursor.execute(
-        """
-        CREATE TABLE matches (
-            id INTEGER NOT NULL,
-            event_id TEXT UNIQUE NOT NULL,
-            market_id TEXT NOT NULL,
-            home_team TEXT NOT NULL,
-            away_team TEXT NOT NULL,
-            match_date TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """
-    )
-
-    print("Creating odds table...")
-    # Create odds table
-    cursor.execute(
-        """
-        CREATE TABLE odds (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            match_id INTEGER NOT NULL,
-            selection_id INTEGER NOT NULL,
-            runner_name TEXT NOT NULL,
-            runner_type TEXT NOT NULL,
-            best_back_price REAL,
-            best_back_size REAL,
-            best_lay_price REAL,
-            best_lay_size REAL,
-            last_price_traded REAL,
-            total_matched REAL,
-            status TEXT NOT NULL,
-            request_time TIMESTAMP NOT NULL,
-            recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (match_id) REFERENCES matches (id)
-        )
-    """
-    )
-
-    # Create indexes for better performance
-    print("Creating indexes...")
-    cursor.execute("CREATE INDEX idx_matches_event_id ON matches(event_id)")
-    cursor.execute("CREATE INDEX idx_odds_match_id ON odds(match_id)")
-    cursor.execute("CREATE INDEX idx_odds_request_time ON odds(request_time)")
-    cursor.execute("CREATE INDEX idx_odds_selection_id ON odds(selection_id)")
-
-    conn.commit()
-    conn.close()
+        print("Database exists, keeping data and applying migrations...")
+
+    version = migrate_database(db_path, ODDS_MIGRATIONS)
 
     print("Database initialization complete!")
-    print(f"Database created at: {db_path}")
+    print(f"Database at: {db_path} (schema version {version})")
 
 
 def init_bets_database(db_path: str):
-    """Initialize the bettor positions database with proper schema"""
+    """Initialize the bettor positions database, or migrate an existing one in place"""
     print(f"Initializing database at: {db_path}")
 
-    # Remove existing database if it exists
     if os.path.exists(db_path):
-        print("Removing existing database...")
-        os.remove(db_path)
-
-    # Create new database
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    print("Creating bets table...")
-    # Create bets table
-    cursor.execute(
-        """
-        CREATE TABLE bets (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            bettor_id INTEGER NOT NULL,
-            match_id INTEGER NOT NULL,
-            selection_id INTEGER NOT NULL,
-            runner_name TEXT NOT NULL,
-            runner_type TEXT NOT NULL,
-            back_or_lay TEXT NOT NULL,
-            bet_amount REAL,
-            selection_odds REAL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            status TEXT NOT NULL,
-            runner_outcome TEXT,
-            bet_won BOOLEAN,
-            returned_amount REAL
-        )
-    """
-    )
-    conn.commit()
-    conn.close()
+        print("Database exists, keeping data and applying migrations...")
+
+    version = migrate_database(db_path, BETS_MIGRATIONS)
 
     print("Database initialization complete!")
-    print(f"Database created at: {db_path}")
+    print(f"Database at: {db_path} (schema version {version})")
 
 
 def main():
@@ -0,0 +1,355 @@
+"""
+Schema migrations for the odds, bets and fixtures SQLite databases
+
+Each database has an ordered list of (version, description, statements).
+migrate() applies the versions not yet recorded in the database's
+schema_version table, each in its own transaction, so schema changes never
+require rebuilding a database. Statements must be safe to run against a
+database created before migrations were tracked (hence IF NOT EXISTS).
+"""
+
+import sqlite3
+from typing import List, Tuple
+
+from db import connect
+
+Migration = Tuple[int, str, List[str]]
+
+ODDS_MIGRATIONS: List[Migration] = [
+    (
+        1,
+        "create matches and odds tables",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS matches (
+                id INTEGER NOT NULL,
+                event_id TEXT UNIQUE NOT NULL,
+                market_id TEXT NOT NULL,
+                home_team TEXT NOT NULL,
+                away_team TEXT NOT NULL,
+                match_date TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS odds (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                match_id INTEGER NOT NULL,
+                selection_id INTEGER NOT NULL,
+                runner_name TEXT NOT NULL,
+                runner_type TEXT NOT NULL,
+                best_back_price REAL,
+                best_back_size REAL,
+                best_lay_price REAL,
+                best_lay_size REAL,
+                last_price_traded REAL,
+                total_matched REAL,
+                status TEXT NOT NULL,
+                request_time TIMESTAMP NOT NULL,
+                recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (match_id) REFERENCES matches (id)
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_matches_event_id ON matches(event_id)",
+            "CREATE INDEX IF NOT EXISTS idx_odds_match_id ON odds(match_id)",
+            "CREATE INDEX IF NOT EXISTS idx_odds_request_time ON odds(request_time)",
+            "CREATE INDEX IF NOT EXISTS idx_odds_selection_id ON odds(selection_id)",
+        ],
+    ),
+    (
+        2,
+        "add odds_coverage for change-only odds storage",
+        [
+            # One row per match per collection session, so sessions where a
+            # runner's odds were unchanged (and not re-stored) can be told
+            # apart from gaps
+            """
+            CREATE TABLE IF NOT EXISTS odds_coverage (
+                match_id INTEGER NOT NULL,
+                request_time TIMESTAMP NOT NULL,
+                PRIMARY KEY (match_id, request_time)
+            )
+            """,
+            """
+            INSERT OR IGNORE INTO odds_coverage (match_id, request_time)
+            SELECT DISTINCT match_id, request_time FROM odds
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_odds_match_selection_time
+            ON odds(match_id, selection_id, request_time)
+            """,
+        ],
+    ),
+    (
+        3,
+        "add latest_odds",
+        [
+            # Current odds per runner, upserted by the collector with every odds insert
+            """
+            CREATE TABLE IF NOT EXISTS latest_odds (
+                match_id INTEGER NOT NULL,
+                selection_id INTEGER NOT NULL,
+                runner_name TEXT NOT NULL,
+                runner_type TEXT NOT NULL,
+                best_back_price REAL,
+                best_back_size REAL,
+                best_lay_price REAL,
+                best_lay_size REAL,
+                last_price_traded REAL,
+                total_matched REAL,
+                status TEXT NOT NULL,
+                request_time TIMESTAMP NOT NULL,
+                PRIMARY KEY (match_id, selection_id)
+            ) WITHOUT ROWID
+            """,
+            # SQLite returns the bare columns from the row holding MAX(request_time)
+            """
+            INSERT OR REPLACE INTO latest_odds (
+                match_id, selection_id, runner_name, runner_type, best_back_price,
+                best_back_size, best_lay_price, best_lay_size, last_price_traded,
+                total_matched, status, request_time
+            )
+            SELECT match_id, selection_id, runner_name, runner_type, best_back_price,
+                best_back_size, best_lay_price, best_lay_size, last_price_traded,
+                total_matched, status, MAX(request_time)
+            FROM odds
+            GROUP BY match_id, selection_id
+            """,
+        ],
+    ),
+    (
+        4,
+        "add odds_depth for full ladder capture",
+        [
+            # One row per runner per depth-capture snapshot. Each ladder is a
+            # little-endian float32 blob of interleaved (price, size) pairs,
+            # best price first; decode with odds_depth.unpack_levels()
+            """
+            CREATE TABLE IF NOT EXISTS odds_depth (
+                match_id INTEGER NOT NULL,
+                selection_id INTEGER NOT NULL,
+                request_time TIMESTAMP NOT NULL,
+                available_to_back BLOB NOT NULL,
+                available_to_lay BLOB NOT NULL,
+                traded_volume BLOB NOT NULL,
+                PRIMARY KEY (match_id, selection_id, request_time)
+            ) WITHOUT ROWID
+            """,
+        ],
+    ),
+]
+
+
+BETS_MIGRATIONS: List[Migration] = [
+    (
+        1,
+        "create bets table",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS bets (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                bettor_id INTEGER NOT NULL,
+                match_id INTEGER NOT NULL,
+                selection_id INTEGER NOT NULL,
+                runner_name TEXT NOT NULL,
+                runner_type TEXT NOT NULL,
+                back_or_lay TEXT NOT NULL,
+                bet_amount REAL,
+                selection_odds REAL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                status TEXT NOT NULL,
+                runner_outcome TEXT,
+                bet_won BOOLEAN,
+                returned_amount REAL
+            )
+            """,
+        ],
+    ),
+    (
+        2,
+        "add settlement and per-bettor indexes",
+        [
+            # Settlement only ever touches PLACED bets, a small slice of the table
+            """
+            CREATE INDEX IF NOT EXISTS idx_bets_placed
+            ON bets(match_id, selection_id, back_or_lay)
+            WHERE status = 'PLACED'
+            """,
+            # /api/bets/:bettorId and /api/bettors. status is deliberately left out:
+            # indexing it would make every settlement rewrite entries in this index
+            """
+            CREATE INDEX IF NOT EXISTS idx_bets_bettor
+            ON bets(bettor_id, created_at)
+            """,
+            "ANALYZE bets",
+        ],
+    ),
+    (
+        3,
+        "add bettor balance and exposure ledger",
+        [
+            # Kept up to date by BookmakerSimulator as bets are placed, cancelled
+            # and settled. balance is the realized profit of settled bets and
+            # exposure the total liability of PLACED ones
+            """
+            CREATE TABLE IF NOT EXISTS bettor_balances (
+                bettor_id INTEGER PRIMARY KEY,
+                balance REAL NOT NULL DEFAULT 0,
+                exposure REAL NOT NULL DEFAULT 0
+            )
+            """,
+            # Liability of PLACED bets per selection: the stake of a BACK, the
+            # payout (bet_amount * (selection_odds - 1)) of a LAY
+            """
+            CREATE TABLE IF NOT EXISTS bettor_exposure (
+                bettor_id INTEGER NOT NULL,
+                match_id INTEGER NOT NULL,
+                selection_id INTEGER NOT NULL,
+                liability REAL NOT NULL,
+                PRIMARY KEY (bettor_id, match_id, selection_id)
+            ) WITHOUT ROWID
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_bettor_exposure_match
+            ON bettor_exposure(match_id)
+            """,
+            """
+            INSERT INTO bettor_exposure (bettor_id, match_id, selection_id, liability)
+            SELECT bettor_id, match_id, selection_id, SUM(
+                CASE WHEN back_or_lay = 'BACK' THEN bet_amount
+                    ELSE bet_amount * (selection_odds - 1) END
+            )
+            FROM bets
+            WHERE status = 'PLACED' AND back_or_lay IN ('BACK', 'LAY')
+            GROUP BY bettor_id, match_id, selection_id
+            """,
+            """
+            INSERT INTO bettor_balances (bettor_id, balance, exposure)
+            SELECT bettor_id,
+                COALESCE(SUM(
+                    CASE WHEN status = 'SETTLED' AND back_or_lay = 'BACK'
+                            THEN returned_amount - bet_amount
+                        WHEN status = 'SETTLED' THEN returned_amount
+                    END
+                ), 0),
+                COALESCE((
+                    SELECT SUM(liability) FROM bettor_exposure e
+                    WHERE e.bettor_id = bets.bettor_id
+                ), 0)
+            FROM bets
+            GROUP BY bettor_id
+            """,
+        ],
+    ),
+]
+
+
+FIXTURES_MIGRATIONS: List[Migration] = [
+    (
+        1,
+        "create fixtures and teams tables",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS fixtures (
+                id INTEGER PRIMARY KEY,
+                match_id INTEGER UNIQUE,
+                matchday INTEGER,
+                date TEXT,
+                time TEXT,
+                home_team TEXT,
+                away_team TEXT,
+                home_team_id INTEGER,
+                away_team_id INTEGER,
+                status TEXT,
+                venue TEXT,
+                home_score INTEGER,
+                away_score INTEGER,
+                season TEXT,
+                updated_at TEXT
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS teams (
+                id INTEGER PRIMARY KEY,
+                team_id INTEGER UNIQUE,
+                name TEXT,
+                short_name TEXT,
+                tla TEXT,
+                crest TEXT,
+                founded INTEGER,
+                venue TEXT
+            )
+            """,
+        ],
+    ),
+    (
+        2,
+        "add matchday and updated_at indexes",
+        [
+            # /api/fixtures/matchday/:matchday
+            """
+            CREATE INDEX IF NOT EXISTS idx_fixtures_matchday
+            ON fixtures(matchday, date, time)
+            """,
+            # FixtureResolver's high-water mark refresh
+            """
+            CREATE INDEX IF NOT EXISTS idx_fixtures_updated_at
+            ON fixtures(updated_at)
+            """,
+        ],
+    ),
+]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+    )
+    (version,) = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return version or 0
+
+
+def migrate(
+    conn: sqlite3.Connection, migrations: List[Migration], verbose: bool = True
+) -> int:
+    """Apply any migrations not yet recorded; returns the new schema version"""
+    conn.commit()
+    version = get_schema_version(conn)
+
+    for target, description, statements in migrations:
+        if target <= version:
+            continue
+        if verbose:
+            print(f"Applying migration {target}: {description}...")
+        with conn:
+            # sqlite3 doesn't open transactions for DDL by itself
+            conn.execute("BEGIN IMMEDIATE")
+            # Another process may have applied it while we waited for the lock
+            if get_schema_version(conn) >= target:
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (target, description),
+            )
+        version = target
+
+    return version
+
+
+def migrate_database(
+    db_path: str, migrations: List[Migration], verbose: bool = True
+) -> int:
+    """Open db_path and apply pending migrations"""
+    conn = connect(db_path)
+    try:
+        return migrate(conn, migrations, verbose)
+    finally:
+        conn.close()
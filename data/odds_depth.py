@@ -0,0 +1,74 @@
+"""
+Read full ladder depth captured by the odds collector's --depth mode
+
+odds_depth stores every ladder as one little-endian float32 blob of
+interleaved (price, size) pairs, best price first. unpack_levels() turns a
+blob into an (n, 2) NumPy array without building per-level Python objects,
+and load_depth() returns every snapshot of a match in that form.
+
+    with closing(connect(odds_db_path, readonly=True)) as conn:
+        for snap in load_depth(conn, match_id):
+            back_prices, back_sizes = snap.back[:, 0], snap.back[:, 1]
+"""
+
+import sqlite3
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+
+LEVEL_DTYPE = np.dtype("<f4")
+
+
+class DepthSnapshot(NamedTuple):
+    match_id: int
+    selection_id: int
+    request_time: str
+    back: np.ndarray  # (levels, 2) price/size, best first
+    lay: np.ndarray
+    traded: np.ndarray  # (prices, 2) price/matched volume
+
+
+def unpack_levels(blob: bytes) -> np.ndarray:
+    """Decode a packed ladder into a read-only (levels, 2) float32 array"""
+    return np.frombuffer(blob, dtype=LEVEL_DTYPE).reshape(-1, 2)
+
+
+def load_depth(
+    conn: sqlite3.Connection, match_id: int, selection_id: Optional[int] = None
+) -> List[DepthSnapshot]:
+    """Every depth snapshot of a match (optionally one runner), oldest first"""
+    query = """
+        SELECT match_id, selection_id, request_time,
+            available_to_back, available_to_lay, traded_volume
+        FROM odds_depth
+        WHERE match_id = ?
+    """
+    params = [match_id]
+    if selection_id is not None:
+        query += " AND selection_id = ?"
+        params.append(selection_id)
+    query += " ORDER BY request_time, selection_id"
+
+    return [
+        DepthSnapshot(
+            match_id,
+            selection_id,
+            request_time,
+            unpack_levels(back),
+            unpack_levels(lay),
+            unpack_levels(traded),
+        )
+        for match_id, selection_id, request_time, back, lay, traded in conn.execute(
+            query, params
+        )
+    ]
+
+
+def available_liquidity(
+    snapshot: DepthSnapshot, max_levels: Optional[int] = None
+) -> tuple:
+    """Total (back, lay) size on offer, over the best max_levels levels if given"""
+    return (
+        float(snapshot.back[:max_levels, 1].sum()),
+        float(snapshot.lay[:max_levels, 1].sum()),
+    )
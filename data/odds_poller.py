@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Continuous Betfair odds collector
+
+Keeps the cached Betfair session alive (see betfair_session.py) and polls each
+MATCH_ODDS market at a cadence that tightens as kickoff approaches (see
+POLL_SCHEDULE). Markets that go in-play or close are dropped from the
+schedule, suspended ones are skipped until they reopen, and the event list
+is re-read every --discovery-interval seconds to pick up newly listed
+matches.
+
+Usage:
+    python odds_poller.py
+    python odds_poller.py --db-path path/to/odds.db \
+        --fixtures-db-path path/to/fixtures.db
+"""
+
+import time
+import argparse
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Any, NamedTuple, Optional
+
+from db import checkpoint
+from betfair_odds_collector import (
+    BetfairClient,
+    OddsDatabase,
+    is_finished,
+    is_paused,
+    make_client,
+    parse_args as parse_collector_args,
+    store_match_odds,
+)
+
+# (time to kickoff below which the interval applies, polling interval),
+# checked in order; markets further out than the last bound use
+# DEFAULT_POLL_INTERVAL.
+POLL_SCHEDULE = [
+    (timedelta(0), timedelta(minutes=1)),  # Past scheduled kickoff, not yet in-play
+    (timedelta(hours=1), timedelta(minutes=1)),
+    (timedelta(hours=6), timedelta(minutes=5)),
+    (timedelta(days=1), timedelta(minutes=15)),
+    (timedelta(days=7), timedelta(hours=1)),
+]
+DEFAULT_POLL_INTERVAL = timedelta(hours=6)
+
+# Truncate the odds DB's WAL when the next poll is at least this far away
+IDLE_CHECKPOINT_SECONDS = 30
+
+
+def poll_interval(time_to_kickoff: timedelta) -> timedelta:
+    """How long to wait before polling a market this far from kickoff"""
+    for bound, interval in POLL_SCHEDULE:
+        if time_to_kickoff <= bound:
+            return interval
+    return DEFAULT_POLL_INTERVAL
+
+
+def parse_open_date(open_date: str) -> datetime:
+    """Parse a Betfair openDate like 2025-09-13T14:00:00.000Z"""
+    return datetime.fromisoformat(open_date.replace("Z", "+00:00"))
+
+
+class ScheduledMarket(NamedTuple):
+    match: Dict[str, Any]
+    market_info: Dict[str, Any]
+    kickoff: datetime
+    next_poll: datetime
+
+
+class OddsPoller:
+    """Polls open MATCH_ODDS markets on a kickoff-dependent schedule"""
+
+    def __init__(
+        self,
+        client: BetfairClient,
+        db: OddsDatabase,
+        discovery_interval: timedelta = timedelta(hours=1),
+    ):
+        self.client = client
+        self.db = db
+        self.discovery_interval = discovery_interval
+        self.competition_id = None
+        self.markets: Dict[str, ScheduledMarket] = {}
+        self.finished_markets = set()
+        self.next_discovery = datetime.now(timezone.utc)
+
+    def discover(self, now: datetime):
+        """Add newly listed matches to the schedule"""
+        if self.competition_id is None:
+            self.competition_id = self.client.get_premier_league_id()
+
+        matches = self.client.get_upcoming_matches(self.competition_id)
+        new_matches = {
+            match["event"]["id"]: match
+            for match in matches
+            if match["event"]["id"]
+            not in {m.match["event"]["id"] for m in self.markets.values()}
+        }
+
+        if new_matches:
+            for market_info in self.client.get_match_odds_catalogue(list(new_matches)):
+                market_id = market_info["marketId"]
+                if market_id in self.finished_markets:
+                    continue
+                self.markets[market_id] = ScheduledMarket(
+                    match=new_matches[market_info["event"]["id"]],
+                    market_info=market_info,
+                    kickoff=parse_open_date(market_info["event"]["openDate"]),
+                    next_poll=now,
+                )
+            print(
+                f"Scheduled {len(new_matches)} new matches, "
+                f"{len(self.markets)} in total"
+            )
+
+        self.next_discovery = now + self.discovery_interval
+
+    def poll_due(self, now: datetime) -> int:
+        """Fetch and store every market whose next poll time has passed"""
+        due = [m for m, s in self.markets.items() if s.next_poll <= now]
+        if not due:
+            return 0
+
+        books = self.client.get_market_books(due, self.db.price_data)
+        request_time = datetime.now().isoformat()
+
+        with self.db.session():
+            for market_book in books:
+                # In-play and closed books would replace the pre-play latest_odds
+                if is_finished(market_book) or is_paused(market_book):
+                    continue
+                scheduled = self.markets[market_book["marketId"]]
+                store_match_odds(
+                    self.db,
+                    scheduled.match,
+                    {"market_info": scheduled.market_info, "market_book": market_book},
+                    request_time,
+                )
+
+        polled = set()
+        for market_book in books:
+            market_id = market_book["marketId"]
+            polled.add(market_id)
+            scheduled = self.markets[market_id]
+            if is_finished(market_book):
+                reason = "in-play" if market_book.get("inplay") else "CLOSED"
+                print(f"Stopped polling {scheduled.match['event']['name']} ({reason})")
+                del self.markets[market_id]
+                self.finished_markets.add(market_id)
+            else:
+                if is_paused(market_book):
+                    print(
+                        f"Skipped {scheduled.match['event']['name']} "
+                        f"({market_book.get('status')})"
+                    )
+                self.markets[market_id] = scheduled._replace(
+                    next_poll=now + poll_interval(scheduled.kickoff - now)
+                )
+
+        # Markets the API no longer returns have been removed from the exchange
+        for market_id in set(due) - polled:
+            del self.markets[market_id]
+            self.finished_markets.add(market_id)
+
+        print(
+            f"{request_time}: polled {len(books)} markets, "
+            f"{len(self.markets)} scheduled"
+        )
+        return len(books)
+
+    def next_wakeup(self) -> datetime:
+        next_polls = [s.next_poll for s in self.markets.values()]
+        return min(next_polls + [self.next_discovery])
+
+    def run_forever(self):
+        with self.db:
+            while True:
+                now = datetime.now(timezone.utc)
+                try:
+                    if now >= self.next_discovery:
+                        self.discover(now)
+                    self.poll_due(now)
+                except Exception as e:
+                    # Keep the daemon alive; the failed markets are retried next cycle
+                    print(f"Error occurred: {e}")
+                    time.sleep(60)
+                    continue
+
+                sleep_for = (
+                    self.next_wakeup() - datetime.now(timezone.utc)
+                ).total_seconds()
+                if sleep_for > IDLE_CHECKPOINT_SECONDS:
+                    # Nothing to write for a while: fold the WAL back and reset it
+                    busy, wal_pages, checkpointed = checkpoint(self.db.conn, "TRUNCATE")
+                    if busy:
+                        # A reader is holding the WAL; it is retried next idle spell
+                        print(
+                            f"WAL checkpoint blocked by a reader: {checkpointed} of "
+                            f"{wal_pages} pages copied back"
+                        )
+                if sleep_for > 0:
+                    time.sleep(sleep_for)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Continuous Betfair odds collector")
+    parser.add_argument(
+        "--discovery-interval",
+        type=int,
+        default=3600,
+        help="Seconds between checks for newly listed matches",
+    )
+    args, remaining = parser.parse_known_args(argv)
+    # Database, API URL and session options are shared with betfair_odds_collector.py
+    args.__dict__.update(vars(parse_collector_args(remaining)))
+    return args
+
+
+def main(args: argparse.Namespace):
+    try:
+        db = OddsDatabase(
+            args.db_path,
+            fixtures_db_path=args.fixtures_db_path,
+            store_changes_only=args.changes_only,
+            capture_depth=args.depth,
+        )
+    except FileNotFoundError as e:
+        print(f"❌ {e}")
+        print("Run: python init_dbs.py")
+        return
+
+    client = make_client(args)
+    poller = OddsPoller(
+        client, db, discovery_interval=timedelta(seconds=args.discovery_interval)
+    )
+
+    print("Polling Premier League odds, press Ctrl+C to stop")
+    try:
+        poller.run_forever()
+    except KeyboardInterrupt:
+        print("Stopping odds poller")
+    finally:
+        client.pool.close()
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,178 @@
+"""
+Rate limiting, retries and circuit breaking for external API calls
+
+Each external API gets one RequestScheduler. It spaces requests with a
+token bucket sized to the API's published limits, retries transient
+failures (429s, 5xx, timeouts) with jittered exponential backoff, and stops
+calling an API that keeps failing until it has had time to recover:
+
+    scheduler = RequestScheduler("football-data", rate=10 / 60, capacity=10)
+    response = scheduler.call(fetch, url, weight=1)
+
+The callable signals a transient failure by raising RetryableError; any
+other exception is passed straight through without a retry.
+"""
+
+import time
+import random
+import threading
+from typing import Any, Callable, Optional
+
+
+class RetryableError(Exception):
+    """A transient failure worth retrying, optionally after retry_after seconds"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an API whose circuit breaker is open"""
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at rate tokens per second"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, weight: float = 1) -> float:
+        """Wait for weight tokens and take them; returns the seconds waited"""
+        # A request heavier than the whole bucket would otherwise wait forever
+        weight = min(weight, self.capacity)
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    return waited
+                delay = (weight - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures
+
+    While open, calls fail fast with CircuitOpenError. After reset_timeout
+    seconds one trial call is let through (half-open); its success closes the
+    circuit and its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_request(self, name: str):
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return
+            if state == "half-open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return
+            remaining = max(self.reset_timeout - (time.monotonic() - self.opened_at), 0)
+            raise CircuitOpenError(
+                f"{name} circuit open after {self.failures} consecutive failures, "
+                f"retrying in {remaining:.0f}s"
+            )
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+
+class RequestScheduler:
+    """Token bucket, retry with backoff and circuit breaker for one API"""
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        capacity: Optional[float] = None,
+        max_retries: int = 5,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 60.0,
+    ):
+        self.name = name
+        self.bucket = TokenBucket(rate, capacity or rate)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Full-jitter exponential backoff, never below the server's Retry-After"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def call(self, fn: Callable[..., Any], *args, weight: float = 1, **kwargs) -> Any:
+        """Call fn once the bucket allows it, retrying RetryableErrors
+
+        The last RetryableError is re-raised once max_retries is exhausted.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before_request(self.name)
+            self.bucket.acquire(weight)
+            try:
+                result = fn(*args, **kwargs)
+            except RetryableError as e:
+                self.breaker.record_failure()
+                if attempt == self.max_retries or self.breaker.state != "closed":
+                    raise
+                delay = self.backoff(attempt, e.retry_after)
+                self.retries += 1
+                print(f"{self.name}: {e}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            except Exception:
+                # Not a transient failure: the call reached the API, so don't count it
+                self.breaker.record_success()
+                raise
+            self.breaker.record_success()
+            return result
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds from a Retry-After (or similar) header, if it holds a number"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
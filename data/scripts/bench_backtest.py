@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Backtest benchmark
+
+Builds a synthetic season of odds history (380 finished matches, 3 runners,
+one collection session a minute for --hours before each kickoff, stored
+changes-only like the collector's --changes-only mode) and times loading it
+with betting/backtest.py and running each built-in strategy over it. Then
+times a betting/sweep.py parameter grid with each --workers count.
+
+Usage:
+    python bench_backtest.py
+    python bench_backtest.py --hours 6 --change-rate 0.5 --workers 1,2,4,8
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from contextlib import closing
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import connect
+from init_dbs import init_odds_database
+from premier_league_fixtures import PremierLeagueFixtures
+from betting.backtest import (
+    STRATEGIES,
+    load_results,
+    load_snapshots,
+    price_move,
+    run_backtest,
+    summarize,
+)
+from betting.sweep import parameter_grid, run_sweep
+
+NUM_MATCHES = 380
+SEASON_START = datetime(2025, 8, 15, 20, 0)
+
+# The synthetic prices move about 1% at a time
+STRATEGY_PARAMS = {"price_move": {"threshold": 0.01}}
+SWEEP_GRID = {
+    "threshold": [0.005, 0.01, 0.02, 0.05],
+    "stake": [5.0, 10.0],
+    "side": ["back", "lay", "both"],
+}
+
+
+def create_season(directory: str, hours: int, change_rate: float, seed: int = 0):
+    """Write synthetic odds, odds_coverage and fixtures databases into directory"""
+    rng = np.random.default_rng(seed)
+    odds_db_path = os.path.join(directory, "premier_league_odds.db")
+    init_odds_database(odds_db_path)
+
+    sessions = hours * 60
+    odds_rows, coverage_rows, fixtures = [], [], []
+    for match_id in range(NUM_MATCHES):
+        kickoff = SEASON_START + timedelta(hours=match_id * 7)
+        times = [
+            (kickoff - timedelta(minutes=sessions - i)).isoformat()
+            for i in range(sessions)
+        ]
+        coverage_rows.extend((match_id, t) for t in times)
+
+        # Multiplicative random walk per runner; only changed prices are stored
+        prices = rng.uniform(1.5, 8.0, 3) * np.exp(
+            np.cumsum(
+                rng.normal(0, 0.01, (sessions, 3))
+                * (rng.random((sessions, 3)) < change_rate),
+                axis=0,
+            )
+        )
+        prices = np.maximum(np.round(prices, 2), 1.01)
+        changed = np.ones((sessions, 3), dtype=bool)
+        changed[1:] = prices[1:] != prices[:-1]
+        for session, runner in zip(*np.nonzero(changed)):
+            session, runner = int(session), int(runner)
+            price = float(prices[session, runner])
+            odds_rows.append(
+                (
+                    match_id,
+                    match_id * 3 + runner,
+                    f"Runner {runner}",
+                    ["Home win", "Away win", "Draw"][runner],
+                    price,
+                    100.0,
+                    round(price + 0.02, 2),
+                    100.0,
+                    price,
+                    1000.0,
+                    "ACTIVE",
+                    times[session],
+                )
+            )
+
+        home_score, away_score = rng.integers(0, 4, 2)
+        fixtures.append(
+            {
+                "id": match_id,
+                "matchday": match_id // 10 + 1,
+                "utcDate": kickoff.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "status": "FINISHED",
+                "homeTeam": {"name": f"Team {2 * (match_id % 10)}"},
+                "awayTeam": {"name": f"Team {2 * (match_id % 10) + 1}"},
+                "score": {
+                    "fullTime": {"home": int(home_score), "away": int(away_score)}
+                },
+            }
+        )
+
+    with closing(connect(odds_db_path)) as conn:
+        with conn:
+            conn.executemany(
+                """
+                INSERT INTO odds (match_id, selection_id, runner_name, runner_type,
+                    best_back_price, best_back_size, best_lay_price, best_lay_size,
+                    last_price_traded, total_matched, status, request_time)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                odds_rows,
+            )
+            conn.executemany(
+                "INSERT INTO odds_coverage (match_id, request_time) VALUES (?, ?)",
+                coverage_rows,
+            )
+
+    fixtures_db = PremierLeagueFixtures(
+        os.path.join(directory, "premier_league_2025_26.db")
+    )
+    fixtures_db.create_database()
+    fixtures_db.insert_fixtures(fixtures)
+    return len(odds_rows), len(coverage_rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest benchmark")
+    parser.add_argument(
+        "--hours", type=int, default=24, help="Hours of minute sessions per match"
+    )
+    parser.add_argument(
+        "--change-rate",
+        type=float,
+        default=0.3,
+        help="Chance a runner's price moves in a session",
+    )
+    parser.add_argument(
+        "--workers",
+        default="1,2,4",
+        help="Comma-separated worker counts to time the sweep with",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Building {NUM_MATCHES} matches x {args.hours * 60} sessions...")
+        odds_rows, sessions = create_season(tmp, args.hours, args.change_rate)
+        print(f"  {odds_rows:,} odds rows, {sessions:,} sessions")
+
+        start = time.perf_counter()
+        snapshots = load_snapshots(os.path.join(tmp, "premier_league_odds.db"))
+        results = load_results(
+            os.path.join(tmp, "premier_league_2025_26.db"), snapshots
+        )
+        print(
+            f"Loaded {len(snapshots.match_id):,} runner snapshots in "
+            f"{time.perf_counter() - start:.2f}s"
+        )
+
+        for name, strategy in STRATEGIES.items():
+            start = time.perf_counter()
+            bets = run_backtest(
+                snapshots, results, strategy, **STRATEGY_PARAMS.get(name, {})
+            )
+            elapsed = time.perf_counter() - start
+            summary = summarize(bets)
+            print(
+                f"  {name:<16} {elapsed:6.2f}s  {summary['bets']:>9,} bets  "
+                f"profit {summary['profit']:>12,.2f}  roi {summary['roi']:+.3f}"
+            )
+
+        sets = len(parameter_grid(SWEEP_GRID))
+        print(f"\nSweeping price_move over {sets} parameter sets:")
+        baseline = None
+        for workers in [int(w) for w in args.workers.split(",")]:
+            start = time.perf_counter()
+            run_sweep(snapshots, results, price_move, SWEEP_GRID, workers)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(
+                f"  {workers:>2} workers  {elapsed:6.2f}s  "
+                f"{sets / elapsed:6.1f} sets/s  "
+                f"speedup {baseline / elapsed:.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Bets database benchmark
+
+Builds a synthetic bets table (1M rows by default) with the unindexed
+version 1 schema, times settlement and per-bettor lookups, then applies the
+remaining bets migrations in place and times the same queries again.
+
+Usage:
+    python bench_bets_db.py
+    python bench_bets_db.py --bets 200000 --repeat 50
+"""
+
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import statistics
+from contextlib import closing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import BETS_MIGRATIONS, get_schema_version, migrate
+from betting.book import CREATE_SETTLEMENT_TABLE_SQL, SETTLE_BETS_SQL
+
+NUM_MATCHES = 380
+NUM_BETTORS = 10000
+
+# The queries behind /api/bettors and /api/bets/:bettorId in webapp/server/index.js
+BETTORS_QUERY = "SELECT DISTINCT bettor_id FROM bets ORDER BY bettor_id"
+BETTOR_BETS_QUERY = """
+    SELECT id, bettor_id, match_id, selection_id, runner_name, runner_type, back_or_lay,
+        bet_amount, selection_odds, created_at, status, bet_won, returned_amount
+    FROM bets b
+    WHERE b.bettor_id = ? AND b.status = ?
+    ORDER BY b.created_at DESC
+"""
+PENDING_MATCHES_QUERY = "SELECT DISTINCT match_id FROM bets WHERE status = 'PLACED'"
+
+
+def create_bets(db_path: str, num_bets: int, placed_fraction: float):
+    """Fill a version 1 bets table; the last matches of the season are still PLACED"""
+    conn = sqlite3.connect(db_path)
+    version, description, statements = BETS_MIGRATIONS[0]
+    get_schema_version(conn)
+    with conn:
+        for statement in statements:
+            conn.execute(statement)
+        conn.execute(
+            "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+            (version, description),
+        )
+
+    rng = random.Random(0)
+    first_open_match = int(NUM_MATCHES * (1 - placed_fraction))
+
+    def rows():
+        for i in range(num_bets):
+            match_id = rng.randrange(NUM_MATCHES)
+            selection = rng.randrange(3)
+            settled = match_id < first_open_match
+            yield (
+                rng.randrange(NUM_BETTORS),
+                match_id,
+                match_id * 3 + selection,
+                f"Runner {selection}",
+                ["Home win", "Away win", "Draw"][selection],
+                "BACK" if rng.random() < 0.5 else "LAY",
+                10.0,
+                round(rng.uniform(1.2, 10.0), 2),
+                f"2025-{8 + match_id * 10 // NUM_MATCHES:02d}-01 12:00:{i % 60:02d}",
+                "SETTLED" if settled else "PLACED",
+            )
+
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO bets (
+                bettor_id, match_id, selection_id, runner_name, runner_type,
+                back_or_lay, bet_amount, selection_odds, created_at, status
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+            rows(),
+        )
+    conn.close()
+    return first_open_match
+
+
+def timed(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def run_queries(db_path: str, first_open_match: int, repeat: int):
+    rng = random.Random(1)
+    results = {}
+
+    with closing(sqlite3.connect(db_path)) as conn:
+
+        def settle_one_match():
+            match_id = rng.randrange(first_open_match, NUM_MATCHES)
+            conn.execute("BEGIN")
+            conn.execute(CREATE_SETTLEMENT_TABLE_SQL)
+            conn.execute(
+                "INSERT INTO settlement VALUES (?, ?, ?)",
+                (match_id, match_id * 3, "Home win"),
+            )
+            conn.execute(SETTLE_BETS_SQL)
+            # Roll back so every repeat settles the same amount of work
+            conn.rollback()
+
+        results["pending settlement matches"] = timed(
+            lambda: conn.execute(PENDING_MATCHES_QUERY).fetchall(), repeat
+        )
+        results["settle one match"] = timed(settle_one_match, repeat)
+        results["bettor bets (PLACED)"] = timed(
+            lambda: conn.execute(
+                BETTOR_BETS_QUERY, (rng.randrange(NUM_BETTORS), "PLACED")
+            ).fetchall(),
+            repeat,
+        )
+        results["bettor list"] = timed(
+            lambda: conn.execute(BETTORS_QUERY).fetchall(), repeat
+        )
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bets database benchmark")
+    parser.add_argument("--bets", type=int, default=1_000_000)
+    parser.add_argument(
+        "--placed-fraction",
+        type=float,
+        default=0.05,
+        help="Fraction of the season's matches whose bets are still PLACED",
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench_bets.db")
+
+        print(f"Creating {args.bets:,} bets...")
+        start = time.perf_counter()
+        first_open_match = create_bets(db_path, args.bets, args.placed_fraction)
+        print(f"  {time.perf_counter() - start:.1f}s")
+
+        before = run_queries(db_path, first_open_match, args.repeat)
+
+        print("Migrating schema...")
+        start = time.perf_counter()
+        with closing(sqlite3.connect(db_path)) as conn:
+            version = migrate(conn, BETS_MIGRATIONS)
+        print(f"  schema version {version} in {time.perf_counter() - start:.1f}s")
+
+        after = run_queries(db_path, first_open_match, args.repeat)
+
+    new = f"v{version}"
+    print(
+        f"\n{'query':<28} {'v1 median':>10} {'v1 p95':>9} "
+        f"{new + ' median':>10} {new + ' p95':>9}  (ms)"
+    )
+    for name in before:
+        print(
+            f"{name:<28} {before[name][0]:>10.2f} {before[name][1]:>9.2f} "
+            f"{after[name][0]:>10.2f} {after[name][1]:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Odds collector benchmark
+
+Runs betfair_odds_collector.main() repeatedly against a replayed JSON-RPC
+recording, so no Betfair credentials or network are needed and every run
+does identical work. Without --recording, a few sweeps are first recorded
+from an in-process betfair_stub_server.py. Reports sweeps per second and odds
+rows written per second, in sync and async mode.
+
+Usage:
+    python bench_collector.py
+    python bench_collector.py --matches 10 --sweeps 200
+    python bench_collector.py --recording sweeps.jsonl \
+        --min-sweeps-per-second 50                      # CI gate
+"""
+
+import io
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+import threading
+import statistics
+from contextlib import closing, redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from betfair_odds_collector import (
+    BetfairClient,
+    ConnectionPool,
+    main as collect,
+    parse_args,
+)
+from betfair_transport import RecordingTransport, ReplayTransport
+from betfair_stub_server import init_stub_databases, serve
+
+
+def collect_checked(args: argparse.Namespace, client: BetfairClient) -> float:
+    """Run one collector sweep quietly and return its duration; raise if it
+    stored no collection session
+
+    main() reports failures by printing them, so without this check a failed
+    sweep would be timed as a very fast one.
+    """
+    sessions_before = coverage_rows(args.db_path)
+    output = io.StringIO()
+    start = time.perf_counter()
+    with redirect_stdout(output):
+        collect(args, client)
+    elapsed = time.perf_counter() - start
+    if coverage_rows(args.db_path) == sessions_before:
+        raise RuntimeError(f"Collector sweep stored nothing:\n{output.getvalue()}")
+    return elapsed
+
+
+def record_sweeps(path: str, directory: str, num_matches: int, sweeps: int):
+    """Record sweeps from a local stub server into path"""
+    server = serve(port=0, num_matches=num_matches)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    api_url = (
+        f"http://127.0.0.1:{server.server_address[1]}/exchange/betting/json-rpc/v1"
+    )
+    args = parse_args(
+        [
+            "--db-path",
+            os.path.join(directory, "premier_league_odds.db"),
+            "--fixtures-db-path",
+            os.path.join(directory, "premier_league_2025_26.db"),
+        ]
+    )
+    try:
+        for _ in range(sweeps):
+            # The collector closes the client's transport after every sweep
+            client = BetfairClient(
+                session_token="stub",
+                transport=RecordingTransport(ConnectionPool(api_url), path),
+            )
+            collect_checked(args, client)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def odds_rows(db_path: str) -> int:
+    with closing(sqlite3.connect(db_path)) as conn:
+        return conn.execute("SELECT COUNT(*) FROM odds").fetchone()[0]
+
+
+def coverage_rows(db_path: str) -> int:
+    with closing(sqlite3.connect(db_path)) as conn:
+        return conn.execute("SELECT COUNT(*) FROM odds_coverage").fetchone()[0]
+
+
+def run_sweeps(recording: str, directory: str, sweeps: int, extra_args: list) -> dict:
+    db_path = os.path.join(directory, "premier_league_odds.db")
+    args = parse_args(
+        [
+            "--replay",
+            recording,
+            "--db-path",
+            db_path,
+            "--fixtures-db-path",
+            os.path.join(directory, "premier_league_2025_26.db"),
+        ]
+        + extra_args
+    )
+
+    # One transport for every sweep, so the recorded sweeps are cycled through
+    client = BetfairClient(session_token="replay", transport=ReplayTransport(recording))
+
+    rows_before = odds_rows(db_path)
+    samples = []
+    for _ in range(sweeps):
+        samples.append(collect_checked(args, client))
+    total = sum(samples)
+    samples.sort()
+
+    return {
+        "sweeps/s": sweeps / total,
+        "rows/s": (odds_rows(db_path) - rows_before) / total,
+        "p50 ms": statistics.median(samples) * 1000,
+        "p95 ms": samples[int(len(samples) * 0.95) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Odds collector benchmark")
+    parser.add_argument(
+        "--recording", help="Use this --record file instead of recording the stub"
+    )
+    parser.add_argument(
+        "--matches", type=int, default=10, help="Stub events when recording"
+    )
+    parser.add_argument("--record-sweeps", type=int, default=3, help="Sweeps to record")
+    parser.add_argument(
+        "--sweeps", type=int, default=100, help="Sweeps to time per mode"
+    )
+    parser.add_argument(
+        "--min-sweeps-per-second",
+        type=float,
+        help="Exit with status 1 if any mode is slower than this",
+    )
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        init_stub_databases(tmp, args.matches)
+        recording = args.recording
+        if recording is None:
+            recording = os.path.join(tmp, "sweeps.jsonl")
+            print(
+                f"Recording {args.record_sweeps} sweeps of {args.matches} "
+                "matches from the stub..."
+            )
+            record_sweeps(recording, tmp, args.matches, args.record_sweeps)
+
+        for name, extra_args in [
+            ("sync", []),
+            ("async", ["--async"]),
+            ("sync, changes only", ["--changes-only"]),
+        ]:
+            results[name] = run_sweeps(recording, tmp, args.sweeps, extra_args)
+
+    print(f"\n{'mode':<20} {'sweeps/s':>9} {'rows/s':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, result in results.items():
+        print(
+            f"{name:<20} {result['sweeps/s']:>9.1f} {result['rows/s']:>9.0f} "
+            f"{result['p50 ms']:>8.2f} {result['p95 ms']:>8.2f}"
+        )
+
+    if args.min_sweeps_per_second is not None:
+        slow = [
+            n for n, r in results.items() if r["sweeps/s"] < args.min_sweeps_per_second
+        ]
+        if slow:
+            print(f"\nBelow {args.min_sweeps_per_second} sweeps/s: {', '.join(slow)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,6 @@ source venv/bin/activate
 # Get latest odds
 python data/betfair_odds_collector.py
 # Update fixtures data
-python data/scripts/premier_league_fixtures.py --update --db-path data/premier_league_2025_26.db
-# Resolve bets
-python data/betting/book.py
+python data/scripts/premier_league_fixtures.py --update --incremental --db-path data/premier_league_2025_26.db --changes-file data/fixture_changes.json
+# Resolve bets on newly finished matches
+python data/betting/book.py --changes-file data/fixture_changes.json
@@ -9,21 +9,118 @@ with the latest results and changes.
 Usage:
     python premier_league_fixtures.py                    # Create new database
     python premier_league_fixtures.py --update           # Update existing fixtures
+    python premier_league_fixtures.py --update --incremental  # Recent and upcoming only
     python premier_league_fixtures.py --db-path path/to/db.db --update  # Custom db path
 """
 
 import sqlite3
 import requests
 import json
-from datetime import datetime
-from typing import Dict, List, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional
 import os
 import argparse
+import sys
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import connect
+from http_cache import CachedSession
+from request_scheduler import CircuitOpenError, RequestScheduler, RetryableError
+from migrations import FIXTURES_MIGRATIONS, migrate_database
+
+# How long a football-data.org response is served from the HTTP cache before
+# it is revalidated; the teams list basically never changes mid-season
+FOOTBALL_DATA_TTLS = {
+    "/competitions/PL/teams": 7 * 24 * 3600,
+    "/competitions/PL/matches": 10 * 60,
+}
+
+# football-data.org's free tier allows 10 requests a minute
+FOOTBALL_DATA_REQUESTS_PER_MINUTE = 10
+FOOTBALL_DATA_TIMEOUT = 30
+
+# Incremental updates fetch matches from this many days ago up to this many
+# days ahead, which covers recent results and reschedulings of upcoming games
+INCREMENTAL_LOOKBACK_DAYS = 3
+INCREMENTAL_LOOKAHEAD_DAYS = 14
+
+# Statuses after which a fixture no longer changes
+FINAL_STATUSES = ("FINISHED", "AWARDED", "CANCELLED")
+
+# Columns compared to decide whether a stored fixture needs updating
+DIFF_COLUMNS = ["home_score", "away_score", "status", "date", "time"]
+
+
+class FixtureChanges(NamedTuple):
+    """What an update changed, for downstream jobs such as bet settlement
+
+    finished holds the match_ids that became FINISHED or had a finished
+    score corrected, i.e. the matches whose bets need (re)settling.
+    """
+
+    added: List[int]
+    updated: List[int]
+    finished: List[int]
+
+    def to_json(self) -> str:
+        return json.dumps(self._asdict())
+
+
+# fixtures columns in fixture_row() order
+ROW_COLUMNS = [
+    "match_id",
+    "matchday",
+    "date",
+    "time",
+    "home_team",
+    "away_team",
+    "home_team_id",
+    "away_team_id",
+    "status",
+    "venue",
+    "home_score",
+    "away_score",
+    "season",
+    "updated_at",
+]
+
+
+def fixture_row(fixture: Dict, updated_at: str) -> tuple:
+    """Flatten an API match into a fixtures row, in ROW_COLUMNS order"""
+    utc_date = fixture.get("utcDate", "")
+    date_part = utc_date.split("T")[0] if utc_date else ""
+    time_part = utc_date.split("T")[1].replace("Z", "") if "T" in utc_date else ""
+
+    home_team = fixture.get("homeTeam", {})
+    away_team = fixture.get("awayTeam", {})
+    score = fixture.get("score", {}).get("fullTime", {})
+
+    return (
+        fixture.get("id"),
+        fixture.get("matchday"),
+        date_part,
+        time_part,
+        home_team.get("name"),
+        away_team.get("name"),
+        home_team.get("id"),
+        away_team.get("id"),
+        fixture.get("status"),
+        fixture.get("venue"),
+        score.get("home") if score else None,
+        score.get("away") if score else None,
+        "2025-26",
+        updated_at,
+    )
+
 
 class PremierLeagueFixtures:
-    def __init__(self, db_path: str = "premier_league_2025_26.db"):
+    def __init__(
+        self,
+        db_path: str = "premier_league_2025_26.db",
+        cache_dir: Optional[str] = None,
+    ):
         # Load environment variables from .env file
         load_dotenv()
 
@@ -31,69 +128,60 @@ class PremierLeagueFixtures:
         self.base_url = "https://api.football-data.org/v4"
         self.headers = {"X-Auth-Token": os.getenv("FOOTBALL_DATA_API_KEY", "")}
 
-    def create_database(self) -> None:
-        """Create the SQLite database and tables"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Create fixtures table
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS fixtures (
-                id INTEGER PRIMARY KEY,
-                match_id INTEGER UNIQUE,
-                matchday INTEGER,
-                date TEXT,
-                time TEXT,
-                home_team TEXT,
-                away_team TEXT,
-                home_team_id INTEGER,
-                away_team_id INTEGER,
-                status TEXT,
-                venue TEXT,
-                home_score INTEGER,
-                away_score INTEGER,
-                season TEXT,
-                updated_at TEXT
+        # API responses are cached next to the database by default
+        if cache_dir is None:
+            cache_dir = os.path.join(
+                os.path.dirname(os.path.abspath(db_path)), ".http_cache"
             )
-        """
+        self.http = CachedSession(
+            cache_dir,
+            ttls=FOOTBALL_DATA_TTLS,
+            scheduler=RequestScheduler(
+                "football-data.org",
+                rate=FOOTBALL_DATA_REQUESTS_PER_MINUTE / 60,
+                capacity=FOOTBALL_DATA_REQUESTS_PER_MINUTE,
+            ),
         )
 
-        # Create teams table
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS teams (
-                id INTEGER PRIMARY KEY,
-                team_id INTEGER UNIQUE,
-                name TEXT,
-                short_name TEXT,
-                tla TEXT,
-                crest TEXT,
-                founded INTEGER,
-                venue TEXT
-            )
+    def create_database(self) -> None:
+        """Create the SQLite database and tables, or migrate an existing one"""
+        migrate_database(self.db_path, FIXTURES_MIGRATIONS, verbose=False)
+
+    def get_premier_league_fixtures(
+        self,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+    ) -> Optional[List[Dict]]:
+        """Download Premier League fixtures from football-data.org API
+
+        date_from/date_to (YYYY-MM-DD) narrow the request to part of the
+        season; without them the whole season is returned. Returns None if
+        the request failed, and an empty list if it matched no fixtures.
         """
-        )
-
-        conn.commit()
-        conn.close()
-
-    def get_premier_league_fixtures(self) -> Optional[List[Dict]]:
-        """Download Premier League fixtures from football-data.org API"""
         try:
             # Premier League competition ID is 'PL'
             url = f"{self.base_url}/competitions/PL/matches"
 
             # Get current season fixtures (no season parameter needed)
-            print("Fetching Premier League fixtures...")
-            response = requests.get(url, headers=self.headers)
+            params = {}
+            if date_from:
+                params["dateFrom"] = date_from
+            if date_to:
+                params["dateTo"] = date_to
+            if params:
+                print(f"Fetching Premier League fixtures ({params})...")
+            else:
+                print("Fetching Premier League fixtures...")
+            response = self.http.get(
+                url, headers=self.headers, params=params, timeout=FOOTBALL_DATA_TIMEOUT
+            )
 
             if response.status_code == 200:
                 data = response.json()
                 matches = data.get("matches", [])
-                if matches:
-                    print(f"Found {len(matches)} fixtures")
-                    return matches
+                cached = " (cached)" if response.from_cache else ""
+                print(f"Found {len(matches)} fixtures{cached}")
+                return matches
             elif response.status_code == 403:
                 print(
                     "API key required or invalid. Please check FOOTBALL_DATA_API_KEY environment variable."
@@ -103,7 +191,7 @@ class PremierLeagueFixtures:
                 print(f"Error fetching data: {response.status_code}")
                 return None
 
-        except requests.RequestException as e:
+        except (requests.RequestException, RetryableError, CircuitOpenError) as e:
             print(f"Request failed: {e}")
             return None
 
@@ -114,25 +202,28 @@ class PremierLeagueFixtures:
 
             # Get current season teams (no season parameter needed)
             print("Fetching Premier League teams...")
-            response = requests.get(url, headers=self.headers)
+            response = self.http.get(
+                url, headers=self.headers, timeout=FOOTBALL_DATA_TIMEOUT
+            )
 
             if response.status_code == 200:
                 data = response.json()
                 teams = data.get("teams", [])
                 if teams:
-                    print(f"Found {len(teams)} teams")
+                    cached = " (cached)" if response.from_cache else ""
+                    print(f"Found {len(teams)} teams{cached}")
                     return teams
             else:
                 print(f"Error fetching teams: {response.status_code}")
                 return None
 
-        except requests.RequestException as e:
+        except (requests.RequestException, RetryableError, CircuitOpenError) as e:
             print(f"Request failed: {e}")
             return None
 
     def insert_teams(self, teams: List[Dict]) -> None:
         """Insert teams data into database"""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect(self.db_path)
         cursor = conn.cursor()
 
         for team in teams:
@@ -159,202 +250,167 @@ class PremierLeagueFixtures:
 
     def insert_fixtures(self, fixtures: List[Dict]) -> None:
         """Insert fixtures data into database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        for fixture in fixtures:
-            # Parse date and time
-            utc_date = fixture.get("utcDate", "")
-            date_part = utc_date.split("T")[0] if utc_date else ""
-            time_part = (
-                utc_date.split("T")[1].replace("Z", "") if "T" in utc_date else ""
-            )
-
-            # Extract team information
-            home_team = fixture.get("homeTeam", {})
-            away_team = fixture.get("awayTeam", {})
-            score = fixture.get("score", {}).get("fullTime", {})
-
-            cursor.execute(
-                """
-                INSERT OR REPLACE INTO fixtures 
-                (match_id, matchday, date, time, home_team, away_team, 
-                 home_team_id, away_team_id, status, venue, 
-                 home_score, away_score, season, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        updated_at = datetime.now().isoformat()
+        conn = connect(self.db_path)
+        with conn:
+            conn.executemany(
+                f"""
+                INSERT OR REPLACE INTO fixtures ({", ".join(ROW_COLUMNS)})
+                VALUES ({", ".join("?" * len(ROW_COLUMNS))})
             """,
-                (
-                    fixture.get("id"),
-                    fixture.get("matchday"),
-                    date_part,
-                    time_part,
-                    home_team.get("name"),
-                    away_team.get("name"),
-                    home_team.get("id"),
-                    away_team.get("id"),
-                    fixture.get("status"),
-                    fixture.get("venue"),
-                    score.get("home") if score else None,
-                    score.get("away") if score else None,
-                    "2025-26",
-                    datetime.now().isoformat(),
-                ),
+                [fixture_row(fixture, updated_at) for fixture in fixtures],
             )
-
-        conn.commit()
         conn.close()
         print(f"Inserted {len(fixtures)} fixtures into database")
 
-    def update_fixtures_with_results(self) -> None:
-        """Update existing fixtures with latest data including results"""
+    def load_snapshot(self, conn: sqlite3.Connection) -> Dict[int, tuple]:
+        """Current DIFF_COLUMNS of every stored fixture, keyed by match_id"""
+        rows = conn.execute(
+            f"SELECT match_id, {', '.join(DIFF_COLUMNS)} FROM fixtures"
+        ).fetchall()
+        return {row[0]: row[1:] for row in rows}
+
+    def incremental_window(self, snapshot: Dict[int, tuple]) -> tuple:
+        """(dateFrom, dateTo) covering every fixture that can still change
+
+        Starts INCREMENTAL_LOOKBACK_DAYS back, or earlier if a stored fixture
+        dated before then is not final yet (e.g. missed runs or a postponement).
+        """
+        today = datetime.now(timezone.utc).date()
+        date_from = (today - timedelta(days=INCREMENTAL_LOOKBACK_DAYS)).isoformat()
+        date_to = (today + timedelta(days=INCREMENTAL_LOOKAHEAD_DAYS)).isoformat()
+
+        status_index = DIFF_COLUMNS.index("status")
+        date_index = DIFF_COLUMNS.index("date")
+        stale = [
+            row[date_index]
+            for row in snapshot.values()
+            if row[status_index] not in FINAL_STATUSES
+            and row[date_index]
+            and row[date_index] < date_from
+        ]
+        if stale:
+            date_from = min(stale)
+        return date_from, date_to
+
+    def update_fixtures_with_results(
+        self, incremental: bool = False
+    ) -> Optional[FixtureChanges]:
+        """Update existing fixtures with latest data including results
+
+        Stored fixtures are loaded in one query and diffed in memory, and all
+        changes are written in one transaction. With incremental=True only
+        the window returned by incremental_window() is fetched from the API.
+        Returns the change set, or None if no data could be fetched.
+        """
         print("Updating fixtures with latest data and results...")
 
+        conn = connect(self.db_path)
+        snapshot = self.load_snapshot(conn)
+
         # Get latest fixture data from API
-        fixtures = self.get_premier_league_fixtures()
-        if not fixtures:
+        if incremental and snapshot:
+            date_from, date_to = self.incremental_window(snapshot)
+            fixtures = self.get_premier_league_fixtures(date_from, date_to)
+        else:
+            fixtures = self.get_premier_league_fixtures()
+        if fixtures is None:
             print("No fixture data retrieved, skipping updates")
-            return
-
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+            conn.close()
+            return None
 
-        updated_count = 0
-        new_count = 0
+        updated_at = datetime.now().isoformat()
+        diff_indexes = [ROW_COLUMNS.index(column) for column in DIFF_COLUMNS]
+        new_rows = []
+        updated_rows = []
+        changes = FixtureChanges(added=[], updated=[], finished=[])
 
         for fixture in fixtures:
-            match_id = fixture.get("id")
-
-            # Check if fixture exists in database
-            cursor.execute(
-                "SELECT match_id, home_score, away_score, status, date, time FROM fixtures WHERE match_id = ?",
-                (match_id,),
-            )
-            existing = cursor.fetchone()
-
-            # Parse new data
-            utc_date = fixture.get("utcDate", "")
-            date_part = utc_date.split("T")[0] if utc_date else ""
-            time_part = (
-                utc_date.split("T")[1].replace("Z", "") if "T" in utc_date else ""
-            )
-
-            home_team = fixture.get("homeTeam", {})
-            away_team = fixture.get("awayTeam", {})
-            score = fixture.get("score", {}).get("fullTime", {})
-            new_home_score = score.get("home") if score else None
-            new_away_score = score.get("away") if score else None
-            new_status = fixture.get("status")
-
-            if existing:
-                # Check if anything has changed
-                (
-                    old_match_id,
-                    old_home_score,
-                    old_away_score,
-                    old_status,
-                    old_date,
-                    old_time,
-                ) = existing
-
-                changes_detected = (
-                    old_home_score != new_home_score
-                    or old_away_score != new_away_score
-                    or old_status != new_status
-                    or old_date != date_part
-                    or old_time != time_part
+            row = fixture_row(fixture, updated_at)
+            match_id = row[0]
+            new = tuple(row[i] for i in diff_indexes)
+            old = snapshot.get(match_id)
+            home_team, away_team = row[4], row[5]
+
+            if old is None:
+                new_rows.append(row)
+                changes.added.append(match_id)
+                if fixture.get("status") == "FINISHED":
+                    changes.finished.append(match_id)
+                print(f"  Added new fixture: {home_team} vs {away_team}")
+                continue
+
+            if old == new:
+                continue
+
+            # UPDATE parameters: every column but match_id and season, then match_id
+            updated_rows.append(row[1:12] + row[13:] + (match_id,))
+            changes.updated.append(match_id)
+
+            old_values = dict(zip(DIFF_COLUMNS, old))
+            new_values = dict(zip(DIFF_COLUMNS, new))
+            if new_values["status"] == "FINISHED" and (
+                old_values["status"] != "FINISHED"
+                or old_values["home_score"] != new_values["home_score"]
+                or old_values["away_score"] != new_values["away_score"]
+            ):
+                changes.finished.append(match_id)
+
+            # Log what changed
+            logged = []
+            if (
+                old_values["home_score"] != new_values["home_score"]
+                or old_values["away_score"] != new_values["away_score"]
+            ):
+                old_score, new_score = (
+                    f"{values['home_score'] or '-'}-{values['away_score'] or '-'}"
+                    for values in (old_values, new_values)
                 )
-
-                if changes_detected:
-                    # Update the existing fixture
-                    cursor.execute(
-                        """
-                        UPDATE fixtures SET 
-                            matchday = ?, date = ?, time = ?, home_team = ?, away_team = ?,
-                            home_team_id = ?, away_team_id = ?, status = ?, venue = ?,
-                            home_score = ?, away_score = ?, updated_at = ?
-                        WHERE match_id = ?
-                        """,
-                        (
-                            fixture.get("matchday"),
-                            date_part,
-                            time_part,
-                            home_team.get("name"),
-                            away_team.get("name"),
-                            home_team.get("id"),
-                            away_team.get("id"),
-                            new_status,
-                            fixture.get("venue"),
-                            new_home_score,
-                            new_away_score,
-                            datetime.now().isoformat(),
-                            match_id,
-                        ),
-                    )
-                    updated_count += 1
-
-                    # Log what changed
-                    changes = []
-                    if (
-                        old_home_score != new_home_score
-                        or old_away_score != new_away_score
-                    ):
-                        old_score = f"{old_home_score or '-'}-{old_away_score or '-'}"
-                        new_score = f"{new_home_score or '-'}-{new_away_score or '-'}"
-                        changes.append(f"score: {old_score} -> {new_score}")
-                    if old_status != new_status:
-                        changes.append(f"status: {old_status} -> {new_status}")
-                    if old_date != date_part:
-                        changes.append(f"date: {old_date} -> {date_part}")
-                    if old_time != time_part:
-                        changes.append(f"time: {old_time} -> {time_part}")
-
-                    print(
-                        f"  Updated {home_team.get('name')} vs {away_team.get('name')}: {', '.join(changes)}"
+                logged.append(f"score: {old_score} -> {new_score}")
+            for column in ("status", "date", "time"):
+                if old_values[column] != new_values[column]:
+                    logged.append(
+                        f"{column}: {old_values[column]} -> {new_values[column]}"
                     )
-            else:
-                # Insert new fixture
-                cursor.execute(
-                    """
-                    INSERT INTO fixtures 
-                    (match_id, matchday, date, time, home_team, away_team, 
-                     home_team_id, away_team_id, status, venue, 
-                     home_score, away_score, season, updated_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        match_id,
-                        fixture.get("matchday"),
-                        date_part,
-                        time_part,
-                        home_team.get("name"),
-                        away_team.get("name"),
-                        home_team.get("id"),
-                        away_team.get("id"),
-                        new_status,
-                        fixture.get("venue"),
-                        new_home_score,
-                        new_away_score,
-                        "2025-26",
-                        datetime.now().isoformat(),
-                    ),
-                )
-                new_count += 1
-                print(
-                    f"  Added new fixture: {home_team.get('name')} vs {away_team.get('name')}"
-                )
 
-        conn.commit()
+            print(f"  Updated {home_team} vs {away_team}: {', '.join(logged)}")
+
+        with conn:
+            conn.executemany(
+                f"""
+                INSERT INTO fixtures ({", ".join(ROW_COLUMNS)})
+                VALUES ({", ".join("?" * len(ROW_COLUMNS))})
+                """,
+                new_rows,
+            )
+            conn.executemany(
+                """
+                UPDATE fixtures SET
+                    matchday = ?, date = ?, time = ?, home_team = ?, away_team = ?,
+                    home_team_id = ?, away_team_id = ?, status = ?, venue = ?,
+                    home_score = ?, away_score = ?, updated_at = ?
+                WHERE match_id = ?
+                """,
+                updated_rows,
+            )
         conn.close()
 
         print(
-            f"Update complete: {updated_count} fixtures updated, {new_count} new fixtures added"
+            f"Update complete: {len(changes.updated)} fixtures updated, "
+            f"{len(changes.added)} new fixtures added, "
+            f"{len(changes.finished)} newly finished"
         )
+        return changes
 
-    def run(self, update_only: bool = False) -> None:
-        """Main execution method"""
+    def run(
+        self, update_only: bool = False, incremental: bool = False
+    ) -> Optional[FixtureChanges]:
+        """Main execution method; returns the change set when updating"""
         if update_only:
             print("Updating Premier League 2025-26 fixtures with latest results...")
-            self.update_fixtures_with_results()
+            # Bring an existing database up to the current schema first
+            self.create_database()
+            return self.update_fixtures_with_results(incremental)
         else:
             print("Creating Premier League 2025-26 fixtures database...")
 
@@ -377,10 +433,11 @@ class PremierLeagueFixtures:
 
             # Display sample query
             self.show_sample_queries()
+            return None
 
     def show_sample_queries(self) -> None:
         """Show sample queries to demonstrate the database"""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect(self.db_path)
         cursor = conn.cursor()
 
         print("\n--- Sample Queries ---")
@@ -427,8 +484,25 @@ if __name__ == "__main__":
         help="Path to the database file (default: premier_league_2025_26.db)",
     )
 
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="With --update, only fetch recent and upcoming matches",
+    )
+    parser.add_argument(
+        "--changes-file",
+        help="With --update, write the change set as JSON for book.py --changes-file",
+    )
+
     args = parser.parse_args()
 
     # Create the fixtures database manager
     fixtures_db = PremierLeagueFixtures(args.db_path)
-    fixtures_db.run(update_only=args.update)
+    changes = fixtures_db.run(update_only=args.update, incremental=args.incremental)
+
+    if args.update and args.changes_file:
+        # Always overwrite, so settlement never acts on a previous run's file
+        if changes is None:
+            changes = FixtureChanges(added=[], updated=[], finished=[])
+        with open(args.changes_file, "w") as f:
+            f.write(changes.to_json())
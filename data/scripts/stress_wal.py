@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Concurrent read/write stress test for the odds database
+
+Runs one collector-style writer process and several reader processes
+against the same odds database, all opened through db.connect(). The writer
+stores a full sweep of stub market books per transaction; the readers issue
+the web server's latest-odds and odds-history queries. Reports writer
+throughput, reader latency percentiles and any "database is locked" errors.
+
+Usage:
+    python stress_wal.py
+    python stress_wal.py --readers 8 --duration 30 --matches 10
+"""
+
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import statistics
+import multiprocessing
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import checkpoint, connect
+from betfair_stub_server import StubBetfair, init_stub_databases
+from betfair_odds_collector import OddsDatabase, store_match_odds
+
+# The queries behind /api/fixtures/matchday/:matchday and /api/odds/history
+LATEST_ODDS_QUERY = """
+    SELECT o.runner_type, o.best_back_price, o.request_time
+    FROM matches m
+    JOIN latest_odds o ON m.id = o.match_id
+    WHERE m.home_team = ? AND m.away_team = ?
+    ORDER BY o.runner_type
+"""
+ODDS_HISTORY_QUERY = """
+    SELECT o.runner_type, o.best_back_price, o.best_lay_price, o.last_price_traded,
+        o.total_matched, o.request_time
+    FROM matches m
+    JOIN odds o ON m.id = o.match_id
+    WHERE m.home_team = ? AND m.away_team = ?
+    ORDER BY o.request_time ASC, o.runner_type
+"""
+
+
+def writer(directory: str, num_matches: int, stop_at: float, results):
+    stub = StubBetfair(num_matches)
+    events = {e["event"]["id"]: e for e in stub.list_events({})}
+    catalogue = stub.list_market_catalogue({})
+    market_ids = [m["marketId"] for m in catalogue]
+
+    db = OddsDatabase(
+        os.path.join(directory, "premier_league_odds.db"),
+        fixtures_db_path=os.path.join(directory, "premier_league_2025_26.db"),
+    )
+    sweeps = rows = busy = 0
+    with db:
+        while time.time() < stop_at:
+            books = {
+                b["marketId"]: b
+                for b in stub.list_market_book({"marketIds": market_ids})
+            }
+            request_time = datetime.now().isoformat()
+            try:
+                with db.session():
+                    for market_info in catalogue:
+                        store_match_odds(
+                            db,
+                            events[market_info["event"]["id"]],
+                            {
+                                "market_info": market_info,
+                                "market_book": books[market_info["marketId"]],
+                            },
+                            request_time,
+                        )
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e):
+                    raise
+                busy += 1
+                continue
+            sweeps += 1
+            rows += sum(len(b["runners"]) for b in books.values())
+        wal_pages = checkpoint(db.conn)[1]
+
+    results.put(("writer", sweeps, rows, busy, wal_pages))
+
+
+def reader(directory: str, num_matches: int, stop_at: float, seed: int, results):
+    rng = random.Random(seed)
+    teams = [(m["home_team"], m["away_team"]) for m in StubBetfair(num_matches).matches]
+    conn = connect(os.path.join(directory, "premier_league_odds.db"), readonly=True)
+    latencies = []
+    busy = 0
+    while time.time() < stop_at:
+        query = LATEST_ODDS_QUERY if rng.random() < 0.8 else ODDS_HISTORY_QUERY
+        start = time.perf_counter()
+        try:
+            conn.execute(query, rng.choice(teams)).fetchall()
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            busy += 1
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+    conn.close()
+    results.put(("reader", latencies, busy))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Odds database WAL stress test")
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run")
+    parser.add_argument("--matches", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        init_stub_databases(tmp, args.matches)
+
+        results = multiprocessing.Queue()
+        stop_at = time.time() + args.duration
+        processes = [
+            multiprocessing.Process(
+                target=writer, args=(tmp, args.matches, stop_at, results)
+            )
+        ] + [
+            multiprocessing.Process(
+                target=reader, args=(tmp, args.matches, stop_at, seed, results)
+            )
+            for seed in range(args.readers)
+        ]
+        for p in processes:
+            p.start()
+        outcomes = [results.get() for _ in processes]
+        for p in processes:
+            p.join()
+
+    latencies = []
+    reader_busy = 0
+    for outcome in outcomes:
+        if outcome[0] == "writer":
+            _, sweeps, rows, writer_busy, wal_pages = outcome
+        else:
+            latencies.extend(outcome[1])
+            reader_busy += outcome[2]
+    latencies.sort()
+
+    print(
+        f"Writer: {sweeps / args.duration:,.1f} sweeps/s, "
+        f"{rows / args.duration:,.0f} odds rows/s"
+    )
+    print(f"  busy errors: {writer_busy}, WAL pages at exit: {wal_pages}")
+    if latencies:
+        print(
+            f"Readers ({args.readers}): "
+            f"{len(latencies) / args.duration:,.0f} queries/s, "
+            f"p50 {statistics.median(latencies):.2f} ms, "
+            f"p99 {latencies[int(len(latencies) * 0.99) - 1]:.2f} ms, "
+            f"max {latencies[-1]:.2f} ms"
+        )
+    print(f"  busy errors: {reader_busy}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""StreamCollector handling of market status changes"""
+
+import os
+import sys
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import betfair_stream
+from betfair_stream import StreamCollector
+
+MARKET_ID = "1.100"
+SELECTION_ID = 11
+
+
+class FakeDatabase:
+    @contextmanager
+    def session(self):
+        yield
+
+
+def definition(status: str = "OPEN", inplay: bool = False) -> dict:
+    return {
+        "status": status,
+        "inPlay": inplay,
+        "runners": [{"id": SELECTION_ID, "status": "ACTIVE"}],
+    }
+
+
+def mcm(definition: dict = None, price: float = None) -> dict:
+    mc = {"id": MARKET_ID}
+    if definition is not None:
+        mc["marketDefinition"] = definition
+    if price is not None:
+        mc["rc"] = [{"id": SELECTION_ID, "batb": [[0, price, 100.0]], "ltp": price}]
+    return {"op": "mcm", "mc": [mc]}
+
+
+def make_collector(monkeypatch):
+    """A collector for one market, and the (status, best back) of each book stored"""
+    stored = []
+
+    def store_match_odds(db, match, odds_data, request_time):
+        book = odds_data["market_book"]
+        best_back = book["runners"][0]["ex"]["availableToBack"][0]["price"]
+        stored.append((book["status"], best_back))
+
+    monkeypatch.setattr(betfair_stream, "store_match_odds", store_match_odds)
+    match = {"event": {"id": "1", "name": "Home v Away"}}
+    collector = StreamCollector(
+        client=None,
+        db=FakeDatabase(),
+        connection=None,
+        markets={MARKET_ID: (match, {"marketId": MARKET_ID})},
+    )
+    return collector, stored
+
+
+def test_suspended_market_is_kept_and_stored_once_reopened(monkeypatch):
+    collector, stored = make_collector(monkeypatch)
+
+    collector.handle({**mcm(definition(), price=2.0), "ct": "SUB_IMAGE"})
+    collector.flush()
+    assert stored == [("OPEN", 2.0)]
+
+    # Changes made just before the suspension are stored before it applies
+    collector.handle(mcm(price=2.1))
+    assert not collector.handle(mcm(definition("SUSPENDED")))
+    assert stored == [("OPEN", 2.0), ("OPEN", 2.1)]
+
+    collector.handle(mcm(price=2.5))
+    assert collector.flush() == 0
+    assert MARKET_ID in collector.markets
+
+    collector.handle(mcm(definition("OPEN"), price=2.4))
+    collector.flush()
+    assert stored[-1] == ("OPEN", 2.4)
+    assert MARKET_ID in collector.markets
+
+
+def test_market_is_dropped_without_storing_once_in_play(monkeypatch):
+    collector, stored = make_collector(monkeypatch)
+
+    collector.handle({**mcm(definition(), price=2.0), "ct": "SUB_IMAGE"})
+    assert collector.handle(mcm(definition(inplay=True)))
+    assert stored == [("OPEN", 2.0)]
+
+    collector.flush()
+    assert stored == [("OPEN", 2.0)]
+    assert MARKET_ID not in collector.markets
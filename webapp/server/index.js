@@ -22,6 +22,9 @@ const db = new sqlite3.Database(dbPath);
 const oddsDb = new sqlite3.Database(oddsDbPath);
 const betsDb = new sqlite3.Database(betsDbPath);
 
+// Wait on locks held by the odds collector or settlement instead of failing with SQLITE_BUSY
+[db, oddsDb, betsDb].forEach(conn => conn.configure('busyTimeout', 5000));
+
 // Team name mapping function to convert from fixtures DB names to odds DB names
 const mapTeamName = (fixtureTeamName) => {
   const teamMappings = {
@@ -103,13 +106,8 @@ app.get('/api/fixtures/matchday/:matchday', (req, res) => {
           o.best_back_price,
           o.request_time
         FROM matches m
-        JOIN odds o ON m.id = o.match_id
+        JOIN latest_odds o ON m.id = o.match_id
         WHERE m.home_team = ? AND m.away_team = ?
-        AND o.request_time = (
-          SELECT MAX(o2.request_time) 
-          FROM odds o2 
-          WHERE o2.match_id = o.match_id
-        )
         ORDER BY o.runner_type
       `;
       
@@ -203,13 +201,8 @@ app.get('/api/fixture/:matchId', (req, res) => {
         o.best_back_price,
         o.request_time
       FROM matches m
-      JOIN odds o ON m.id = o.match_id
+      JOIN latest_odds o ON m.id = o.match_id
       WHERE m.home_team = ? AND m.away_team = ?
-      AND o.request_time = (
-        SELECT MAX(o2.request_time) 
-        FROM odds o2 
-        WHERE o2.match_id = o.match_id
-      )
       ORDER BY o.runner_type
     `;
     
@@ -345,6 +338,31 @@ app.get('/api/bettors', (req, res) => {
   });
 });
 
+// Get a bettor's balance and open exposure from the ledger
+app.get('/api/bettors/:bettorId/ledger', (req, res) => {
+  const bettorId = parseInt(req.params.bettorId);
+
+  const query = `
+    SELECT balance, exposure
+    FROM bettor_balances
+    WHERE bettor_id = ?
+  `;
+
+  betsDb.get(query, [bettorId], (err, row) => {
+    if (err) {
+      console.error('Database error:', err);
+      res.status(500).json({ error: 'Database error' });
+      return;
+    }
+
+    res.json({
+      bettor_id: bettorId,
+      balance: row ? row.balance : 0,
+      exposure: row ? row.exposure : 0
+    });
+  });
+});
+
 // Get all available bet statuses
 app.get('/api/bet-statuses', (req, res) => {
   const query = `
@@ -482,9 +500,12 @@ app.get('/api/fixture/:matchId/odds-history', (req, res) => {
     const mappedHomeName = mapTeamName(fixture.home_team);
     const mappedAwayName = mapTeamName(fixture.away_team);
     
+    // Odds rows may only be stored when a runner's quote changes, so replay
+    // them over every collection session the match was seen in
     const oddsHistoryQuery = `
       SELECT 
         o.runner_type,
+        o.status,
         o.best_back_price,
         o.best_lay_price,
         o.last_price_traded,
@@ -496,6 +517,14 @@ app.get('/api/fixture/:matchId/odds-history', (req, res) => {
       ORDER BY o.request_time ASC, o.runner_type
     `;
     
+    const coverageQuery = `
+      SELECT DISTINCT c.request_time
+      FROM matches m
+      JOIN odds_coverage c ON m.id = c.match_id
+      WHERE m.home_team = ? AND m.away_team = ?
+      ORDER BY c.request_time ASC
+    `;
+    
     oddsDb.all(oddsHistoryQuery, [mappedHomeName, mappedAwayName], (oddsErr, oddsRows) => {
       if (oddsErr) {
         console.error('Odds database error:', oddsErr);
@@ -503,39 +532,65 @@ app.get('/api/fixture/:matchId/odds-history', (req, res) => {
         return;
       }
       
-      // Group odds by timestamp and runner type
-      const historyByTime = {};
-      
-      oddsRows.forEach(row => {
-        if (!historyByTime[row.request_time]) {
-          historyByTime[row.request_time] = {};
+      oddsDb.all(coverageQuery, [mappedHomeName, mappedAwayName], (coverageErr, coverageRows) => {
+        if (coverageErr) {
+          console.error('Odds database error:', coverageErr);
+          res.status(500).json({ error: 'Odds database error' });
+          return;
         }
+      
+        const timestamps = [...new Set([
+          ...coverageRows.map(row => row.request_time),
+          ...oddsRows.map(row => row.request_time)
+        ])].sort();
+      
+        // Group odds by timestamp and runner type. A runner's last stored
+        // quote is carried forward only to sessions odds_coverage shows were
+        // collected, where no row means the quote didn't change, and only
+        // while the runner is ACTIVE; anything else is null
+        const covered = new Set(coverageRows.map(row => row.request_time));
+        const empty = { home_win: null, away_win: null, draw: null };
+        const historyByTime = {};
+        const current = { ...empty };
+        let next = 0;
+      
+        timestamps.forEach(timestamp => {
+          const stored = { ...empty };
+          while (next < oddsRows.length && oddsRows[next].request_time <= timestamp) {
+            const row = oddsRows[next];
+            const runnerKey = row.runner_type === 'Home win' ? 'home_win' :
+                             row.runner_type === 'Away win' ? 'away_win' :
+                             'draw';
+          
+            current[runnerKey] = row.status === 'ACTIVE' ? {
+              back_price: row.best_back_price,
+              lay_price: row.best_lay_price,
+              last_traded: row.last_price_traded,
+              total_matched: row.total_matched
+            } : null;
+            if (row.request_time === timestamp) {
+              stored[runnerKey] = current[runnerKey];
+            }
+            next++;
+          }
         
-        const runnerKey = row.runner_type === 'Home win' ? 'home_win' :
-                         row.runner_type === 'Away win' ? 'away_win' :
-                         'draw';
-        
-        historyByTime[row.request_time][runnerKey] = {
-          back_price: row.best_back_price,
-          lay_price: row.best_lay_price,
-          last_traded: row.last_price_traded,
-          total_matched: row.total_matched
-        };
-      });
+          historyByTime[timestamp] = covered.has(timestamp) ? { ...current } : stored;
+        });
       
-      // Convert to array format sorted by time
-      const history = Object.entries(historyByTime)
-        .map(([timestamp, odds]) => ({
-          timestamp,
-          odds
-        }))
-        .sort((a, b) => new Date(a.timestamp) - new Date(b.timestamp));
+        // Convert to array format sorted by time
+        const history = Object.entries(historyByTime)
+          .map(([timestamp, odds]) => ({
+            timestamp,
+            odds
+          }))
+          .sort((a, b) => new Date(a.timestamp) - new Date(b.timestamp));
       
-      res.json({
-        match_id: matchId,
-        home_team: fixture.home_team,
-        away_team: fixture.away_team,
-        history
+        res.json({
+          match_id: matchId,
+          home_team: fixture.home_team,
+          away_team: fixture.away_team,
+          history
+        });
       });
     });
   });